@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+benchmarks/bench_agp2assembly.py
+
+Times agp2assembly.convert_agp on synthetic AGP files of increasing size,
+with one unplaced scaffold per contig. Conversion is linear in the number
+of AGP lines, so the time per line should stay roughly constant across
+sizes.
+
+Run from the repository root with:
+    python -m benchmarks.bench_agp2assembly [sizes ...]
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from juicebox_scripts.agp2assembly import convert_agp
+from benchmarks.synthetic import write_agp
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000]
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print('lines\tseconds\tus_per_line')
+        for size in sizes:
+            path = os.path.join(tmp_dir, 'synthetic_{0}.agp'.format(size))
+            write_agp(path, size)
+            start = time.time()
+            convert_agp(path, os.path.join(tmp_dir, 'synthetic_{0}.assembly'.format(size)))
+            elapsed = time.time() - start
+            print('{0}\t{1:.3f}\t{2:.2f}'.format(size, elapsed, 1e6 * elapsed / size))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+benchmarks/bench_read_assembly.py
+
+Times JuiceboxConverter._read_assembly on synthetic .assembly files of
+increasing size. Parsing is linear in the number of fragments, so the
+time per fragment should stay roughly constant across sizes.
+
+Run from the repository root with:
+    python -m benchmarks.bench_read_assembly [sizes ...]
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from juicebox_scripts.juicebox_assembly_converter import JuiceboxConverter
+from benchmarks.synthetic import write_assembly
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000]
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print('fragments\tseconds\tus_per_fragment')
+        for size in sizes:
+            path = os.path.join(tmp_dir, 'synthetic_{0}.assembly'.format(size))
+            write_assembly(path, size)
+            start = time.time()
+            JuiceboxConverter()._read_assembly(path)
+            elapsed = time.time() - start
+            print('{0}\t{1:.3f}\t{2:.2f}'.format(size, elapsed, 1e6 * elapsed / size))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+benchmarks/bench_suite.py
+
+Times and memory-profiles each stage of the converter, purger and AGP
+tools on synthetic FASTA and .assembly pairs of increasing size, and
+writes the results as JSON, so runs can be compared across commits with
+benchmarks/compare.py. Each stage is run --repeat times and the fastest
+run is kept. Peak memory is measured with tracemalloc in a separate run
+of each stage, as tracing slows the timed runs down; it counts Python
+allocations only, so memory-mapped files are not included.
+
+Run from the repository root with:
+    python -m benchmarks.bench_suite -o results.json [--contigs 1000 10000 ...]
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from juicebox_scripts.agp2assembly import convert_agp
+from juicebox_scripts.juicebox_assembly_converter import JuiceboxConverter
+from juicebox_scripts.juicebox_assembly_purger import filter_assembly
+from juicebox_scripts.makeAgpFromFasta import getContigLengths
+from benchmarks.synthetic import write_genome
+
+# version of the results file layout
+RESULTS_VERSION = 1
+
+_wall_clock = getattr(time, 'perf_counter', time.time)
+_cpu_clock = getattr(time, 'process_time', getattr(time, 'clock', time.time))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the juicebox_scripts tools on synthetic inputs')
+    parser.add_argument('-o', '--output', default=None,
+                        help='path to write JSON results to. Default: print them only')
+    parser.add_argument('--contigs', type=int, nargs='+', default=[1000, 10000],
+                        help='contig counts of the synthetic genomes. Default: %(default)s')
+    parser.add_argument('--min_length', type=int, default=1000,
+                        help='shortest contig length. Default: %(default)s')
+    parser.add_argument('--max_length', type=int, default=100000,
+                        help='longest contig length. Default: %(default)s')
+    parser.add_argument('--distribution', choices=['uniform', 'lognormal'], default='lognormal',
+                        help='contig length distribution. Default: %(default)s')
+    parser.add_argument('--broken', type=float, default=0.1,
+                        help='fraction of contigs broken into fragments. Default: %(default)s')
+    parser.add_argument('--inverted', type=float, default=0.5,
+                        help='fraction of placements on the - strand. Default: %(default)s')
+    parser.add_argument('--debris', type=float, default=0.01,
+                        help='fraction of contigs trashed as debris. Default: %(default)s')
+    parser.add_argument('--contigs_per_scaffold', type=int, default=50,
+                        help='contigs placed on each scaffold. Default: %(default)s')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timed runs of each stage; the fastest is kept. Default: %(default)s')
+    parser.add_argument('--no_memory', action='store_true', default=False,
+                        help='skip the tracemalloc run of each stage')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the synthetic genomes. Default: %(default)s')
+    parser.add_argument('--tmp_dir', default=None,
+                        help='directory for the synthetic inputs and outputs. Default: a new '
+                             'temporary directory, removed afterwards')
+    return parser.parse_args()
+
+
+def git_commit():
+    '''Return the commit the repository is at, or None outside a git
+    checkout'''
+    try:
+        with open(os.devnull, 'w') as devnull:
+            commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=devnull,
+                                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return commit.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def stages(fasta, assembly, out_dir):
+    '''Build the stages to benchmark against one synthetic genome, in the
+    order they must run; later stages use the results of earlier ones.
+
+    Args:
+        fasta (str): path to the synthetic FASTA
+        assembly (str): path to the synthetic .assembly
+        out_dir (str): directory to write outputs to
+
+    Returns:
+        list[(str, callable)]: the name and function of each stage
+    '''
+    converter = JuiceboxConverter()
+    prefix = os.path.join(out_dir, 'out')
+    state = dict()
+
+    def read_fasta():
+        state['sequences'] = converter._read_fasta(fasta)
+
+    def remove_fai():
+        # builds of the .fai are what is being timed, so none may be reused
+        if os.path.exists(fasta + '.fai'):
+            os.remove(fasta + '.fai')
+
+    def index_fasta():
+        remove_fai()
+        converter._index_fasta(fasta)
+
+    def read_assembly():
+        state['assembly_map'], state['scaffolds'] = converter._read_assembly(assembly)
+
+    def add_breaks():
+        state['sequences'] = converter._add_breaks(state['sequences'], state['assembly_map'])
+        state['scaffolds'] = converter._update_scaffold_names(state['scaffolds'])
+
+    def process():
+        state['processed'] = converter.process(fasta, assembly)
+
+    def fasta_lines():
+        state['processed'].fasta()
+
+    def write_outputs():
+        state['processed'].write_outputs(fasta=prefix + '.fasta', agp=prefix + '.agp', bed=prefix + '.bed',
+                                         break_report=prefix + '.break_report.txt')
+
+    def purge():
+        filter_assembly(set(), assembly, prefix + '.purged.assembly', exclude_regex=[r':::debris$'],
+                        min_length=5000)
+
+    def agp2assembly():
+        convert_agp(prefix + '.agp', prefix + '.agp.assembly')
+
+    def make_agp_lengths():
+        remove_fai()
+        getContigLengths(fasta)
+
+    return [('converter.read_fasta', read_fasta),
+            ('converter.index_fasta', index_fasta),
+            ('converter.read_assembly', read_assembly),
+            ('converter.add_breaks', add_breaks),
+            ('converter.process', process),
+            ('converter.fasta', fasta_lines),
+            ('converter.write_outputs', write_outputs),
+            ('purger.filter_assembly', purge),
+            ('agp2assembly.convert_agp', agp2assembly),
+            ('makeAgpFromFasta.contig_lengths', make_agp_lengths)]
+
+
+def measure(function, trace_memory=False):
+    '''Run a stage once with its stdout discarded, measuring it
+
+    Args:
+        function (callable): the stage
+        trace_memory (bool) [optional]: trace the peak memory allocated
+            by the stage with tracemalloc instead of timing it.
+            Default: False
+
+    Returns:
+        dict: wall_seconds and cpu_seconds, or peak_bytes when tracing
+    '''
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            if trace_memory:
+                tracemalloc.start()
+                try:
+                    function()
+                    return {'peak_bytes': tracemalloc.get_traced_memory()[1]}
+                finally:
+                    tracemalloc.stop()
+            wall, cpu = _wall_clock(), _cpu_clock()
+            function()
+            return {'wall_seconds': _wall_clock() - wall, 'cpu_seconds': _cpu_clock() - cpu}
+        finally:
+            sys.stdout = stdout
+
+
+def run_suite(args, tmp_dir):
+    '''Run every stage against a synthetic genome of each size
+
+    Returns:
+        list[dict]: one result per stage and size
+    '''
+    results = list()
+    for num_contigs in args.contigs:
+        genome_dir = os.path.join(tmp_dir, 'contigs_{0}'.format(num_contigs))
+        if not os.path.isdir(genome_dir):
+            os.makedirs(genome_dir)
+        fasta = os.path.join(genome_dir, 'genome.fasta')
+        assembly = os.path.join(genome_dir, 'genome.assembly')
+        bases = write_genome(fasta, assembly, num_contigs, min_length=args.min_length, max_length=args.max_length,
+                             distribution=args.distribution, broken_fraction=args.broken,
+                             inverted_fraction=args.inverted, debris_fraction=args.debris,
+                             contigs_per_scaffold=args.contigs_per_scaffold, seed=args.seed)
+        timings = dict()
+        for _ in range(args.repeat):
+            for name, function in stages(fasta, assembly, genome_dir):
+                timing = measure(function)
+                if name not in timings or timing['wall_seconds'] < timings[name]['wall_seconds']:
+                    timings[name] = timing
+        if tracemalloc is not None and not args.no_memory:
+            for name, function in stages(fasta, assembly, genome_dir):
+                timings[name].update(measure(function, trace_memory=True))
+        for name, _ in stages(fasta, assembly, genome_dir):
+            result = {'stage': name, 'contigs': num_contigs, 'bases': bases}
+            result.update(timings[name])
+            result['mb_per_second'] = bases / 1e6 / result['wall_seconds'] if result['wall_seconds'] else None
+            results.append(result)
+            print('{0}\t{1}\t{2:.3f}\t{3:.3f}\t{4}'.format(name, num_contigs, result['wall_seconds'],
+                                                           result['cpu_seconds'], result.get('peak_bytes', '')))
+            sys.stdout.flush()
+    return results
+
+
+def main():
+    args = parse_args()
+    tmp_dir = args.tmp_dir if args.tmp_dir is not None else tempfile.mkdtemp()
+    try:
+        print('stage\tcontigs\twall_seconds\tcpu_seconds\tpeak_bytes')
+        results = run_suite(args, tmp_dir)
+    finally:
+        if args.tmp_dir is None:
+            shutil.rmtree(tmp_dir)
+    report = {'version': RESULTS_VERSION,
+              'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'commit': git_commit(),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'params': dict((key, value) for key, value in vars(args).items()
+                             if key not in ('output', 'tmp_dir')),
+              'results': results}
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
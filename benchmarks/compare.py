@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+benchmarks/compare.py
+
+Compares two JSON results files written by benchmarks/bench_suite.py,
+e.g. from runs on two commits, printing the wall time and peak memory of
+each stage in both and their ratio. Stages slower by more than the
+threshold are flagged, and the exit status is 1 if any were.
+
+Run from the repository root with:
+    python -m benchmarks.compare old.json new.json [--threshold 1.1]
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compare two benchmark results files')
+    parser.add_argument('old', help='results of the baseline run')
+    parser.add_argument('new', help='results of the run to compare against it')
+    parser.add_argument('--threshold', type=float, default=1.1,
+                        help='flag stages whose wall time grew by more than this factor. Default: %(default)s')
+    return parser.parse_args()
+
+
+def load_results(path):
+    '''Read a results file, keyed by stage and contig count'''
+    with open(path) as f:
+        report = json.load(f)
+    return report, dict(((result['stage'], result['contigs']), result) for result in report['results'])
+
+
+def _ratio(old, new):
+    if old is None or new is None or old == 0:
+        return None
+    return float(new) / old
+
+
+def _format(value, spec):
+    return '' if value is None else format(value, spec)
+
+
+def main():
+    args = parse_args()
+    old_report, old = load_results(args.old)
+    new_report, new = load_results(args.new)
+    print('# old: {0} ({1})'.format(old_report.get('commit'), old_report.get('created')))
+    print('# new: {0} ({1})'.format(new_report.get('commit'), new_report.get('created')))
+    print('stage\tcontigs\told_seconds\tnew_seconds\ttime_ratio\told_peak_mb\tnew_peak_mb\tmemory_ratio')
+    regressions = 0
+    for key in sorted(set(old) & set(new)):
+        old_seconds, new_seconds = old[key]['wall_seconds'], new[key]['wall_seconds']
+        old_peak, new_peak = old[key].get('peak_bytes'), new[key].get('peak_bytes')
+        time_ratio = _ratio(old_seconds, new_seconds)
+        flag = ''
+        if time_ratio is not None and time_ratio > args.threshold:
+            flag = '\tSLOWER'
+            regressions += 1
+        print('{0}\t{1}\t{2:.3f}\t{3:.3f}\t{4}\t{5}\t{6}\t{7}{8}'.format(
+            key[0], key[1], old_seconds, new_seconds, _format(time_ratio, '.2f'),
+            _format(old_peak / 1e6 if old_peak is not None else None, '.1f'),
+            _format(new_peak / 1e6 if new_peak is not None else None, '.1f'),
+            _format(_ratio(old_peak, new_peak), '.2f'), flag))
+    for key in sorted(set(old) ^ set(new)):
+        print('{0}\t{1}\tonly in {2}'.format(key[0], key[1], 'old' if key in old else 'new'))
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
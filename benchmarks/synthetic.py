@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+benchmarks/synthetic.py
+
+This file contains generators for synthetic inputs of configurable size,
+used to benchmark the scripts in juicebox_scripts/.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+import math
+import random
+
+# length of the random sequence that synthetic contigs are sliced from
+_POOL_LENGTH = 1 << 20
+# length of the sequence lines of synthetic FASTA files
+_LINE_LEN = 80
+
+
+def write_assembly(path, num_fragments, contigs_per_scaffold=50, seed=0):
+    '''Write a synthetic .assembly file
+
+    Args:
+        path (str): path to write the .assembly file to
+        num_fragments (int): number of contigs listed in the file
+        contigs_per_scaffold (int) [optional]: number of contigs placed
+            in each scaffold. Default: 50
+        seed (int) [optional]: seed for the random number generator, so
+            output is reproducible. Default: 0
+    '''
+    rng = random.Random(seed)
+    order = list(range(1, num_fragments + 1))
+    rng.shuffle(order)
+    with open(path, 'w') as f:
+        for index in range(1, num_fragments + 1):
+            f.write('>contig_{0} {0} {1}\n'.format(index, rng.randint(1000, 100000)))
+        for start in range(0, num_fragments, contigs_per_scaffold):
+            scaffold = order[start:start + contigs_per_scaffold]
+            f.write(' '.join(str(index if rng.random() < 0.5 else -index) for index in scaffold) + '\n')
+
+
+def write_agp(path, num_contigs, contigs_per_scaffold=1, gap_length=100, seed=0):
+    '''Write a synthetic AGP file
+
+    Args:
+        path (str): path to write the AGP file to
+        num_contigs (int): number of contig (W) lines in the file
+        contigs_per_scaffold (int) [optional]: number of contigs placed
+            in each scaffold, with a gap line between neighbours. The
+            default of 1 gives one unplaced scaffold per contig, the worst
+            case for scaffold bookkeeping. Default: 1
+        gap_length (int) [optional]: length of each gap. Default: 100
+        seed (int) [optional]: seed for the random number generator, so
+            output is reproducible. Default: 0
+    '''
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('##agp-version 2.1\n')
+        for index in range(num_contigs):
+            position = index % contigs_per_scaffold
+            scaffold = 'scaffold_{0}'.format(index // contigs_per_scaffold + 1)
+            if position == 0:
+                part, end = 0, 0
+            else:
+                part += 1
+                f.write('{0}\t{1}\t{2}\t{3}\tU\t{4}\tscaffold\tyes\tproximity_ligation\n'.format(
+                    scaffold, end + 1, end + gap_length, part, gap_length))
+                end += gap_length
+            length = rng.randint(1000, 100000)
+            part += 1
+            f.write('{0}\t{1}\t{2}\t{3}\tW\tcontig_{4}\t1\t{5}\t{6}\n'.format(
+                scaffold, end + 1, end + length, part, index + 1, length, rng.choice('+-')))
+            end += length
+
+
+def contig_lengths(num_contigs, min_length=1000, max_length=100000, distribution='uniform', seed=0):
+    '''Draw synthetic contig lengths
+
+    Args:
+        num_contigs (int): number of lengths to draw
+        min_length (int) [optional]: shortest contig length. Default: 1000
+        max_length (int) [optional]: longest contig length. Default: 100000
+        distribution (str) [optional]: 'uniform' between min_length and
+            max_length, or 'lognormal', giving many short contigs and a
+            few long ones as real assemblies have, clipped to the same
+            range. Default: 'uniform'
+        seed (int) [optional]: seed for the random number generator, so
+            output is reproducible. Default: 0
+
+    Returns:
+        list[int]: the contig lengths
+    '''
+    rng = random.Random(seed)
+    if distribution == 'uniform':
+        return [rng.randint(min_length, max_length) for _ in range(num_contigs)]
+    if distribution == 'lognormal':
+        # median at the geometric mean of the range, with ~95% of draws
+        # falling inside it before clipping
+        mu = (math.log(min_length) + math.log(max_length)) / 2
+        sigma = (math.log(max_length) - math.log(min_length)) / 4
+        return [min(max_length, max(min_length, int(rng.lognormvariate(mu, sigma)))) for _ in range(num_contigs)]
+    raise ValueError('Unknown contig length distribution {0}'.format(distribution))
+
+
+def write_genome(fasta_path, assembly_path, num_contigs, min_length=1000, max_length=100000,
+                 distribution='uniform', broken_fraction=0.1, inverted_fraction=0.5, debris_fraction=0.01,
+                 contigs_per_scaffold=50, seed=0):
+    '''Write a synthetic FASTA and a .assembly file describing a
+    Juicebox-edited scaffolding of it
+
+    Broken contigs are split into two or three fragments named
+    CONTIG:::fragment_N, and debris contigs are renamed CONTIG:::debris
+    and left on scaffolds of their own at the end, as Juicebox does when
+    contigs are trashed. The remaining fragments and contigs are placed
+    in shuffled order on scaffolds of contigs_per_scaffold.
+
+    Args:
+        fasta_path (str): path to write the FASTA to
+        assembly_path (str): path to write the .assembly file to
+        num_contigs (int): number of contigs in the FASTA
+        min_length, max_length, distribution [optional]: the contig
+            length distribution, as in contig_lengths
+        broken_fraction (float) [optional]: fraction of contigs broken
+            into fragments. Default: 0.1
+        inverted_fraction (float) [optional]: fraction of placements on
+            the - strand. Default: 0.5
+        debris_fraction (float) [optional]: fraction of contigs trashed
+            as debris. Default: 0.01
+        contigs_per_scaffold (int) [optional]: number of contigs and
+            fragments placed in each scaffold. Default: 50
+        seed (int) [optional]: seed for the random number generator, so
+            output is reproducible. Default: 0
+
+    Returns:
+        int: the total length of the FASTA sequences
+    '''
+    rng = random.Random(seed)
+    lengths = contig_lengths(num_contigs, min_length, max_length, distribution, seed)
+    # contigs are slices of one random pool, long enough for any contig,
+    # so generating them costs no more than writing them
+    pool = ''.join(rng.choice('ACGT') for _ in range(_POOL_LENGTH))
+    while len(pool) < 2 * max_length:
+        pool += pool
+    total = 0
+    with open(fasta_path, 'w') as f:
+        for index, length in enumerate(lengths, 1):
+            start = rng.randint(0, len(pool) - length)
+            sequence = pool[start:start + length]
+            f.write('>contig_{0}\n'.format(index))
+            for line_start in range(0, length, _LINE_LEN):
+                f.write(sequence[line_start:line_start + _LINE_LEN] + '\n')
+            total += length
+    entries = list()
+    debris = list()
+    for index, length in enumerate(lengths, 1):
+        name = 'contig_{0}'.format(index)
+        draw = rng.random()
+        if draw < debris_fraction:
+            debris.append((name + ':::debris', length))
+        elif draw < debris_fraction + broken_fraction and length >= 3:
+            cuts = sorted(rng.sample(range(1, length), min(rng.randint(1, 2), length - 1)))
+            bounds = [0] + cuts + [length]
+            for fragment in range(len(bounds) - 1):
+                entries.append(('{0}:::fragment_{1}'.format(name, fragment + 1),
+                                bounds[fragment + 1] - bounds[fragment]))
+        else:
+            entries.append((name, length))
+    with open(assembly_path, 'w') as f:
+        for index, (name, length) in enumerate(entries + debris, 1):
+            f.write('>{0} {1} {2}\n'.format(name, index, length))
+        order = list(range(1, len(entries) + 1))
+        rng.shuffle(order)
+        for start in range(0, len(order), contigs_per_scaffold):
+            scaffold = order[start:start + contigs_per_scaffold]
+            f.write(' '.join(str(-index if rng.random() < inverted_fraction else index)
+                             for index in scaffold) + '\n')
+        for index in range(len(entries) + 1, len(entries) + len(debris) + 1):
+            f.write('{0}\n'.format(index))
+    return total
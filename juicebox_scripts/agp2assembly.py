@@ -1,56 +1,158 @@
 #!/usr/bin/env python
 # converts agp format to assembly format (useful for juicebox)
-# requires exactly 2 inputs, writes to stdout
+# requires exactly 2 inputs, the agp file to read and the assembly file to write
 
 from __future__ import print_function
 
-import sys
-from collections import defaultdict
+import argparse
+from array import array
+from collections import defaultdict, namedtuple, OrderedDict
 
-def printUsage():
-    print("\nagp2assembly.py usage:", end='')
-    print("\tagp2assembly.py <input_agp_file> <output_assembly_file>")
-    return
+try:
+    from juicebox_scripts.fasta_utils import GAP_PREFIX, open_input, open_output
+except ImportError:
+    from fasta_utils import GAP_PREFIX, open_input, open_output
+
+# a single line of an AGP file; name and orientation are None for gaps
+AgpPart = namedtuple('AgpPart', ['object', 'part_type', 'name', 'length', 'orientation'])
+
+ORIENTATIONS = set(["+", "-", "?", "0", "na"])
+
+class InvalidAgpError(ValueError):
+    '''An Error caused when an AGP file has malformed columns or
+    inconsistent coordinates or part numbers.'''
+    pass
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert an AGP file to a Juicebox .assembly file")
+    parser.add_argument("input_agp_file", help="AGP file to convert, optionally gzip compressed")
+    parser.add_argument("output_assembly_file", help="path to write the .assembly file to")
+    parser.add_argument("-g", "--gaps",
+                        action="store_true",
+                        default=False,
+                        help="keep the gaps (N/U lines) of the AGP as {0}<n> entries in the .assembly, one "
+                             "per distinct gap length, instead of dropping them".format(GAP_PREFIX))
+    return parser.parse_args()
+
+def iter_agp(filename):
+    '''Yield an AgpPart for each component and gap line of an AGP file,
+    validating columns, part numbers and coordinates as it goes. Lines of
+    an object must have consecutive part numbers and abut one another.'''
+    # object -> (last part number, last object_end)
+    positions = dict()
+    with open_input(filename) as agp:
+        for line_number, line in enumerate(agp, 1):
+            if line.startswith("#") or len(line.strip()) == 0:
+                continue
+            fields = line.rstrip("\r\n").split("\t")
+            if len(fields) < 8:
+                raise InvalidAgpError("{0} line {1}: expected at least 8 columns".format(filename, line_number))
+            try:
+                object_beg, object_end, part_number = int(fields[1]), int(fields[2]), int(fields[3])
+            except ValueError:
+                raise InvalidAgpError("{0} line {1}: coordinates and part number must be integers".format(
+                    filename, line_number))
+            last_part, last_end = positions.get(fields[0], (0, 0))
+            # makeAgpFromFasta.py has always written 0 as the start of the
+            # first part of an object, so accept it as 1
+            if object_beg == 0 and last_part == 0:
+                object_beg = 1
+            if part_number != last_part + 1:
+                raise InvalidAgpError("{0} line {1}: expected part number {2} for {3}, found {4}".format(
+                    filename, line_number, last_part + 1, fields[0], part_number))
+            if object_beg != last_end + 1 or object_end < object_beg:
+                raise InvalidAgpError("{0} line {1}: coordinates {2}-{3} of {4} do not follow on from {5}".format(
+                    filename, line_number, fields[1], fields[2], fields[0], last_end))
+            positions[fields[0]] = (part_number, object_end)
+            span = object_end - object_beg + 1
+            if fields[4] in ("N", "U"):
+                if fields[5] != str(span):
+                    raise InvalidAgpError("{0} line {1}: gap length {2} does not match coordinates {3}-{4}".format(
+                        filename, line_number, fields[5], fields[1], fields[2]))
+                yield AgpPart(fields[0], fields[4], None, span, None)
+                continue
+            if len(fields) < 9:
+                raise InvalidAgpError("{0} line {1}: expected 9 columns for a component".format(filename, line_number))
+            try:
+                component_beg, component_end = int(fields[6]), int(fields[7])
+            except ValueError:
+                raise InvalidAgpError("{0} line {1}: component coordinates must be integers".format(
+                    filename, line_number))
+            if component_beg < 1 or component_end - component_beg + 1 != span:
+                raise InvalidAgpError("{0} line {1}: component coordinates {2}-{3} do not match object "
+                                      "coordinates {4}-{5}".format(filename, line_number, fields[6], fields[7],
+                                                                   fields[1], fields[2]))
+            if fields[8] not in ORIENTATIONS:
+                raise InvalidAgpError("{0} line {1}: unknown orientation {2}".format(
+                    filename, line_number, fields[8]))
+            yield AgpPart(fields[0], fields[4], fields[5], span, fields[8])
 
 def read_from_agp(filename):
     lines = []
     clusters = defaultdict(list)
     counter = 0
-    order = []
-    with open(filename) as agp:
-        for line in agp:
-            if line.startswith("#"):
-                continue
-            fields = line.strip().split("\t")
-            if fields[4] != "W":
-                continue
-            counter += 1
-            lines.append(">{0} {1} {2}\n".format(fields[5], counter, fields[7]))
-            if fields[8] == "-":
-                this_contig = -1 * counter
-            else:
-                this_contig = counter
-            
-            if fields[0] not in order:
-            	order.append(fields[0])
-            	
-            clusters[fields[0]].append(str(this_contig))
-    return lines, clusters, order
+    order = OrderedDict()
+    for part in iter_agp(filename):
+        if part.part_type != "W":
+            continue
+        counter += 1
+        lines.append(">{0} {1} {2}\n".format(part.name, counter, part.length))
+        order[part.object] = None
+        clusters[part.object].append(str(-counter if part.orientation == "-" else counter))
+    return lines, clusters, list(order)
 
 def write_assembly(lines, clusters, order, outfilename):
-    with open(outfilename, "w") as outfile:
+    with open_output(outfilename) as outfile:
         for line in lines:
             outfile.write(line)
         for cluster in order:
             outfile.write(" ".join(clusters[cluster]) + "\n")
     return 0
 
+def convert_agp(filename, outfilename, gaps=False):
+    '''Convert an AGP file to a .assembly file in a single pass. Contig
+    lines are written as the AGP is read; only the signed contig indices
+    of each scaffold are kept, in insertion order, until the end.
+
+    If gaps is True, gap lines are kept as hic_gap entries, as Juicebox
+    does. One entry is listed per distinct gap length, after all of the
+    contigs, and placed in scaffolds wherever a gap of that length is.
+    '''
+    clusters = OrderedDict()
+    # gap length -> its gap number, in order of first appearance
+    gap_numbers = OrderedDict()
+    counter = 0
+    with open_output(outfilename) as outfile:
+        for part in iter_agp(filename):
+            cluster = clusters.get(part.object)
+            if cluster is None:
+                cluster = clusters[part.object] = array("l")
+            if part.name is None:
+                if gaps:
+                    # a gap is stored as a 0 followed by its gap number,
+                    # as its index is not known until all contigs are read
+                    cluster.extend((0, gap_numbers.setdefault(part.length, len(gap_numbers) + 1)))
+                continue
+            if part.part_type != "W":
+                continue
+            counter += 1
+            outfile.write(">{0} {1} {2}\n".format(part.name, counter, part.length))
+            cluster.append(-counter if part.orientation == "-" else counter)
+        for length, number in gap_numbers.items():
+            outfile.write(">{0}{1} {2} {3}\n".format(GAP_PREFIX, number, counter + number, length))
+        for cluster in clusters.values():
+            if len(cluster) == 0:
+                continue
+            tokens = list()
+            values = iter(cluster)
+            for value in values:
+                tokens.append(str(value if value != 0 else counter + next(values)))
+            outfile.write(" ".join(tokens) + "\n")
+    return 0
+
 def main():
-    if len(sys.argv) != 3:
-        printUsage()
-        sys.exit()
-    lines, clusters, order = read_from_agp(sys.argv[1])
-    write_assembly(lines, clusters, order, sys.argv[2])
+    args = parse_args()
+    convert_agp(args.input_agp_file, args.output_assembly_file, gaps=args.gaps)
 
 if __name__ == "__main__":
     main()
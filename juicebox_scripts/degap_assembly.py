@@ -3,16 +3,29 @@
 from __future__ import print_function
 import sys
 
-with open(sys.argv[1]) as file:
-    gap_index = "not an index"
-    for line in file:
+def degap_lines(lines, log=True):
+    '''Yield the lines of a .assembly file, stripped of whitespace, with
+    its hic_gap entries removed from the header and the scaffolds.'''
+    gap_indices = set()
+    for line in lines:
         if line.startswith(">"):
             if line.startswith(">hic_gap"):
                 gap_index = line.split()[1]
-                print("omitting entries with index {} as gaps".format(gap_index), file=sys.stderr)
+                gap_indices.add(gap_index)
+                if log:
+                    print("omitting entries with index {} as gaps".format(gap_index), file=sys.stderr)
                 continue
-            print(line.strip())
+            yield line.strip()
         else:
             fields = line.split()
-            degapped = [field for field in fields if field != gap_index]
-            print(" ".join(degapped))
+            degapped = [field for field in fields if field.lstrip("-") not in gap_indices]
+            if degapped:
+                yield " ".join(degapped)
+
+def main():
+    with open(sys.argv[1]) as file:
+        for line in degap_lines(file):
+            print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!usr/bin/env python
+'''
+Phase Genomics
+
+juicebox_scripts/fasta_cache.py
+
+This file contains an on-disk cache of parsed FASTA files, so repeated
+conversions against the same original FASTA skip parsing it. Each cache
+entry holds the sequences as raw bytes, one line per record, with a
+samtools-compatible .fai index of their offsets, and is served back
+through an IndexedFasta. Entries are keyed by the source FASTA's path,
+size and modification time, and the least recently used entries are
+evicted once the cache grows past its size cap.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+try:
+    from juicebox_scripts.fasta_utils import FaiEntry, IndexedFasta, file_signature, write_fai, _to_bytes
+except ImportError:
+    from fasta_utils import FaiEntry, IndexedFasta, file_signature, write_fai, _to_bytes
+
+# default location of the cache, overridden by $JUICEBOX_SCRIPTS_CACHE
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'juicebox_scripts')
+# default size cap of the cache, in bytes
+DEFAULT_MAX_BYTES = 50 * (1 << 30)
+# bases copied at a time when writing an entry
+_COPY_CHUNK = 1 << 24
+
+
+class FastaCache(object):
+    '''An on-disk, size-capped LRU cache of parsed FASTA files.
+
+    Each entry is three files named after its key: KEY.fasta holding each
+    sequence on a single line, KEY.fasta.fai indexing it, and KEY.json
+    recording the source FASTA it was built from. The .json file's
+    modification time marks when the entry was last used.
+
+    Attributes:
+        cache_dir (str): directory holding the cache entries
+        max_bytes (int): size cap of the cache, in bytes
+    '''
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        if cache_dir is None:
+            cache_dir = os.environ.get('JUICEBOX_SCRIPTS_CACHE', DEFAULT_CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, fasta):
+        '''Return the cache key of a FASTA file, which changes whenever
+        the file is moved, resized or modified.
+
+        Args:
+            fasta (str): path to the FASTA file
+
+        Returns:
+            str: the cache key
+        '''
+        return hashlib.sha1(file_signature(fasta).encode('utf-8')).hexdigest()
+
+    def get(self, fasta):
+        '''Return the cached sequences of a FASTA file, marking the entry
+        as recently used.
+
+        Args:
+            fasta (str): path to the FASTA file
+
+        Returns:
+            IndexedFasta: the cached sequences, or None if the FASTA is
+                not cached. The caller owns the open entry and must
+                close it, or use it in a with block.
+        '''
+        key = self.key(fasta)
+        paths = self._paths(key)
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        os.utime(paths[2], None)
+        return IndexedFasta(paths[0], paths[1])
+
+    def put(self, fasta, sequences):
+        '''Store the sequences of a FASTA file in the cache, replacing any
+        stale entries for the same file, then evict the least recently
+        used entries until the cache is within its size cap.
+
+        Args:
+            fasta (str): path to the FASTA file the sequences were read
+                from
+            sequences (SequenceDict or IndexedFasta): the sequences, in
+                FASTA order
+
+        Returns:
+            IndexedFasta: the newly cached sequences, which the caller
+                owns and must close, as for get
+        '''
+        source = os.path.abspath(fasta)
+        key = self.key(fasta)
+        self.invalidate(fasta)
+        seq_path, fai_path, manifest_path = self._paths(key)
+        entries = list()
+        # write to temporary files renamed into place, so a concurrent or
+        # interrupted run never sees a partial entry
+        handle, tmp_seq = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            offset = 0
+            for name in sequences.keys():
+                length = sequences.length(name)
+                header = _to_bytes('>{0}\n'.format(name))
+                f.write(header)
+                offset += len(header)
+                for start in range(0, length, _COPY_CHUNK):
+                    f.write(_to_bytes(sequences.fetch(name, start, start + _COPY_CHUNK)))
+                f.write(b'\n')
+                entries.append(FaiEntry(name, length, offset, max(length, 1), max(length, 1) + 1))
+                offset += length + 1
+        tmp_fai = tmp_seq + '.fai'
+        write_fai(entries, tmp_fai)
+        os.rename(tmp_seq, seq_path)
+        os.rename(tmp_fai, fai_path)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump({'source': source, 'size': os.path.getsize(fasta), 'mtime': os.path.getmtime(fasta),
+                       'created': time.time()}, f)
+        os.rename(manifest_path + '.tmp', manifest_path)
+        self.evict(keep=key)
+        return IndexedFasta(seq_path, fai_path)
+
+    def invalidate(self, fasta):
+        '''Remove every cache entry built from a FASTA path, whatever its
+        size or modification time was.
+
+        Args:
+            fasta (str): path to the FASTA file
+
+        Returns:
+            int: the number of entries removed
+        '''
+        source = os.path.abspath(fasta)
+        removed = 0
+        for key, manifest in self._manifests():
+            if manifest.get('source') == source:
+                self._remove(key)
+                removed += 1
+        return removed
+
+    def evict(self, keep=None):
+        '''Remove the least recently used entries until the cache is
+        within its size cap.
+
+        Args:
+            keep (str) [optional]: key of an entry never to evict, such
+                as the one just added. Default: None
+
+        Returns:
+            int: the number of entries removed
+        '''
+        entries = list()
+        total = 0
+        for key, _ in self._manifests():
+            paths = self._paths(key)
+            size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+            entries.append((os.path.getmtime(paths[2]), key, size))
+            total += size
+        removed = 0
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self._remove(key)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        '''Remove every entry from the cache'''
+        for key, _ in self._manifests():
+            self._remove(key)
+
+    def _paths(self, key):
+        '''Return the sequence, index and manifest paths of an entry'''
+        seq_path = os.path.join(self.cache_dir, key + '.fasta')
+        return seq_path, seq_path + '.fai', os.path.join(self.cache_dir, key + '.json')
+
+    def _manifests(self):
+        '''Yield the key and manifest of each entry in the cache'''
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, filename)) as f:
+                    manifest = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue
+            yield filename[:-len('.json')], manifest
+
+    def _remove(self, key):
+        '''Delete the files of an entry'''
+        for path in self._paths(key):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,827 @@
+#!usr/bin/env python
+'''
+Phase Genomics
+
+juicebox_scripts/fasta_utils.py
+
+This file contains sequence storage, FASTA index and compressed file
+utilities shared by the scripts in this package. Sequence stores expose a
+common interface (fetch(), length(), membership and key iteration) so
+that callers can work with either an in-memory dict of sequences or a
+memory-mapped FASTA served through a samtools-compatible .fai index.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+from __future__ import print_function
+
+import gzip
+import mmap
+import os
+import struct
+import zlib
+from collections import namedtuple, OrderedDict
+
+# name, sequence length, byte offset of the first base, bases per line,
+# bytes per line (including the line terminator), as in samtools faidx
+FaiEntry = namedtuple('FaiEntry', ['name', 'length', 'offset', 'linebases', 'linewidth'])
+
+# largest amount of uncompressed data placed in one BGZF block, chosen as
+# in htslib so that a compressed block always fits in 64 KiB
+_BGZF_BLOCK_SIZE = 0xff00
+# the empty block which marks the end of a BGZF file
+_BGZF_EOF = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+# bytes read at a time when parsing a FASTA file into memory
+FASTA_BLOCK_SIZE = 1 << 24
+
+# length of the pieces a sequence is read or reverse complemented in when
+# it is written out, bounding the memory used beyond the sequence store
+SEQUENCE_CHUNK_SIZE = 1 << 22
+
+# prefix of the names Juicebox gives gap entries in a .assembly file,
+# shared by the tools reading and writing them
+GAP_PREFIX = 'hic_gap_'
+
+# whitespace removed from sequence lines when parsing a FASTA file, other
+# than the newlines every line ends with
+_SEQUENCE_WHITESPACE = b' \t\r\x0b\x0c'
+
+# IUPAC nucleotide codes and their complements, in both cases
+_IUPAC = 'ACGTUNRYKMSWBDHVacgtunrykmswbdhv'
+_IUPAC_COMPLEMENTS = 'TGCAANYRMKSWVHDBtgcaanyrmkswvhdb'
+
+# record names are decoded as UTF-8 on Python 3, with any bytes which are
+# not valid UTF-8 carried through as lone surrogates, so that every name
+# can be read and is written back out byte for byte
+if str is bytes:
+    from string import maketrans
+    _STR_COMPLEMENT_TABLE = _BYTES_COMPLEMENT_TABLE = maketrans(_IUPAC, _IUPAC_COMPLEMENTS)
+    _TEXT_OPTIONS = dict()
+
+    def _to_str(raw):
+        return raw
+
+    def _to_bytes(text):
+        return text
+else:
+    _STR_COMPLEMENT_TABLE = str.maketrans(_IUPAC, _IUPAC_COMPLEMENTS)
+    _BYTES_COMPLEMENT_TABLE = bytes.maketrans(_IUPAC.encode('ascii'), _IUPAC_COMPLEMENTS.encode('ascii'))
+    _TEXT_OPTIONS = {'encoding': 'utf-8', 'errors': 'surrogateescape'}
+
+    def _to_str(raw):
+        return raw.decode('utf-8', 'surrogateescape')
+
+    def _to_bytes(text):
+        return text.encode('utf-8', 'surrogateescape')
+
+
+class SequenceDict(OrderedDict):
+    '''An ordered dict mapping sequence names to their sequences, which
+    also offers the fetch() and length() methods of IndexedFasta so that
+    the two can be used interchangeably. Sequences are kept in the order
+    they were added, which is FASTA order when read from a file, on
+    every Python version.
+
+    Sequences may be stored as bytes, as iter_fasta_blocks produces
+    them, or as str. Either way, indexing the dict and fetch() return
+    str.
+    '''
+    def __getitem__(self, name):
+        return _as_str(dict.__getitem__(self, name))
+
+    def fetch(self, name, start=0, end=None):
+        '''Return a slice of a sequence
+
+        Args:
+            name (str): the name of the sequence
+            start (int) [optional]: 0-based start of the slice. Default: 0
+            end (int) [optional]: 0-based, exclusive end of the slice.
+                Default: the end of the sequence
+
+        Returns:
+            str: the requested slice of the sequence
+        '''
+        return _as_str(dict.__getitem__(self, name)[start:end])
+
+    def length(self, name):
+        '''Return the length of a sequence
+
+        Args:
+            name (str): the name of the sequence
+
+        Returns:
+            int: the length of the sequence
+        '''
+        return len(dict.__getitem__(self, name))
+
+
+class SequenceView(object):
+    '''A lightweight reference to a slice of a sequence held in a
+    sequence store (SequenceDict or IndexedFasta). The slice is only
+    read from the store when resolve() is called, so views of every
+    fragment of an assembly cost memory proportional to the number of
+    fragments rather than the size of the genome.
+
+    Attributes:
+        store (SequenceDict or IndexedFasta): the store holding the
+            source sequence
+        name (str): the name of the source sequence in the store
+        start (int): 0-based start of the slice
+        end (int): 0-based, exclusive end of the slice
+    '''
+    __slots__ = ('store', 'name', 'start', 'end')
+
+    def __init__(self, store, name, start, end):
+        self.store = store
+        self.name = name
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return max(min(self.end, self.store.length(self.name)) - self.start, 0)
+
+    def __repr__(self):
+        return 'SequenceView({0!r}, {1}, {2})'.format(self.name, self.start, self.end)
+
+    def resolve(self):
+        '''Read the slice from the store
+
+        Returns:
+            str: the sequence the view refers to
+        '''
+        return self.store.fetch(self.name, self.start, self.end)
+
+
+class IndexedFasta(object):
+    '''Read-only access to the sequences in a FASTA file via a
+    samtools-compatible .fai index and a memory map of the FASTA. Only
+    the bytes of the requested slices are ever read, so opening a FASTA
+    with an existing index is nearly instant regardless of its size.
+
+    A missing or stale index is built and written to fai. If it cannot
+    be written, e.g. because the FASTA is in a read-only directory, it
+    is kept in memory instead. An IndexedFasta holds an open file and
+    memory map until close() is called, or the with block it is used
+    in ends.
+
+    Attributes:
+        fasta (str): path to the FASTA file
+        fai (str): path to the .fai index of the FASTA file, or None if
+            the index could not be written and is only held in memory
+        index (OrderedDict[str:FaiEntry]): the index entries, in the
+            order they appear in the FASTA file
+    '''
+    def __init__(self, fasta, fai=None, entries=None):
+        if is_gzipped(fasta):
+            raise FastaIndexError('Fasta {0} is compressed and cannot be memory-mapped'.format(fasta))
+        self.fasta = fasta
+        self.fai = fai if fai is not None else fasta + '.fai'
+        if entries is None:
+            if not os.path.exists(self.fai) or os.path.getmtime(self.fai) < os.path.getmtime(fasta):
+                entries = build_fai(fasta)
+                try:
+                    write_fai(entries, self.fai)
+                except (IOError, OSError):
+                    self.fai = None
+            else:
+                entries = read_fai(self.fai)
+        else:
+            self.fai = None
+        self.index = OrderedDict((entry.name, entry) for entry in entries)
+        self._mmap = None
+        self._handle = open(fasta, 'rb')
+        if os.path.getsize(fasta) > 0:
+            self._mmap = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __getstate__(self):
+        # memory maps cannot be pickled, so reopen the fasta by path,
+        # passing the index along if it was never written
+        if self.fai is None:
+            return (self.fasta, None, list(self.index.values()))
+        return (self.fasta, self.fai)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, name):
+        return self.fetch(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def keys(self):
+        return self.index.keys()
+
+    def close(self):
+        '''Release the memory map and file handle. Closing more than
+        once does nothing.'''
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._handle.close()
+
+    def length(self, name):
+        '''Return the length of a sequence
+
+        Args:
+            name (str): the name of the sequence
+
+        Returns:
+            int: the length of the sequence
+        '''
+        return self.index[name].length
+
+    def fetch(self, name, start=0, end=None):
+        '''Return a slice of a sequence, reading only the bytes of the
+        FASTA that hold it. Follows python slicing semantics for
+        non-negative coordinates.
+
+        Args:
+            name (str): the name of the sequence
+            start (int) [optional]: 0-based start of the slice. Default: 0
+            end (int) [optional]: 0-based, exclusive end of the slice.
+                Default: the end of the sequence
+
+        Returns:
+            str: the requested slice of the sequence
+        '''
+        entry = self.index[name]
+        start = min(max(start, 0), entry.length)
+        end = entry.length if end is None else min(max(end, start), entry.length)
+        if start == end:
+            return ''
+        raw = self._mmap[self._byte_offset(entry, start):self._byte_offset(entry, end)]
+        if entry.linewidth != entry.linebases:
+            raw = raw.translate(None, b'\r\n')
+        return _to_str(raw)
+
+    def _byte_offset(self, entry, position):
+        '''Convert a position in a sequence into an offset in the FASTA'''
+        return entry.offset + (position // entry.linebases) * entry.linewidth + position % entry.linebases
+
+
+class InvalidFastaError(ValueError):
+    '''An Error caused when an invalid .fasta file is attempted to be
+    read.'''
+    pass
+
+
+class FastaIndexError(ValueError):
+    '''An Error caused when a FASTA file cannot be indexed, e.g. because
+    its sequence lines are not all the same length.'''
+    pass
+
+
+def build_fai(fasta):
+    '''Scan a FASTA file and compute its samtools-compatible index.
+    Sequence lines within a record must all be the same length except
+    the last; blank lines are only tolerated at the end of a record.
+    The file is read in large blocks by iter_fasta_blocks.
+
+    Args:
+        fasta (str): path to the FASTA file to index
+
+    Returns:
+        list[FaiEntry]: the index entries, in the order the sequences
+            appear in the FASTA file
+
+    Raises:
+        FastaIndexError: if the FASTA file cannot be indexed
+    '''
+    with open(fasta, 'rb') as f:
+        return [entry for _, entry in iter_fasta_blocks(f, name=fasta, index=True)]
+
+
+def read_fai(fai):
+    '''Read a samtools-compatible .fai index
+
+    Args:
+        fai (str): path to the index
+
+    Returns:
+        list[FaiEntry]: the index entries, in file order
+    '''
+    entries = list()
+    with open(fai, **_TEXT_OPTIONS) as f:
+        for line in f:
+            fields = line.rstrip('\r\n').split('\t')
+            if len(fields) < 5:
+                continue
+            entries.append(FaiEntry(fields[0], int(fields[1]), int(fields[2]), int(fields[3]), int(fields[4])))
+    return entries
+
+
+def write_fai(entries, fai):
+    '''Write a samtools-compatible .fai index
+
+    Args:
+        entries (list[FaiEntry]): the index entries to write
+        fai (str): path to write the index to
+    '''
+    with open(fai, 'w', **_TEXT_OPTIONS) as f:
+        for entry in entries:
+            f.write('{0}\t{1}\t{2}\t{3}\t{4}\n'.format(*entry))
+
+
+def reverse_complement(sequence):
+    '''Reverse complement a sequence using a translation table, so the
+    work is done in bulk rather than base by base. The full IUPAC
+    nucleotide alphabet is supported in upper and lower case; any other
+    characters are reversed but left otherwise unchanged.
+
+    Args:
+        sequence (str or bytes): the sequence to reverse complement
+
+    Returns:
+        str or bytes: the reverse complement of the sequence, of the
+            same type as the input
+    '''
+    if isinstance(sequence, (bytes, bytearray)):
+        return sequence[::-1].translate(_BYTES_COMPLEMENT_TABLE)
+    return sequence[::-1].translate(_STR_COMPLEMENT_TABLE)
+
+
+def iter_reverse_complement(sequence, chunk_size=SEQUENCE_CHUNK_SIZE):
+    '''Reverse complement a sequence in chunks, starting from its end.
+    Joining the chunks gives reverse_complement(sequence), but only one
+    chunk's worth of extra memory is needed at a time.
+
+    Args:
+        sequence (str or bytes): the sequence to reverse complement
+        chunk_size (int) [optional]: the length of the chunks to yield.
+            Default: 4 Mb
+
+    Yields:
+        str or bytes: successive chunks of the reverse complement
+    '''
+    for end in range(len(sequence), 0, -chunk_size):
+        yield reverse_complement(sequence[max(end - chunk_size, 0):end])
+
+
+def iter_sequence_chunks(sequence, reverse=False, chunk_size=SEQUENCE_CHUNK_SIZE):
+    '''Read a sequence in chunks, reverse complemented if reverse is
+    set. A SequenceView is read from its store a chunk at a time, so a
+    contig is never held whole, however long it is.
+
+    Args:
+        sequence (str or SequenceView): the sequence to read
+        reverse (bool) [optional]: yield the chunks of the reverse
+            complement instead, starting from the end of the sequence.
+            Default: False
+        chunk_size (int) [optional]: the length of the chunks to yield.
+            Default: SEQUENCE_CHUNK_SIZE
+
+    Yields:
+        str: successive chunks of the sequence or its reverse complement
+    '''
+    if isinstance(sequence, SequenceView):
+        store, name, start, end = sequence.store, sequence.name, sequence.start, sequence.start + len(sequence)
+        fetch = lambda chunk_start, chunk_end: store.fetch(name, chunk_start, chunk_end)
+    else:
+        start, end = 0, len(sequence)
+        fetch = lambda chunk_start, chunk_end: sequence[chunk_start:chunk_end]
+    if not reverse:
+        for chunk_start in range(start, end, chunk_size):
+            yield fetch(chunk_start, min(chunk_start + chunk_size, end))
+    else:
+        for chunk_end in range(end, start, -chunk_size):
+            yield reverse_complement(fetch(max(chunk_end - chunk_size, start), chunk_end))
+
+
+def is_gzipped(path):
+    '''Check whether a file is gzip (or bgzip) compressed
+
+    Args:
+        path (str): path to the file
+
+    Returns:
+        bool: whether the file starts with the gzip magic number
+    '''
+    with open(path, 'rb') as f:
+        return f.read(2) == b'\x1f\x8b'
+
+
+def file_signature(path):
+    '''Describe a file by its absolute path, size and modification time,
+    which together change whenever the file is moved or rewritten
+
+    Args:
+        path (str): path to the file
+
+    Returns:
+        str: the signature of the file
+    '''
+    stat = os.stat(path)
+    return '{0}\t{1}\t{2!r}'.format(os.path.abspath(path), stat.st_size, stat.st_mtime)
+
+
+def open_input(path, binary=False):
+    '''Open a text file for reading, transparently decompressing it if
+    it is gzip or bgzip compressed
+
+    Args:
+        path (str): path to the file
+        binary (bool) [optional]: open the file in binary mode, to read
+            bytes rather than str. Default: False
+
+    Returns:
+        file: an open text (or binary) handle
+    '''
+    if is_gzipped(path):
+        if binary or str is bytes:
+            return gzip.open(path, 'rb')
+        return gzip.open(path, 'rt', **_TEXT_OPTIONS)
+    if binary:
+        return open(path, 'rb')
+    return open(path, 'r', **_TEXT_OPTIONS)
+
+
+def iter_fasta_blocks(handle, block_size=FASTA_BLOCK_SIZE, name=None, progress=None, names=None, skipped=None,
+                      count_only=False, index=False):
+    '''Parse the records of a FASTA file, reading it in large blocks.
+    Header lines are found with bytes.find rather than by splitting the
+    file into lines, and newlines are removed from each stretch of
+    sequence lines at once with bytes.replace. Any other whitespace,
+    such as the carriage returns of Windows line endings, is then
+    removed with bytes.translate.
+
+    Args:
+        handle (file): an open binary handle of the FASTA file
+        block_size (int) [optional]: bytes to read at a time.
+            Default: FASTA_BLOCK_SIZE
+        name (str) [optional]: name of the FASTA, used in errors.
+            Default: None
+        progress (Progress) [optional]: updated with the number of
+            bytes of each block read. Default: None
+        names (set of str) [optional]: names of the records wanted.
+            The sequence lines of other records are passed over without
+            being stripped or stored, and the records are not yielded.
+            Default: None, for every record
+        skipped (dict) [optional]: filled with the name of each record
+            passed over, mapping to the bytes of it in the file,
+            including its header line. Default: None
+        count_only (bool) [optional]: yield the length of each sequence
+            instead of the sequence, counting its bases without copying
+            them. Default: False
+        index (bool) [optional]: yield the samtools-compatible index
+            entry of each record instead of its sequence, checking that
+            its lines are regular enough to be indexed. Default: False
+
+    Yields:
+        (str, bytes): the name of each record, the first word of its
+            header line, and its sequence with line breaks removed, or
+            (str, int): the name and sequence length if count_only, or
+            (str, FaiEntry): the name and index entry if index
+
+    Raises:
+        InvalidFastaError: if sequence comes before the first header
+        FastaIndexError: if index and the FASTA file cannot be indexed
+    '''
+    # pieces of sequence are bytes, or base counts if count_only. When
+    # indexing, the sequence lines are passed to the indexer instead
+    indexer = _FaiBuilder(name) if index else None
+    if indexer is not None:
+        finish = lambda pieces: indexer.entry()
+    else:
+        measure, finish = (_count_bases, sum) if count_only else (_strip_sequence, _join)
+    record = None
+    keep = True
+    pieces = list()
+    pending = b''
+    at_line_start = True
+    # byte offset in the file of the start of data
+    offset = 0
+    while True:
+        block = handle.read(block_size)
+        if not block:
+            break
+        if indexer is not None and not block.endswith(b'\n'):
+            # the indexer checks whole lines, so finish the last one
+            block += handle.readline()
+        if progress is not None:
+            progress.update(len(block))
+        data = pending + block if pending else block
+        pending = b''
+        pos = 0
+        while pos < len(data):
+            if at_line_start and data[pos:pos+1] == b'>':
+                end = data.find(b'\n', pos)
+                if end < 0:
+                    # the header continues in the next block
+                    pending = data[pos:]
+                    break
+                if record is not None and keep:
+                    yield record, finish(pieces)
+                record = _fasta_record_name(data[pos+1:end])
+                keep = _wanted(record, names, skipped, end + 1 - pos)
+                if indexer is not None and keep:
+                    indexer.start(record, offset + pos, offset + end + 1)
+                pieces = list()
+                pos = end + 1
+                continue
+            end = data.find(b'\n>', pos)
+            end = len(data) if end < 0 else end + 1
+            if not keep:
+                if skipped is not None:
+                    skipped[record] += end - pos
+            elif indexer is not None:
+                indexer.add(data, pos, end)
+            else:
+                sequence = measure(data[pos:end])
+                if sequence:
+                    if record is None:
+                        raise InvalidFastaError('Fasta {0} does not begin with a contig name'.format(name))
+                    pieces.append(sequence)
+            at_line_start = data[end-1:end] == b'\n'
+            pos = end
+        offset += pos
+    if pending:
+        if record is not None and keep:
+            yield record, finish(pieces)
+        record = _fasta_record_name(pending[1:])
+        keep = _wanted(record, names, skipped, len(pending))
+        if indexer is not None and keep:
+            indexer.start(record, offset, offset + len(pending))
+        pieces = list()
+    if record is not None and keep:
+        yield record, finish(pieces)
+
+
+class _FaiBuilder(object):
+    '''Builds the .fai index entry of each record of a FASTA file from
+    the stretches of sequence lines found by iter_fasta_blocks. The lines
+    of a stretch are checked to be the same length with a few bulk
+    operations; only the first line of each record, its last line and
+    any stretch failing the check are looked at one by one.
+    '''
+    def __init__(self, fasta):
+        self.fasta = fasta
+        self.seen = set()
+        self.name = None
+
+    def start(self, name, header_offset, offset):
+        '''Begin the entry of a record
+
+        Args:
+            name (str): the name of the record
+            header_offset (int): byte offset of its header line
+            offset (int): byte offset of the line after the header
+        '''
+        if not name:
+            raise FastaIndexError('Fasta {0} contains a header without a name at byte {1}'.format(
+                self.fasta, header_offset))
+        if name in self.seen:
+            raise FastaIndexError('Fasta {0} contains multiple contigs named {1}'.format(self.fasta, name))
+        self.seen.add(name)
+        self.name = name
+        self.offset = offset
+        self.length = 0
+        self.linebases = None
+        self.linewidth = None
+        self.last_line_short = False
+
+    def entry(self):
+        '''Return the entry of the current record'''
+        return FaiEntry(self.name, self.length, self.offset, self.linebases or 0, self.linewidth or 0)
+
+    def add(self, data, start, end):
+        '''Add a stretch of whole sequence lines, data[start:end], to
+        the current record'''
+        if self.name is None:
+            if data[start:end].translate(None, b'\r\n'):
+                raise FastaIndexError('Fasta {0} does not begin with a contig name'.format(self.fasta))
+            return
+        pos = start
+        while pos < end and (self.linebases is None or self.last_line_short):
+            pos = self._add_line(data, pos, end)
+        if pos == end:
+            return
+        # the stretch is regular if it is made of full lines, then at
+        # most one short line and any blank lines ending the record
+        body_end = end
+        while body_end > pos and data[body_end-1:body_end] in (b'\r', b'\n'):
+            body_end -= 1
+        body_end = data.find(b'\n', body_end, end) + 1 or end
+        width = self.linewidth
+        lines = (body_end - pos) // width
+        full_end = pos + lines * width
+        terminator = width - self.linebases
+        if lines and terminator in (1, 2) and data.count(b'\n', pos, full_end) == lines and \
+                data[pos+width-1:full_end:width] == b'\n' * lines and \
+                (data.find(b'\r', pos, full_end) < 0 if terminator == 1 else
+                 data.count(b'\r', pos, full_end) == lines and data[pos+width-2:full_end:width] == b'\r' * lines):
+            self.length += lines * self.linebases
+            pos = full_end
+        while pos < end:
+            pos = self._add_line(data, pos, end)
+
+    def _add_line(self, data, start, end):
+        '''Add the sequence line starting at data[start] to the current
+        record, returning the offset of the next line'''
+        line_end = data.find(b'\n', start, end) + 1 or end
+        width = line_end - start
+        bases = width
+        while bases and data[start+bases-1:start+bases] in (b'\r', b'\n'):
+            bases -= 1
+        if bases == 0:
+            self.last_line_short = True
+            return line_end
+        if self.linebases is None:
+            self.linebases = bases
+            self.linewidth = width
+        elif self.last_line_short or bases > self.linebases or \
+                (width != bases and width - bases != self.linewidth - self.linebases):
+            raise FastaIndexError('Fasta {0} has irregular line lengths in contig {1}'.format(self.fasta, self.name))
+        if bases < self.linebases:
+            self.last_line_short = True
+        self.length += bases
+        return line_end
+
+
+def _wanted(record, names, skipped, header_bytes):
+    '''Return whether a FASTA record is wanted, counting the bytes of its
+    header line in skipped if it is not'''
+    if names is None or record in names:
+        return True
+    if skipped is not None:
+        skipped[record] = skipped.get(record, 0) + header_bytes
+    return False
+
+
+def _strip_sequence(lines):
+    '''Remove the whitespace from a stretch of FASTA sequence lines'''
+    sequence = lines.replace(b'\n', b'')
+    # finding a single byte is far cheaper than translating, so only
+    # translate when there is other whitespace to remove
+    for byte in (_SEQUENCE_WHITESPACE[i:i+1] for i in range(len(_SEQUENCE_WHITESPACE))):
+        if byte in sequence:
+            return sequence.translate(None, _SEQUENCE_WHITESPACE)
+    return sequence
+
+
+def _count_bases(lines):
+    '''Count the bases in a stretch of FASTA sequence lines'''
+    count = len(lines) - lines.count(b'\n')
+    for byte in (_SEQUENCE_WHITESPACE[i:i+1] for i in range(len(_SEQUENCE_WHITESPACE))):
+        if byte in lines:
+            count -= lines.count(byte)
+    return count
+
+
+def _join(pieces):
+    '''Join the pieces of a sequence, without copying a single piece'''
+    return pieces[0] if len(pieces) == 1 else b''.join(pieces)
+
+
+def _fasta_record_name(header):
+    '''Return the name of a FASTA record, the first word of its header'''
+    words = header.split()
+    return _to_str(words[0]) if words else ''
+
+
+def _as_str(sequence):
+    '''Return a sequence held as bytes or str as str'''
+    return sequence if isinstance(sequence, str) else _to_str(sequence)
+
+
+def open_output(path, threads=1, buffering=-1):
+    '''Open a text file for writing, compressing it with bgzip if the
+    path ends with .gz
+
+    Args:
+        path (str): path to the file
+        threads (int) [optional]: number of threads to compress with.
+            Default: 1
+        buffering (int) [optional]: buffer size for uncompressed output,
+            as for open(). Default: -1
+
+    Returns:
+        file or BgzfWriter: an open, writable text handle
+    '''
+    if path.endswith('.gz'):
+        return BgzfWriter(path, threads=threads)
+    return open(path, 'w', buffering, **_TEXT_OPTIONS)
+
+
+def _bgzf_block(data, level=6):
+    '''Compress up to _BGZF_BLOCK_SIZE bytes into a single BGZF block'''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    header = struct.pack('<4BI2BH2BHH', 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 66, 67, 2, len(deflated) + 25)
+    return header + deflated + struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+
+
+class BgzfWriter(object):
+    '''A writable handle producing a BGZF (bgzip) compressed file, which
+    samtools and htslib can randomly access using a .gzi index. Blocks
+    are compressed in batches, across a pool of threads if more than one
+    is requested (zlib releases the GIL while compressing).
+
+    Attributes:
+        path (str): path to the file being written
+        gzi_entries (list[(int, int)]): compressed and uncompressed
+            offsets of the start of each block after the first, as stored
+            in a .gzi index
+    '''
+    def __init__(self, path, threads=1, level=6):
+        self.path = path
+        self.gzi_entries = list()
+        self._handle = open(path, 'wb')
+        self._level = level
+        self._pending = list()
+        self._pending_size = 0
+        self._batch_size = _BGZF_BLOCK_SIZE * 4 * max(threads, 1)
+        self._pool = None
+        if threads > 1:
+            # imported here so the light tools using this module do not
+            # load multiprocessing
+            from multiprocessing.pool import ThreadPool
+            self._pool = ThreadPool(threads)
+        self._compressed_offset = 0
+        self._uncompressed_offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, data):
+        '''Write text or bytes to the file
+
+        Args:
+            data (str or bytes): the data to write
+        '''
+        if not isinstance(data, bytes):
+            data = _to_bytes(data)
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= self._batch_size:
+            self._write_blocks(final=False)
+
+    def close(self):
+        '''Compress any remaining data, write the end-of-file marker and
+        close the file'''
+        if self._handle.closed:
+            return
+        self._write_blocks(final=True)
+        self._handle.write(_BGZF_EOF)
+        self._handle.close()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+    def write_gzi(self, gzi):
+        '''Write a .gzi index, as made by `bgzip -i`, for the file
+
+        Args:
+            gzi (str): path to write the index to
+        '''
+        with open(gzi, 'wb') as f:
+            f.write(struct.pack('<Q', len(self.gzi_entries)))
+            for compressed_offset, uncompressed_offset in self.gzi_entries:
+                f.write(struct.pack('<QQ', compressed_offset, uncompressed_offset))
+
+    def _write_blocks(self, final):
+        '''Compress and write all complete blocks of pending data, and the
+        final partial block too if final is set'''
+        data = b''.join(self._pending)
+        end = len(data) if final else len(data) - len(data) % _BGZF_BLOCK_SIZE
+        blocks = [data[start:start + _BGZF_BLOCK_SIZE] for start in range(0, end, _BGZF_BLOCK_SIZE)]
+        if self._pool is not None:
+            compressed = self._pool.map(lambda block: _bgzf_block(block, self._level), blocks)
+        else:
+            compressed = [_bgzf_block(block, self._level) for block in blocks]
+        for block, compressed_block in zip(blocks, compressed):
+            if self._uncompressed_offset > 0:
+                self.gzi_entries.append((self._compressed_offset, self._uncompressed_offset))
+            self._handle.write(compressed_block)
+            self._compressed_offset += len(compressed_block)
+            self._uncompressed_offset += len(block)
+        self._pending = [data[end:]]
+        self._pending_size = len(data) - end
@@ -26,9 +26,120 @@ along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.h
 '''
 from __future__ import print_function
 
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
 import sys
-import functools
 from _collections import defaultdict
+from collections import deque, namedtuple
+
+try:
+    from juicebox_scripts.fasta_utils import IndexedFasta, SequenceDict, SequenceView, FastaIndexError, \
+        FaiEntry, BgzfWriter, reverse_complement, iter_sequence_chunks, open_input, open_output, write_fai, \
+        file_signature, is_gzipped, iter_fasta_blocks, InvalidFastaError, GAP_PREFIX, _to_str, \
+        _to_bytes
+    from juicebox_scripts.fasta_cache import FastaCache
+    from juicebox_scripts.metrics import Metrics, measure_stage
+    from juicebox_scripts.progress import start_progress
+    from juicebox_scripts.scaffold_layout import ScaffoldLayout
+except ImportError:
+    from fasta_utils import IndexedFasta, SequenceDict, SequenceView, FastaIndexError, \
+        FaiEntry, BgzfWriter, reverse_complement, iter_sequence_chunks, open_input, open_output, write_fai, \
+        file_signature, is_gzipped, iter_fasta_blocks, InvalidFastaError, GAP_PREFIX, _to_str, \
+        _to_bytes
+    from fasta_cache import FastaCache
+    from metrics import Metrics, measure_stage
+    from progress import start_progress
+    from scaffold_layout import ScaffoldLayout
+
+# buffer size used for each output file written by ProcessedAssembly
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# length of the sequence lines of FASTA output
+_FASTA_LINE_LEN = 80
+
+# line pieces joined into each write of wrapped FASTA sequence, about
+# 650 KB of 80 column lines
+_WRITE_BATCH_PIECES = 16384
+
+# version of the manifest written for incremental re-conversion; bumped
+# whenever its layout or the meaning of a scaffold signature changes
+_MANIFEST_VERSION = 1
+
+# header lines of the AGP and BED outputs
+_AGP_HEADER = ('##agp-version 2.1\n', '# This file was generated by converting juicebox assembly format\n')
+_BED_HEADER = ('##bed file\n', '# This file was generated by converting juicebox assembly format\n')
+
+# records yielded by the iter_* methods of ProcessedAssembly. Coordinates
+# and lengths are ints, and the fields of each record are the columns of
+# its line in the corresponding output, as written by format_record
+AgpRecord = namedtuple('AgpRecord', ['object', 'object_beg', 'object_end', 'part_number', 'component_type',
+                                     'component_id', 'component_beg', 'component_end', 'orientation'])
+AgpGapRecord = namedtuple('AgpGapRecord', ['object', 'object_beg', 'object_end', 'part_number', 'component_type',
+                                           'gap_length', 'gap_type', 'linkage', 'linkage_evidence'])
+BedRecord = namedtuple('BedRecord', ['chrom', 'start', 'end', 'name', 'length', 'strand'])
+BedGapRecord = namedtuple('BedGapRecord', ['chrom', 'start', 'end', 'name'])
+BreakRecord = namedtuple('BreakRecord', ['orig_contig', 'fragment', 'break_start', 'break_end', 'fragment_len'])
+ScaffoldSequence = namedtuple('ScaffoldSequence', ['name', 'sequence'])
+
+# per-scaffold metadata and whole-assembly statistics reported by
+# ProcessedAssembly.scaffold_table and ProcessedAssembly.summary. Lengths
+# of scaffolds include their gaps
+ScaffoldInfo = namedtuple('ScaffoldInfo', ['name', 'length', 'contig_count', 'gap_count'])
+AssemblySummary = namedtuple('AssemblySummary', ['scaffold_count', 'contig_count', 'gap_count', 'total_length',
+                                                 'longest', 'n50', 'l50', 'n90', 'l90', 'contig_n50',
+                                                 'contig_l50'])
+
+# a contig (or gap, where placement is None) placed on a scaffold, as
+# walked by ProcessedAssembly._iter_parts
+_LayoutPart = namedtuple('_LayoutPart', ['scaffold_index', 'scaffold_name', 'object', 'placement', 'offset',
+                                         'part_number', 'gap_number'])
+
+def n_stat(lengths, fraction=0.5):
+    '''Compute the N and L statistics of a set of sequence lengths, e.g.
+    N50 and L50 for a fraction of 0.5: the length of the shortest of the
+    longest sequences that together cover at least that fraction of the
+    total length, and how many such sequences there are.
+
+    Args:
+        lengths (iterable of int): the sequence lengths
+        fraction (float) [optional]: the fraction of the total length to
+            cover. Default: 0.5
+
+    Returns:
+        (int, int): the N and L statistics, or (0, 0) for no sequences
+    '''
+    lengths = sorted(lengths, reverse=True)
+    target = fraction * sum(lengths)
+    covered = 0
+    for count, length in enumerate(lengths, 1):
+        covered += length
+        if covered >= target:
+            return length, count
+    return 0, 0
+
+def print_assembly_summary(summary):
+    '''Print an AssemblySummary to stdout'''
+    print('Output assembly: {0} scaffolds, {1} contigs, {2} gaps, {3} bp'.format(
+        summary.scaffold_count, summary.contig_count, summary.gap_count, summary.total_length))
+    print('  longest scaffold: {0}'.format(summary.longest))
+    print('  scaffold N50: {0} (L50: {1}), N90: {2} (L90: {3})'.format(summary.n50, summary.l50,
+                                                                    summary.n90, summary.l90))
+    print('  contig N50: {0} (L50: {1})'.format(summary.contig_n50, summary.contig_l50))
+
+def format_record(record):
+    '''Format a record yielded by one of the iter_* methods of
+    ProcessedAssembly as a line of its output
+
+    Args:
+        record (namedtuple): the record
+
+    Returns:
+        str: the fields of the record, tab separated, with a newline
+    '''
+    return '\t'.join([str(field) for field in record]) + '\n'
 
 class ContigNotFoundError(ValueError):
     pass
@@ -52,9 +163,11 @@ class JuiceboxConverter:
         pass
 
     def process(self, fasta, assembly, contig_mode=False, verbose=False,
-                simple_chr_names=False):
+                simple_chr_names=False, indexed=False, assembly_lines=None, cache=None, metrics=None):
         '''Read in a .assembly file and .fasta file, generating a
-        ProcessedAssembly reflecting them.
+        ProcessedAssembly reflecting them. The .assembly is read first,
+        so that only the sequences of the .fasta it refers to are read
+        into memory.
 
         Args:
             fasta (str): path to the fasta corresponding to the assembly
@@ -73,81 +186,164 @@ class JuiceboxConverter:
                 Has no effect in contig_mode.
             verbose (bool) [optional]: print output describing processing
                 steps to stdout. Otherwise silent. Default: False
+            indexed (bool) [optional]: instead of reading the whole
+                fasta into memory, build (or reuse) a .fai index next to
+                it and read sequences on demand from a memory map of the
+                fasta. Falls back to reading the fasta into memory if it
+                cannot be indexed. Default: False
+            assembly_lines (iterable of str) [optional]: lines of the
+                .assembly to process instead of reading the assembly
+                file, such as the output of earlier in-memory stages.
+                assembly is then only used in messages. Default: None
+            cache (FastaCache) [optional]: on-disk cache of parsed
+                fastas. If the fasta is cached its sequences are served
+                from the cache without parsing it; otherwise, if it has
+                to be read into memory, all of it is read and then added
+                to the cache.
+                Default: None
+            metrics (Metrics) [optional]: record the time, memory and
+                I/O of each stage here. The returned ProcessedAssembly
+                records its write_* stages here too. Default: None
 
         Returns:
             ProcessedAssembly: a ProcessedAssembly object reflecting the
-                inputs
+                inputs. It owns the open sequence store, if indexed or
+                cached, so close it, or use it in a with block, once its
+                outputs are written.
         '''
         if verbose:
-            print('Reading sequences from {0}...'.format(fasta))
-        sequences = self._read_fasta(fasta, verbose=verbose)
-        if verbose:
-            print('Sequences read\n')
             print('Reading .assembly file {0}...'.format(assembly))
-        assembly_map, scaffolds = self._read_assembly(assembly, contig_mode=contig_mode)
+        with measure_stage(metrics, 'read_assembly'):
+            assembly_map, scaffolds = self._read_assembly(assembly, contig_mode=contig_mode, lines=assembly_lines)
         if verbose:
             print('.assembly read\n')
-            print('Checking for breaks listed in .assembly and making them...')
-        sequences = self._add_breaks(sequences, assembly_map)
-
-        # update contig names in scaffolds as needed based on self._add_breaks()
-        scaffolds = self._update_scaffold_names(scaffolds)
-
+            print('Reading sequences from {0}...'.format(fasta))
+        sequences = None
+        if cache is not None:
+            with measure_stage(metrics, 'cache_get'):
+                sequences = cache.get(fasta)
+            if verbose and sequences is not None:
+                print('Using cached sequences from {0}'.format(cache.cache_dir))
+        if sequences is None and indexed:
+            with measure_stage(metrics, 'index_fasta'):
+                sequences = self._index_fasta(fasta, verbose=verbose)
+        if sequences is None:
+            # a cached fasta must be complete to serve other assemblies
+            names = self._fasta_names(assembly_map) if cache is None else None
+            with measure_stage(metrics, 'read_fasta'):
+                sequences = self._read_fasta(fasta, verbose=verbose, names=names)
+            if cache is not None:
+                if verbose:
+                    print('Caching sequences in {0}'.format(cache.cache_dir))
+                with measure_stage(metrics, 'cache_put'):
+                    sequences = cache.put(fasta, sequences)
         if verbose:
-            print('Break check complete\n')
-        return ProcessedAssembly(sequences, assembly_map, scaffolds, simple_chr_names=simple_chr_names)
-
-    def _read_fasta(self, fasta, verbose=False):
-        '''Read in a .fasta file and return a dictionary mapping the
-        sequence names to their sequences.
+            print('Sequences read\n')
+            print('Checking for breaks listed in .assembly and making them...')
+        store = sequences
+        try:
+            with measure_stage(metrics, 'add_breaks'):
+                sequences = self._add_breaks(sequences, assembly_map, verbose=verbose)
+
+                # update contig names in scaffolds as needed based on self._add_breaks()
+                scaffolds = self._update_scaffold_names(scaffolds)
+
+            if verbose:
+                print('Break check complete\n')
+            with measure_stage(metrics, 'build_scaffold_table'):
+                return ProcessedAssembly(sequences, assembly_map, scaffolds, simple_chr_names=simple_chr_names,
+                                         source_fasta=fasta, metrics=metrics, store=store)
+        except BaseException:
+            _close_store(store)
+            raise
+
+    def _read_fasta(self, fasta, verbose=False, names=None):
+        '''Read in a .fasta file, which may be gzip or bgzip compressed,
+        and return a dictionary mapping the sequence names to their
+        sequences. The file is parsed in large binary blocks by
+        iter_fasta_blocks, and sequences are kept as bytes, which the
+        SequenceDict returns as str.
 
         Args:
             fasta (str): path to the fasta containing the sequences you
                 wish to read
             verbose (bool) [optional]: print output describing processing
                 steps to stdout. Otherwise silent. Default: False
+            names (set of str) [optional]: only read the sequences with
+                these names, passing over the others without storing
+                them. Default: None, for every sequence
 
         Returns:
-            dict[str:str]: dict mapping contig/sequence names present in
+            SequenceDict: dict mapping contig/sequence names present in
                 the .fasta to their sequences
         '''
-        sequences = dict()
-        active_seq = None
-        read_count = 0
-        last_seq = None
-        seq_list = list()
-        dots_on_line = 0
-        with open(fasta) as f:
-            for line in f:
-                line = line.strip()
-                if len(line) == 0:
-                    continue
-                if verbose and read_count % 1000000 == 0:
-                    if dots_on_line == 40 and read_count > 0:
-                        print('')
-                        dots_on_line = 0
-                    print('.', end='')
-                    dots_on_line += 1
-                    sys.stdout.flush()
-                read_count += 1
-                if line[0] == '>':
-                    if active_seq is not None:
-                        sequences[active_seq] = ''.join(seq_list)
-                        seq_list = list()
-                    active_seq = line[1:].split()[0]
-                    if active_seq in sequences.keys():
-                        raise InvalidFastaError('Fasta {0} contains multiple contigs named {1}'.format(fasta, active_seq))
-                    sequences[active_seq] = ''
-                elif active_seq is not None:
-                    seq_list.append(line)
-                else:
-                     raise InvalidFastaError('Fasta {0} does not begin with a contig name'.format(fasta))
-        sequences[active_seq] = ''.join(seq_list)
-        if verbose and read_count % 200000 != 0 and read_count > 0:
-            print('')
+        sequences = SequenceDict()
+        skipped = dict()
+        # progress of a compressed fasta is counted in uncompressed bytes,
+        # so its total is unknown
+        progress = start_progress('Reading {0}'.format(fasta), verbose,
+                                  total=None if is_gzipped(fasta) else os.path.getsize(fasta))
+        with open_input(fasta, binary=True) as f:
+            for name, sequence in iter_fasta_blocks(f, name=fasta, progress=progress, names=names,
+                                                    skipped=skipped):
+                if name in sequences:
+                    raise InvalidFastaError('Fasta {0} contains multiple contigs named {1}'.format(fasta, name))
+                sequences[name] = sequence
+        if progress is not None:
+            progress.finish()
+        if verbose and skipped:
+            print('Skipped {0:,} sequences ({1:,} bytes) not in the .assembly'.format(len(skipped),
+                                                                                      sum(skipped.values())))
         return sequences
 
-    def _read_assembly(self, assembly, contig_mode=False):
+    def _fasta_names(self, assembly_map):
+        '''Return the names of the .fasta sequences the contigs of an
+        .assembly may come from, as resolved by _add_breaks: the contigs
+        themselves, the contigs broken into fragments, and the contigs
+        trashed as debris.
+
+        Args:
+            assembly_map (list): contigs listed in the .assembly, as
+                returned by _read_assembly
+
+        Returns:
+            set: the names of the sequences to read
+        '''
+        names = set()
+        for fragment in assembly_map:
+            fragment_name = fragment[0]
+            names.add(fragment_name)
+            if ':::fragment' in fragment_name:
+                names.add(':::fragment'.join(fragment_name.split(':::fragment')[:-1]))
+                names.add(fragment_name.replace(':::', '___'))
+            if '___fragment' in fragment_name:
+                names.add('___fragment'.join(fragment_name.split('___fragment')[:-1]))
+            if fragment_name.endswith(':::debris'):
+                names.add(fragment_name.replace(':::debris', ''))
+        return names
+
+    def _index_fasta(self, fasta, verbose=False):
+        '''Open a .fasta file for on-demand access through a .fai index,
+        building the index next to the .fasta if it is missing or stale.
+
+        Args:
+            fasta (str): path to the fasta containing the sequences you
+                wish to read
+            verbose (bool) [optional]: print output describing processing
+                steps to stdout. Otherwise silent. Default: False
+
+        Returns:
+            IndexedFasta: the indexed sequences, or None if the fasta
+                cannot be indexed
+        '''
+        try:
+            return IndexedFasta(fasta)
+        except FastaIndexError as e:
+            if verbose:
+                print('Unable to index {0} ({1}), reading it into memory instead'.format(fasta, e))
+            return None
+
+    def _read_assembly(self, assembly, contig_mode=False, lines=None):
         '''Read in a .assembly file and return two lists reflecting its
         contents, one for the contig list in the top of the file and the
         other the scaffolds listed at the bottom of the file.
@@ -159,10 +355,14 @@ class JuiceboxConverter:
                 manner which reflects the scaffolds in the bottom of the
                 file, or just lists the contigs without scaffolding in
                 the scaffold list. Default: False
+            lines (iterable of str) [optional]: lines of the .assembly
+                to read instead of opening assembly. Default: None
+
+        Gap entries (named hic_gap_*) are left out of both lists, so
+        assemblies with explicit gaps need no separate degap step.
 
         Returns:
-            (list, list): tuple of two lists reflecting the .assembly
-                file
+            (list, ScaffoldLayout): tuple reflecting the .assembly file
                 list[(str, str), (str, str), ...]: information about the
                     contigs shown in the top section of the file. The
                     list includes a tuple for each contig listed in the
@@ -170,97 +370,133 @@ class JuiceboxConverter:
                     top section of the assembly file.
                     str: the contig name
                     str: the contig length
-                list[list[(str, str, str, bool), (str, str, str, bool), ...]:
-                    information about the scaffolds shown in the bottom
-                    section of the file, or about the contigs in the top
-                    section of the file if contig_mode is True. Each
-                    individual scaffold is a list containing the contigs
-                    on that scaffold. Ordering within these lists matches
-                    the ordering of contigs shown in the scaffolds
-                    section at the bottom of the .assembly file if
-                    contig_mode is False. If contig_mode is True, each
-                    scaffold only contains a single contig, and they
-                    are ordered in the same order they are present
-                    in the top section of the .assembly file.
-                    str: the contig name
-                    str: the contig length
-                    str: the contig strand (+ or -)
-                    bool: whether the contig was placed using contig_mode
-                        or not
+                ScaffoldLayout: the scaffolds shown in the bottom
+                    section of the file, or the contigs in the top
+                    section of the file if contig_mode is True. The
+                    contigs of each scaffold are in the order shown in
+                    the scaffolds section at the bottom of the .assembly
+                    file if contig_mode is False. If contig_mode is True,
+                    each scaffold only contains a single contig, and they
+                    are sorted by name. Indexing the layout gives each
+                    scaffold as a list of (name, length, strand,
+                    contig_mode) tuples.
         '''
 
+        if lines is not None:
+            return self._parse_assembly(assembly, lines, contig_mode=contig_mode)
+        with open_input(assembly) as f:
+            return self._parse_assembly(assembly, f, contig_mode=contig_mode)
+
+    def _parse_assembly(self, assembly, lines, contig_mode=False):
+        '''Parse the lines of a .assembly file, as described in
+        _read_assembly.
+
+        Args:
+            assembly (str): name of the .assembly, used in errors
+            lines (iterable of str): the lines of the .assembly
+            contig_mode (bool): as in _read_assembly. Default: False
+
+        Returns:
+            (list, ScaffoldLayout): as in _read_assembly
+        '''
         assembly_map = list()
-        scaffolds = list()
-        unscaffolded_contigs = list()
-        with open(assembly) as f:
-            for line in f:
-                line = line.strip()
-                if len(line) == 0:
-                    continue
-                if line[0] == '>':
-                    # >cname index len
-                    tokens = line[1:].split()
-                    if int(tokens[1]) != len(assembly_map) + 1:
-                        raise MissingFragmentError('Assembly {0} is missing the sequence for index {1}'.format(assembly, len(assembly_map) + 1))
-                    if int(tokens[2]) == 0:
-                        raise ZeroLengthContigError('Assembly {0} lists contig {1} as zero length'.format(assembly, tokens[0]))
-                    assembly_map.append((tokens[0], str(int(tokens[2]))))
-                    unscaffolded_contigs.append(tokens[0])
+        scaffolds = ScaffoldLayout(contig_mode=contig_mode)
+        # placed[i] is set once the contig at index i has been put in a
+        # scaffold, so tracking placement is O(1) per contig
+        placed = bytearray()
+        placed_count = 0
+        # 1-based indices of hic_gap entries
+        gap_indices = set()
+        for line in lines:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            if line[0] == '>':
+                # >cname index len
+                tokens = line[1:].split()
+                if int(tokens[1]) != len(assembly_map) + 1:
+                    raise MissingFragmentError('Assembly {0} is missing the sequence for index {1}'.format(assembly, len(assembly_map) + 1))
+                if int(tokens[2]) == 0:
+                    raise ZeroLengthContigError('Assembly {0} lists contig {1} as zero length'.format(assembly, tokens[0]))
+                assembly_map.append((tokens[0], str(int(tokens[2]))))
+                if tokens[0].startswith(GAP_PREFIX):
+                    # gap entries, as written by Juicebox or
+                    # agp2assembly.py --gaps, are dropped from the
+                    # scaffolds and replaced by our own gaps
+                    gap_indices.add(len(assembly_map))
+                    placed.append(1)
+                    placed_count += 1
                 else:
-                    if contig_mode:
-                        for contig in assembly_map:
-                            scaffolds.append([(contig[0], contig[1], '+', contig_mode)])
-                            unscaffolded_contigs.remove(contig[0])
-                        break
-                    else:
-                        scaffold = list()
-                        contigs = line.split()
-                        for contig in contigs:
-                            index = abs(int(contig)) - 1
-                            strand = '+' if int(contig) > 0 else '-'
-                            scaffold.append((assembly_map[index][0], assembly_map[index][1], strand, contig_mode))
-                            unscaffolded_contigs.remove(assembly_map[index][0])
-                        scaffolds.append(scaffold)
-        if len(unscaffolded_contigs) != 0:
+                    placed.append(0)
+            else:
+                if contig_mode:
+                    for index, contig in enumerate(assembly_map, 1):
+                        if index not in gap_indices:
+                            scaffolds.add(contig[0], int(contig[1]), '+')
+                            scaffolds.end_scaffold()
+                    placed = bytearray(b'\x01') * len(assembly_map)
+                    placed_count = len(assembly_map)
+                    break
+                else:
+                    for contig in line.split():
+                        contig = int(contig)
+                        if abs(contig) in gap_indices:
+                            continue
+                        index = abs(contig) - 1
+                        if index < 0 or index >= len(assembly_map):
+                            raise MissingFragmentError('Assembly {0} places index {1} in a scaffold but does not list '
+                                                       'its sequence'.format(assembly, abs(contig)))
+                        if placed[index]:
+                            raise DuplicatePlacementError('Assembly {0} places contig {1} in scaffolds more than '
+                                                          'once'.format(assembly, assembly_map[index][0]))
+                        placed[index] = 1
+                        placed_count += 1
+                        scaffolds.add(assembly_map[index][0], int(assembly_map[index][1]), '+' if contig > 0 else '-')
+                    scaffolds.end_scaffold()
+        if placed_count != len(assembly_map):
+            unscaffolded_contigs = [contig[0] for index, contig in enumerate(assembly_map) if not placed[index]]
             raise UnscaffoldedContigError('Contigs are not included in scaffolding output: {0}'.format(unscaffolded_contigs))
+        if gap_indices:
+            assembly_map = [contig for index, contig in enumerate(assembly_map, 1) if index not in gap_indices]
         if contig_mode:
-            scaffolds.sort()
+            scaffolds.sort_by_name()
         return assembly_map, scaffolds
 
-    def _add_breaks(self, sequences, assembly_map):
+    def _add_breaks(self, sequences, assembly_map, verbose=False):
         '''Introduce breaks into an assembly_map, as generated by
         _read_assembly, where indicated in the .assembly file. Does not
-        mutate sequences - instead it returns a brand new sequences
-        dict.
+        mutate sequences - instead it returns a brand new dict of
+        SequenceViews into sequences, one per fragment, so no sequence
+        is copied until it is written out.
 
         Args:
-            sequences (dict[str:str]): dictionary mapping contig/sequence
-                names to their sequences
+            sequences (SequenceDict or IndexedFasta): mapping of contig/
+                sequence names to their sequences
             assembly_map (list[(str, str)]: list containing contig
                 information from the .assembly file, as generated by
                 _read_assembly
+            verbose (bool) [optional]: show progress on stderr.
+                Default: False
 
         Returns:
-            dict[str:str]: a brand new dictionary mapping contig/
-                sequence names to their sequences, after performing
-                breaks suggested by the contig names and information in
-                assembly_map
+            dict[str:SequenceView]: a brand new dictionary mapping
+                contig/fragment names to views of their sequences, after
+                performing breaks suggested by the contig names and
+                information in assembly_map
         '''
         sequence_offsets = defaultdict(int)
         new_sequences = dict()
-        orig_sequences = sequences.keys()
         # processing fragments in order is a problem as contigs will not necessarily be in order of fragments!!
         # e.g. it is possible to get fragment_3, fragment_1, fragment_2 as input order, leading to slicing errors.
-        num_frags = 0
-        assembly_map.sort(key=functools.cmp_to_key(cmp_assembly_map_entries))
+        sort_assembly_map(assembly_map)
         update_scaffold_map = {}
-        for fragment in assembly_map:
-            num_frags += 1
-            if num_frags % 100 == 0:
-                print(num_frags, "contigs processed for breaks")
+        progress = start_progress('Checking for breaks', verbose, total=len(assembly_map), unit='contigs')
+        for map_index, fragment in enumerate(assembly_map):
+            if progress is not None:
+                progress.update()
             fragment_name = fragment[0]
             fragment_size = int(fragment[1])
-            if (':::fragment' in fragment_name or '___fragment' in fragment_name) and fragment_name not in orig_sequences:
+            if (':::fragment' in fragment_name or '___fragment' in fragment_name) and fragment_name not in sequences:
                 if ':::fragment' in fragment_name:
                     orig_contig = ':::fragment'.join(fragment_name.split(':::fragment')[:-1])
                 else:
@@ -269,7 +505,8 @@ class JuiceboxConverter:
                     orig_contig = fragment_name.replace(':::', '___')
                 if orig_contig not in sequences:
                     raise ContigNotFoundError('Could not find contig {0} in original FASTA'.format(fragment))
-                new_sequences[fragment_name] = sequences[orig_contig][sequence_offsets[orig_contig]:sequence_offsets[orig_contig]+fragment_size]
+                new_sequences[fragment_name] = SequenceView(sequences, orig_contig, sequence_offsets[orig_contig],
+                                                            sequence_offsets[orig_contig]+fragment_size)
                 sequence_offsets[orig_contig] += fragment_size
                 if fragment_size != len(new_sequences[fragment_name]):
                     print("WARNING: fragment {0} is expected to be size {1} but is size {2}".format(fragment_name,
@@ -282,38 +519,37 @@ class JuiceboxConverter:
                     if fragment_name.endswith(":::debris"):
 
                         nondebris_name = fragment_name.replace(":::debris", "")
-                        orig_len = len(sequences[nondebris_name])
+                        orig_len = sequences.length(nondebris_name)
                         print("WARNING: trying to map debris fragment {} to the whole"
                               " original contig. This contig may have been trashed in Juicebox. Lengths of orig and debris are {}, {}.".format(fragment_name, fragment_size, orig_len))
 
                         if fragment_size != orig_len:
                             raise BadContigNameError("Mapping of debris to original contig failed- lengths are different!!")
 
-                        new_sequences[nondebris_name] = sequences[nondebris_name]
+                        new_sequences[nondebris_name] = SequenceView(sequences, nondebris_name, 0, orig_len)
 
                         # also fix the name in the assembly_map list
                         # have to do this weirdly cause it's a tuple
                         new_fragment = (nondebris_name, fragment[1])
-                        assembly_map[assembly_map.index(fragment)] = new_fragment
+                        assembly_map[map_index] = new_fragment
                         update_scaffold_map[fragment_name] = nondebris_name
                     else:
                         raise BadContigNameError("Unbroken contig {} failed to map!!".format(fragment_name))
 
                 else:
-                    new_sequences[fragment_name] = sequences[fragment_name]
+                    new_sequences[fragment_name] = SequenceView(sequences, fragment_name, 0,
+                                                                sequences.length(fragment_name))
 
+        if progress is not None:
+            progress.finish()
         self.update_scaffold_map = update_scaffold_map
         return new_sequences
 
     def _update_scaffold_names(self, scaffolds):
-        '''Update any scaffold names that need it based on self.update_scaffold_list.'''
-        if len(self.update_scaffold_map) > 0:
-            for scaffold in scaffolds:
-                for contig in scaffold:
-                    if contig[0] in self.update_scaffold_map:
-                        new_tuple = (self.update_scaffold_map[contig[0]], contig[1], contig[2], contig[3])
-                        scaffold[scaffold.index(contig)] = new_tuple
-
+        '''Update any scaffold names that need it based on
+        self.update_scaffold_map, in a single pass over the name table of
+        the scaffold layout.'''
+        scaffolds.rename(self.update_scaffold_map)
         return scaffolds
 
 def cmp_assembly_map_entries(frag1, frag2):
@@ -352,21 +588,63 @@ def cmp_assembly_map_entries(frag1, frag2):
             raise BadContigNameError("contigs {0} and {1} repeated??".format(frag1[0], frag2[0]))
     return order
 
-def extract_contig_info(name):
-    '''Assuming Juicebox contig breaking convention (":::fragment_n:::debris"), extract original contig name and
-    fragment index of a given contig (unbroken contigs are'''
-    names = {}
+# original contig name, fragment index (None if unbroken) and debris flag
+# parsed from a Juicebox contig name
+ContigNameInfo = namedtuple('ContigNameInfo', ['orig', 'index', 'debris'])
+
+def sort_assembly_map(assembly_map):
+    '''Sort assembly_map entries in place, grouping fragments by their
+    original contig and ordering the fragments of each broken contig by
+    their position in it. Equivalent to sorting with
+    cmp_assembly_map_entries, but each name is parsed only once.
+
+    Args:
+        assembly_map (list[(str, str)]): list containing contig
+            information from the .assembly file, as generated by
+            JuiceboxConverter._read_assembly
+
+    Raises:
+        BadContigNameError: if two entries are the same fragment of the
+            same contig, or an unbroken contig shares its name with a
+            broken one
+    '''
+    records = [(parse_contig_name(entry[0]), entry) for entry in assembly_map]
+    records.sort(key=lambda record: (record[0].orig, -1 if record[0].index is None else record[0].index))
+    for (info1, frag1), (info2, frag2) in zip(records, records[1:]):
+        if info1.orig != info2.orig:
+            continue
+        if info1.index is None or info2.index is None:
+            raise BadContigNameError("contig {0} or {1} is formatted as if broken but no fragment detected??".format(
+                                     frag1[0], frag2[0]))
+        if info1.index == info2.index:
+            raise BadContigNameError("contigs {0} and {1} repeated??".format(frag1[0], frag2[0]))
+    assembly_map[:] = [entry for info, entry in records]
+
+def parse_contig_name(name):
+    '''Assuming Juicebox contig breaking convention (":::fragment_n:::debris"), extract original contig name,
+    fragment index and debris flag of a given contig (unbroken contigs have an index of None)
+
+    Args:
+        name (str): the contig name
+
+    Returns:
+        ContigNameInfo: the original contig name, fragment index and
+            debris flag
+    '''
     frag_fields = name.split(":::")
-    if frag_fields[-1] == "debris":
+    debris = frag_fields[-1] == "debris"
+    if debris:
         frag_fields.pop()
 
     if len(frag_fields) == 1:
-        names["orig"] = frag_fields[0]
-        names["index"] = None
-    else:
-        names["orig"] = ":::".join(frag_fields[:-1])
-        names["index"] = int(frag_fields[-1].replace("fragment_", ""))
-    return names
+        return ContigNameInfo(frag_fields[0], None, debris)
+    return ContigNameInfo(":::".join(frag_fields[:-1]), int(frag_fields[-1].replace("fragment_", "")), debris)
+
+def extract_contig_info(name):
+    '''Assuming Juicebox contig breaking convention (":::fragment_n:::debris"), extract original contig name and
+    fragment index of a given contig (unbroken contigs have an index of None)'''
+    info = parse_contig_name(name)
+    return {"orig": info.orig, "index": info.index}
 
 
 class ProcessedAssembly:
@@ -377,52 +655,187 @@ class ProcessedAssembly:
     breaks that were introduced into the assembly by the .assembly file.
 
     Attributes:
-        sequences (dict[str:str]): dictionary mapping contig names to
-            their sequences
+        sequences (dict[str:str or SequenceView]): dictionary mapping
+            contig names to their sequences, either as strings or as
+            SequenceViews which are resolved when they are written
         assembly_map (list[(str, str)]: list containing contig
             information from the .assembly file, as generated by
             JuiceboxConverter._read_assembly
-        scaffolds (list[list[(str, str, str, bool)): list containing
-            scaffold information from the .assembly file, as generated by
-            JuiceboxConverter._read_assembly
+        scaffolds (ScaffoldLayout): the contigs placed on each scaffold
+            of the .assembly file, as generated by
+            JuiceboxConverter._read_assembly. A list of scaffolds in the
+            older list of tuples representation is converted on
+            construction.
         simple_chr_names (bool): whether to use simple chromosome names
             ("ChromosomeX") for scaffolds instead of detailed chromosome
             names ("PGA_scaffold_X__Y_contigs__length_Z"). Has no effect
             in contig_mode.
+        source_fasta (str): path to the fasta the sequences were read
+            from, if known. Needed to reuse a previous run's FASTA output
+            in write_outputs.
+        metrics (Metrics): where write_outputs and the write_* methods
+            record the time, memory and I/O of writing, or None not to
+            measure them
+        store (SequenceDict or IndexedFasta): the sequence store the
+            sequences were read from, released by close(), or None
     '''
     def __init__(self, sequences, assembly_map, scaffolds,
-                 simple_chr_names=False):
+                 simple_chr_names=False, source_fasta=None, metrics=None, store=None):
         self.sequences = sequences
+        self.store = store
         self.assembly_map = assembly_map
-        self.scaffolds = scaffolds
-        self.contig_mode = scaffolds[0][0][3]
+        self.scaffolds = ScaffoldLayout.from_scaffolds(scaffolds)
+        self.contig_mode = self.scaffolds.contig_mode
         self.simple_chr_names = simple_chr_names
+        self.source_fasta = source_fasta
+        self.metrics = metrics
         self.gap_size = 100
-        self.complements = {
-                                'A' : 'T',
-                                'C' : 'G',
-                                'G' : 'C',
-                                'T' : 'A',
-                                'a' : 't',
-                                'c' : 'g',
-                                'g' : 'c',
-                                't' : 'a',
-                                'N' : 'N',
-                                'n' : 'n'
-                            }
-
-    def write_fasta(self, outfile, verbose=False):
-        '''Write FASTA output to a specified file
+        self.scaffolds.compute_positions(self.gap_size)
+        self._scaffold_table = self._build_scaffold_table()
+        self._scaffold_table_key = (self.gap_size, self.simple_chr_names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''Release the sequence store, closing the file and memory map of
+        an indexed or cached fasta. Outputs cannot be written after.'''
+        _close_store(self.store)
+        self.store = None
+
+    def scaffold_table(self):
+        '''Return the name, length, contig count and gap count of every
+        scaffold, as computed when the ProcessedAssembly was built. The
+        table is only rebuilt if gap_size or simple_chr_names has been
+        changed since.
+
+        Returns:
+            list[ScaffoldInfo]: the scaffolds, in output order
+        '''
+        key = (self.gap_size, self.simple_chr_names)
+        if key != self._scaffold_table_key:
+            self._scaffold_table = self._build_scaffold_table()
+            self._scaffold_table_key = key
+        return self._scaffold_table
+
+    def summary(self):
+        '''Summarize the size of the output assembly
+
+        Returns:
+            AssemblySummary: counts of scaffolds, contigs and gaps, the
+                total and longest scaffold lengths, the scaffold N50,
+                L50, N90 and L90, and the contig N50 and L50
+        '''
+        table = self.scaffold_table()
+        lengths = [scaffold.length for scaffold in table]
+        n50, l50 = n_stat(lengths, 0.5)
+        n90, l90 = n_stat(lengths, 0.9)
+        contig_n50, contig_l50 = n_stat(self.scaffolds.lengths, 0.5)
+        return AssemblySummary(len(table), len(self.scaffolds.lengths), sum(s.gap_count for s in table),
+                               sum(lengths), max(lengths) if lengths else 0, n50, l50, n90, l90,
+                               contig_n50, contig_l50)
+
+    def write_outputs(self, fasta=None, agp=None, bed=None, break_report=None, verbose=False,
+                      threads=1, manifest=None):
+        '''Write any combination of FASTA, AGP, BED and break report
+        outputs in a single walk over the scaffolds, so coordinates and
+        scaffold names are computed once and none of the outputs is held
+        in memory. Outputs whose path is None are skipped. With more than
+        one thread, FASTA records are instead rendered by a pool of
+        worker processes and written in scaffold order. Paths ending in
+        .gz are bgzip compressed; for a compressed FASTA, .fai and .gzi
+        indices are written alongside it.
 
         Args:
-            outfile (str): path to the file to write to
+            fasta (str) [optional]: path to write FASTA output to
+            agp (str) [optional]: path to write AGP output to
+            bed (str) [optional]: path to write BED output to
+            break_report (str) [optional]: path to write the break
+                report to
             verbose (bool) [optional]: print output describing processing
                 steps to stdout. Otherwise silent. Default: False
+            threads (int) [optional]: number of worker processes to use
+                to render FASTA records, and of threads to use for bgzip
+                compression. Default: 1
+            manifest (str) [optional]: path of a manifest recording the
+                scaffold layout of the FASTA output. If a manifest left
+                by a previous run matches the current fasta and FASTA
+                output, scaffolds whose contigs are unchanged are copied
+                from the previous FASTA output instead of being rendered
+                again. The manifest is then rewritten for the next run.
+                Ignored for bgzip output. Default: None
         '''
+        with measure_stage(self.metrics, 'write_outputs'):
+            self._write_outputs(fasta, agp, bed, break_report, verbose, threads, manifest)
+
+    def _write_outputs(self, fasta=None, agp=None, bed=None, break_report=None, verbose=False,
+                       threads=1, manifest=None):
+        '''Write outputs as described in write_outputs, without measuring
+        them as a stage, so the write_* methods can measure themselves'''
+        outputs = [('FASTA', fasta), ('AGP', agp), ('BED', bed), ('break report', break_report)]
+        handles = dict()
+        fasta_writer = None
+        if manifest is not None and (fasta is None or fasta.endswith('.gz')):
+            manifest = None
+        previous = self._read_manifest(manifest, fasta) if manifest is not None else None
+        try:
+            for label, outfile in outputs:
+                if outfile is not None:
+                    if verbose:
+                        print('Writing {0} to {1}...'.format(label, outfile))
+                        sys.stdout.flush()
+                    if label == 'FASTA' and previous is not None:
+                        # the previous output is read while the new one is
+                        # written, so write alongside it and swap at the end
+                        outfile += '.tmp'
+                    handles[label] = open_output(outfile, threads=threads, buffering=_WRITE_BUFFER_SIZE)
+            if 'break report' in handles:
+                self._write_break_report(handles['break report'])
+            if previous is not None:
+                if 'AGP' in handles or 'BED' in handles:
+                    self._write_layout(agp_handle=handles.get('AGP'), bed_handle=handles.get('BED'))
+                fasta_writer = self._write_fasta_incremental(handles['FASTA'], fasta, previous, threads,
+                                                             verbose=verbose)
+            elif threads > 1 and 'FASTA' in handles and _render_context(self.store) is not None:
+                if 'AGP' in handles or 'BED' in handles:
+                    self._write_layout(agp_handle=handles.get('AGP'), bed_handle=handles.get('BED'))
+                fasta_writer = self._write_fasta_parallel(handles['FASTA'], threads, verbose=verbose)
+            elif 'FASTA' in handles or 'AGP' in handles or 'BED' in handles:
+                fasta_writer = self._write_layout(fasta_handle=handles.get('FASTA'), agp_handle=handles.get('AGP'),
+                                                  bed_handle=handles.get('BED'), verbose=verbose)
+        finally:
+            for handle in handles.values():
+                handle.close()
+        if isinstance(handles.get('FASTA'), BgzfWriter):
+            # bgzip output is only useful with the indices samtools needs
+            # to randomly access it
+            write_fai(fasta_writer.fai_entries, fasta + '.fai')
+            handles['FASTA'].write_gzi(fasta + '.gzi')
+        if previous is not None:
+            os.rename(fasta + '.tmp', fasta)
+        if manifest is not None:
+            self._write_manifest(manifest, fasta, fasta_writer)
         if verbose:
-            print('Writing FASTA to {0}...'.format(outfile))
-            sys.stdout.flush()
-        self._write_file(outfile, self.fasta(verbose=verbose), verbose=verbose)
+            print('Writing complete\n')
+
+    def write_fasta(self, outfile, verbose=False, threads=1):
+        '''Write FASTA output to a specified file. Sequence is streamed
+        to the file one contig at a time rather than building the whole
+        FASTA in memory first, so peak memory is bounded by the largest
+        contig instead of the size of the assembly.
+
+        Args:
+            outfile (str): path to the file to write to
+            verbose (bool) [optional]: print output describing processing
+                steps to stdout. Otherwise silent. Default: False
+            threads (int) [optional]: number of worker processes to use
+                to render FASTA records. Default: 1
+        '''
+        with measure_stage(self.metrics, 'write_fasta'):
+            self._write_outputs(fasta=outfile, verbose=verbose, threads=threads)
 
     def write_agp(self, outfile, verbose=False):
         '''Write AGP output to a specified file
@@ -432,10 +845,8 @@ class ProcessedAssembly:
             verbose (bool) [optional]: print output describing processing
                 steps to stdout. Otherwise silent. Default: False
         '''
-        if verbose:
-            print('Writing AGP to {0}...'.format(outfile))
-            sys.stdout.flush()
-        self._write_file(outfile, self.agp(), verbose=verbose)
+        with measure_stage(self.metrics, 'write_agp'):
+            self._write_outputs(agp=outfile, verbose=verbose)
 
     def write_bed(self, outfile, verbose=False):
         '''Write BED output to a specified file
@@ -445,10 +856,8 @@ class ProcessedAssembly:
             verbose (bool) [optional]: print output describing processing
                 steps to stdout. Otherwise silent. Default: False
         '''
-        if verbose:
-            print('Writing BED to {0}...'.format(outfile))
-            sys.stdout.flush()
-        self._write_file(outfile, self.bed(), verbose=verbose)
+        with measure_stage(self.metrics, 'write_bed'):
+            self._write_outputs(bed=outfile, verbose=verbose)
 
     def write_break_report(self, outfile, verbose=False):
         '''Write a report about breaks shown in the .assembly file to a
@@ -459,253 +868,564 @@ class ProcessedAssembly:
             verbose (bool) [optional]: print output describing processing
                 steps to stdout. Otherwise silent. Default: False
         '''
-        if verbose:
-            print('Writing break report to {0}...'.format(outfile))
-            sys.stdout.flush()
-        self._write_file(outfile, self.break_report(), verbose=verbose)
+        with measure_stage(self.metrics, 'write_break_report'):
+            self._write_outputs(break_report=outfile, verbose=verbose)
 
     def fasta(self, verbose=False):
         '''Generate a FASTA format representation of the
-        ProcessedAssembly
+        ProcessedAssembly, built from iter_scaffold_sequences(). This
+        holds the entire FASTA in memory; use write_fasta() or
+        stream_fasta() for large assemblies.
+
+        Args:
+            verbose (bool) [optional]: print output describing processing
+                steps to stdout. Otherwise silent. Default: False
 
         Returns:
             list[str]: list of strings representing the ProcessedAssembly
                 in FASTA format
+        '''
+        if verbose:
+            print('Generating FASTA for {0} scaffolds'.format(len(self.scaffolds)))
+        buf = _ListWriter()
+        fasta_writer = _WrappedFastaWriter(buf)
+        progress = start_progress('Generating FASTA', verbose, total=self._total_length())
+        for record in self.iter_scaffold_sequences():
+            fasta_writer.start_record(record.name)
+            fasta_writer.write(record.sequence)
+            if progress is not None:
+                progress.update(len(record.sequence))
+        if progress is not None:
+            progress.finish()
+        return buf.lines()
+
+    def stream_fasta(self, handle, verbose=False):
+        '''Write a FASTA format representation of the ProcessedAssembly
+        to an open handle, one contig (or reverse complemented contig) at
+        a time. Line wrapping is carried across contig and gap boundaries,
+        so the output is identical to fasta().
+
+        Args:
+            handle (file): an open, writable text handle
             verbose (bool) [optional]: print output describing processing
                 steps to stdout. Otherwise silent. Default: False
         '''
-        ret = list()
-        contig_counter = 0
-        contig_only_print_scalar = 100
-        dots_on_line = 0
-        for index, scaffold in enumerate(self.scaffolds):
-            scaffold_name = self._make_scaffold_name(index+1, scaffold)
-            ret.append('>' + scaffold_name + '\n')
-            seq = ''
-            for contig in scaffold:
-                if verbose and contig_counter % (10 * (contig_only_print_scalar if len(scaffold) == 1 else 1)) == 0:
-                    if dots_on_line == 40 and contig_counter > 0:
-                        dots_on_line = 0
-                        print('')
-                    print('.', end='')
-                    dots_on_line += 1
-                    sys.stdout.flush()
-                contig_counter += 1
-                seq += self.sequences[contig[0]] if contig[2] == '+' else self._reverse_complement(self.sequences[contig[0]])
-                if contig != scaffold[-1]:
-                    seq += 'n' * self.gap_size
-            ret += self._chunk_sequence(seq)
-        ret[-1] = ret[-1].strip()
-        if verbose and contig_counter % (10 * (contig_only_print_scalar if len(scaffold) == 1 else 1))  != 0 and contig_counter > 0:
-            print('')
-        return ret
+        self._write_layout(fasta_handle=handle, verbose=verbose)
 
     def agp(self):
         '''Generate an AGP format representation of the
-        ProcessedAssembly
+        ProcessedAssembly, built from iter_agp_records()
 
         Returns:
             list[str]: list of strings representing the ProcessedAssembly
                 in AGP format
         '''
-        ret = list()
-        ret.append('##agp-version 2.1\n')
-        ret.append('# This file was generated by converting juicebox assembly format\n')
-        for index, scaffold in enumerate(self.scaffolds):
-            scaffold_name = self._make_scaffold_name(index+1, scaffold)
-            if not self.contig_mode:
-                scaffold_name = scaffold_name.split()[0]
-            offset_coord = 1
-            part_number = 1
-            for contig in scaffold:
-                ret.append(self._make_agp_line(scaffold_name, contig, offset_coord, part_number))
-                offset_coord += int(contig[1])
-                part_number += 1
-                if contig != scaffold[-1]:
-                    ret.append(self._make_agp_gap_line(scaffold_name, offset_coord, part_number))
-                    offset_coord += self.gap_size
-                    part_number += 1
-        ret[-1] = ret[-1].strip()
-        return ret
+        lines = list(_AGP_HEADER)
+        lines.extend(format_record(record) for record in self.iter_agp_records())
+        return _trim_last_newline(lines)
 
     def bed(self):
         '''Generate a BED format representation of the
-        ProcessedAssembly
+        ProcessedAssembly, built from iter_bed_records()
 
         Returns:
             list[str]: list of strings representing the ProcessedAssembly
                 in BED format
         '''
-        ret = list()
-        ret.append('##bed file\n')
-        ret.append('# This file was generated by converting juicebox assembly format\n')
-        gap_number = 1
-        for index, scaffold in enumerate(self.scaffolds):
-            scaffold_name = self._make_scaffold_name(index+1, scaffold)
-            if not self.contig_mode:
-                scaffold_name = scaffold_name.split()[0]
-            offset_coord = 0
-            for contig in scaffold:
-                ret.append(self._make_bed_line(scaffold_name, contig, offset_coord))
-                offset_coord += int(contig[1])
-                if contig != scaffold[-1]:
-                    ret.append(self._make_bed_gap_line(scaffold_name, offset_coord, gap_number))
-                    offset_coord += self.gap_size
-                    gap_number += 1
-        ret[-1] = ret[-1].strip()
-        return ret
+        lines = list(_BED_HEADER)
+        lines.extend(format_record(record) for record in self.iter_bed_records())
+        return _trim_last_newline(lines)
 
     def break_report(self):
-        '''Generate a report about breaks shown in the .assembly file
+        '''Generate a report about breaks shown in the .assembly file,
+        built from iter_break_records()
 
         Returns:
             list[str]: list of strings summarizing the breaks present in
                 the ProcessedAssembly
         '''
-        ret = list()
-        break_count = 0
-        broken_orig_contigs = set()
+        lines = self._break_report_header()
+        lines.extend(format_record(record) for record in self.iter_break_records())
+        return lines
+
+    def iter_agp_records(self):
+        '''Lazily generate the lines of the AGP output, other than its
+        header, as records
+
+        Yields:
+            AgpRecord or AgpGapRecord: the next contig or gap placed on
+                a scaffold, in output order
+        '''
+        for part in self._iter_parts():
+            if part.placement is None:
+                yield self._make_agp_gap_record(part.object, part.offset + 1, part.part_number)
+            else:
+                yield self._make_agp_record(part.object, part.placement, part.offset + 1, part.part_number)
+
+    def iter_bed_records(self):
+        '''Lazily generate the lines of the BED output, other than its
+        header, as records
+
+        Yields:
+            BedRecord or BedGapRecord: the next contig or gap placed on a
+                scaffold, in output order
+        '''
+        for part in self._iter_parts():
+            if part.placement is None:
+                yield self._make_bed_gap_record(part.object, part.offset, part.gap_number)
+            else:
+                yield self._make_bed_record(part.object, part.placement, part.offset)
+
+    def iter_scaffold_sequences(self):
+        '''Lazily generate the name and full sequence of each scaffold,
+        in output order. Only one scaffold's sequence is held at a time.
+
+        Yields:
+            ScaffoldSequence: the next scaffold
+        '''
+        gap = 'n' * self.gap_size
+        layout = self.scaffolds
+        for index in range(len(layout)):
+            pieces = list()
+            for placement in layout.placements(index):
+                if pieces:
+                    pieces.append(gap)
+                sequence = self._sequence(layout.name(placement))
+                pieces.append(reverse_complement(sequence) if layout.reverse[placement] else sequence)
+            yield ScaffoldSequence(self._make_scaffold_name(index), ''.join(pieces))
+
+    def iter_break_records(self):
+        '''Lazily generate the lines of the break report, other than its
+        header, as records
+
+        Yields:
+            BreakRecord: the next fragment of a broken contig, in the
+                order of the .assembly file
+        '''
         break_offsets = defaultdict(int)
         for contig in self.assembly_map:
             fragment_name = contig[0]
-            fragment_size = contig[1]
             if ':::fragment' in fragment_name:
                 orig_contig = fragment_name.split(':::fragment')[0]
+                fragment_size = int(contig[1])
                 break_start = break_offsets[orig_contig]
-                break_end = break_start + int(fragment_size)
-                line = '\t'.join([
-                                    orig_contig,
-                                    fragment_name,
-                                    str(break_start),
-                                    str(break_end),
-                                    fragment_size
-                                ])
-                ret.append(line + '\n')
-                if ':::debris' in fragment_name:
-                    break_count += 1
-                broken_orig_contigs.add(orig_contig)
-                break_offsets[orig_contig] += int(fragment_size)
-        ret.insert(0, '#orig_contig\tfragment\tbreak_start\tbreak_end\tfragment_len\n')
-        ret.insert(0, '#{0} total breaks in {1} contigs\n'.format(break_count, len(broken_orig_contigs)))
-        #ret[-1] = ret[-1].strip()
-        return ret
+                yield BreakRecord(orig_contig, fragment_name, break_start, break_start + fragment_size, fragment_size)
+                break_offsets[orig_contig] += fragment_size
 
-    def _write_file(self, outfile, contents, verbose=False):
-        '''Write contents to a specified file
+    def _iter_parts(self):
+        '''Walk the scaffolds, reading the position of each contig and
+        gap placed on them from the precomputed scaffold layout.
+
+        Yields:
+            _LayoutPart: the next contig or gap, in output order
+        '''
+        layout = self._layout()
+        positions = layout.positions
+        lengths = layout.lengths
+        gap_number = 1
+        for index in range(len(layout)):
+            scaffold_name = self._make_scaffold_name(index)
+            layout_name = scaffold_name if self.contig_mode else scaffold_name.split()[0]
+            placements = layout.placements(index)
+            last = placements[-1]
+            part_number = 1
+            for placement in placements:
+                yield _LayoutPart(index, scaffold_name, layout_name, placement, positions[placement], part_number,
+                                  None)
+                part_number += 1
+                if placement != last:
+                    yield _LayoutPart(index, scaffold_name, layout_name, None,
+                                      positions[placement] + lengths[placement], part_number, gap_number)
+                    part_number += 1
+                    gap_number += 1
+
+    def _write_layout(self, fasta_handle=None, agp_handle=None, bed_handle=None, verbose=False):
+        '''Walk the scaffolds once, writing FASTA, AGP and BED output to
+        whichever of the handles are given.
 
         Args:
-            outfile (str): path to the file to write to
-            contents (list[str]): list of strings to write to a file
+            fasta_handle (file) [optional]: handle to write FASTA to
+            agp_handle (file) [optional]: handle to write AGP to
+            bed_handle (file) [optional]: handle to write BED to
             verbose (bool) [optional]: print output describing processing
                 steps to stdout. Otherwise silent. Default: False
+
+        Returns:
+            _WrappedFastaWriter: the writer used for FASTA output, or None
+                if no FASTA handle was given
         '''
-        with open(outfile, 'w') as f:
-            f.writelines(contents)
+        fasta_writer = _WrappedFastaWriter(fasta_handle) if fasta_handle is not None else None
+        agp_writer = _LineWriter(agp_handle) if agp_handle is not None else None
+        bed_writer = _LineWriter(bed_handle) if bed_handle is not None else None
+        verbose = verbose and fasta_writer is not None
+        if agp_writer is not None:
+            for line in _AGP_HEADER:
+                agp_writer.write(line)
+        if bed_writer is not None:
+            for line in _BED_HEADER:
+                bed_writer.write(line)
+        progress = None
         if verbose:
-            print('Writing complete\n')
+            progress = start_progress('Writing FASTA', verbose, total=self._total_length())
+        for part in self._iter_parts():
+            placement = part.placement
+            if placement is None:
+                if agp_writer is not None:
+                    agp_writer.write(format_record(self._make_agp_gap_record(part.object, part.offset + 1,
+                                                                             part.part_number)))
+                if bed_writer is not None:
+                    bed_writer.write(format_record(self._make_bed_gap_record(part.object, part.offset,
+                                                                             part.gap_number)))
+                if fasta_writer is not None:
+                    fasta_writer.write('n' * self.gap_size)
+                if progress is not None:
+                    progress.update(self.gap_size)
+                continue
+            if fasta_writer is not None and part.part_number == 1:
+                fasta_writer.start_record(part.scaffold_name)
+            if agp_writer is not None:
+                agp_writer.write(format_record(self._make_agp_record(part.object, placement, part.offset + 1,
+                                                                     part.part_number)))
+            if bed_writer is not None:
+                bed_writer.write(format_record(self._make_bed_record(part.object, placement, part.offset)))
+            if fasta_writer is not None:
+                self._write_contig_sequence(fasta_writer, placement)
+            if progress is not None:
+                progress.update(self.scaffolds.lengths[placement])
+        if progress is not None:
+            progress.finish()
+        if fasta_writer is not None:
+            fasta_writer.finish()
+        return fasta_writer
+
+    def _write_contig_sequence(self, fasta_writer, placement):
+        '''Write the sequence of a contig, reverse complemented if it is
+        placed on the - strand, to a _WrappedFastaWriter. The sequence is
+        read and written in chunks, so a long contig is never held whole.
 
-    def _make_scaffold_name(self, index, scaffold):
-        '''Construct a string that shows the proper name of a scaffold.
-        If running in contig_mode, just use the name of the contig
-        instead.
-
-        Args:
-            index (int): the index of the scaffold
-            scaffold list[(str, str, str, bool)]: a list of tuples
-                reflecting the scaffold. Each tuple conforms to the
-                schema used in JuiceboxConverter._read_assembly
-                str: the contig name
-                str: the contig length
-                str: the contig strand (+ or -)
-                bool: whether the contig was placed using contig_mode
-                    or not
-        '''
-        if self.contig_mode:
-            scaffold_name = '{0}'.format(scaffold[0][0]).replace(":::", "___")
-        elif self.simple_chr_names:
-            if len(scaffold) > 1:
-                scaffold_name = 'Chromosome{0}'.format(index)
-            else:
-                #use the contig name style in this mode
-                scaffold_name = '{0}'.format(scaffold[0][0]).replace(":::", "___")
+        Args:
+            fasta_writer (_WrappedFastaWriter): the writer to write to
+            placement (int): the index of the contig's placement in the
+                scaffold layout
+        '''
+        for chunk in iter_sequence_chunks(self.sequences[self.scaffolds.name(placement)],
+                                          reverse=self.scaffolds.reverse[placement]):
+            fasta_writer.write(chunk)
+
+    def _render_fasta_record(self, index):
+        '''Render the FASTA record of a single scaffold
+
+        Args:
+            index (int): the 0-based index of the scaffold
+
+        Returns:
+            str: the FASTA record, without a trailing newline
+        '''
+        placements = self.scaffolds.placements(index)
+        buf = _ListWriter()
+        fasta_writer = _WrappedFastaWriter(buf)
+        fasta_writer.start_record(self._make_scaffold_name(index))
+        for placement in placements:
+            self._write_contig_sequence(fasta_writer, placement)
+            if placement != placements[-1]:
+                fasta_writer.write('n' * self.gap_size)
+        return ''.join(buf.chunks)
+
+    def _write_fasta_parallel(self, handle, threads, verbose=False):
+        '''Render FASTA records in a pool of worker processes and write
+        them to a handle in scaffold order. Only a few records per
+        worker are rendered ahead of the writer, so memory stays bounded
+        by the largest scaffolds rather than the whole FASTA. Workers
+        are given this ProcessedAssembly when they start. They are
+        forked wherever possible, so it is inherited rather than copied;
+        see _render_context.
+
+        Args:
+            handle (file): an open, writable text handle
+            threads (int): the number of worker processes to use
+            verbose (bool) [optional]: show progress on stderr.
+                Default: False
+
+        Returns:
+            _WrappedFastaWriter: the writer used for FASTA output
+        '''
+        fasta_writer = _WrappedFastaWriter(handle)
+        table = self.scaffold_table()
+        progress = start_progress('Writing FASTA', verbose, total=self._total_length())
+        pool = _render_context(self.store).Pool(threads, initializer=_init_render_worker, initargs=(self,))
+        try:
+            records = _imap_bounded(pool, _render_fasta_record, range(len(self.scaffolds)), threads)
+            for index, record in enumerate(records):
+                fasta_writer.write_record(record)
+                if progress is not None:
+                    progress.update(table[index].length)
+            fasta_writer.finish()
+            if progress is not None:
+                progress.finish()
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return fasta_writer
+
+    def _write_fasta_incremental(self, handle, previous_fasta, previous, threads, verbose=False):
+        '''Write FASTA records to a handle, copying the sequence of each
+        scaffold whose signature is in a previous run's manifest from the
+        previous FASTA output and rendering only the others, in a pool of
+        worker processes if threads > 1 and _render_context allows it.
+
+        Args:
+            handle (file): an open, writable text handle
+            previous_fasta (str): path to the previous FASTA output
+            previous (dict[str:(int, int)]): maps the signature of each
+                scaffold in the previous output to the byte offset and
+                byte length of its wrapped sequence, as read by
+                _read_manifest
+            threads (int): the number of worker processes to use
+            verbose (bool) [optional]: print output describing processing
+                steps to stdout. Otherwise silent. Default: False
+
+        Returns:
+            _WrappedFastaWriter: the writer used for FASTA output
+        '''
+        fasta_writer = _WrappedFastaWriter(handle)
+        signatures = [self._scaffold_signature(index) for index in range(len(self.scaffolds))]
+        changed = [index for index, signature in enumerate(signatures) if signature not in previous]
+        if verbose:
+            print('Reusing {0} of {1} scaffolds from the previous FASTA output'.format(
+                len(signatures) - len(changed), len(signatures)))
+        table = self.scaffold_table()
+        progress = start_progress('Writing FASTA', verbose, total=self._total_length())
+        pool = None
+        context = _render_context(self.store) if threads > 1 and len(changed) > 1 else None
+        if context is not None:
+            pool = context.Pool(threads, initializer=_init_render_worker, initargs=(self,))
+            rendered = _imap_bounded(pool, _render_fasta_record, changed, threads)
         else:
-            contig_count = len(scaffold)
-            scaffold_length = 0
-            for contig in scaffold:
-                scaffold_length += int(contig[1])
-                if contig != scaffold[-1]:
-                    scaffold_length += self.gap_size
-            scaffold_name = 'PGA_scaffold_{0}__{1}_contigs__length_{2}'.format(index,
-                                                                               contig_count,
-                                                                               scaffold_length)
-        return scaffold_name
-
-    def _chunk_sequence(self, sequence, line_len=80):
-        '''Process a long string representation of a sequence into a list
-        of chunks that are line_len long (the last string may be shorter)
-
-        Args:
-            sequence (str): the sequence to chunk
-            line_len (int) [optional]: the length of the lines to break
-                the sequence into. The last line may be shorter as it
-                will be the remainder after chunking the rest of the
-                sequence. Default: 80
+            rendered = (self._render_fasta_record(index) for index in changed)
+        try:
+            with open(previous_fasta, 'rb') as f:
+                old_fasta = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    for index, signature in enumerate(signatures):
+                        if signature in previous:
+                            offset, size = previous[signature]
+                            record = '>{0}\n{1}'.format(self._make_scaffold_name(index),
+                                                        _to_str(old_fasta[offset:offset+size]))
+                        else:
+                            record = next(rendered)
+                        fasta_writer.write_record(record)
+                        if progress is not None:
+                            progress.update(table[index].length)
+                finally:
+                    old_fasta.close()
+            fasta_writer.finish()
+            if progress is not None:
+                progress.finish()
+            if pool is not None:
+                pool.close()
+        except BaseException:
+            if pool is not None:
+                pool.terminate()
+            raise
+        finally:
+            if pool is not None:
+                pool.join()
+        return fasta_writer
+
+    def _scaffold_signature(self, index):
+        '''Compute a signature of the sequence of a scaffold, which is
+        the same for two scaffolds exactly when they are built from the
+        same slices of the same source sequences in the same order and
+        orientations.
+
+        Args:
+            index (int): the 0-based index of the scaffold
+
+        Returns:
+            str: the signature
+        '''
+        layout = self.scaffolds
+        parts = list()
+        for placement in layout.placements(index):
+            name = layout.name(placement)
+            strand = layout.strand(placement)
+            sequence = self.sequences[name]
+            if isinstance(sequence, SequenceView):
+                parts.append('{0}\t{1}\t{2}\t{3}'.format(sequence.name, sequence.start, sequence.end, strand))
+            else:
+                parts.append('{0}\t0\t{1}\t{2}'.format(name, len(sequence), strand))
+        return hashlib.sha1(_to_bytes('\n'.join(parts))).hexdigest()
+
+    def _read_manifest(self, manifest, fasta):
+        '''Read the manifest left by a previous run, if it can be used to
+        reuse that run's FASTA output: it must describe the same source
+        fasta, gap size and line length, and the FASTA output must not
+        have changed since.
+
+        Args:
+            manifest (str): path to the manifest
+            fasta (str): path to the FASTA output
+
+        Returns:
+            dict[str:(int, int)]: maps the signature of each scaffold in
+                the previous FASTA output to the byte offset and byte
+                length of its wrapped sequence, or None if there is no
+                usable manifest
+        '''
+        if self.source_fasta is None or not os.path.exists(manifest) or not os.path.exists(fasta):
+            return None
+        try:
+            with open(manifest) as f:
+                contents = json.load(f)
+        except ValueError:
+            return None
+        if contents.get('version') != _MANIFEST_VERSION \
+                or contents.get('source_fasta') != file_signature(self.source_fasta) \
+                or contents.get('gap_size') != self.gap_size \
+                or contents.get('line_len') != _FASTA_LINE_LEN \
+                or contents.get('fasta') != file_signature(fasta):
+            return None
+        return dict((signature, (offset, size)) for signature, offset, size in contents['scaffolds'])
+
+    def _write_manifest(self, manifest, fasta, fasta_writer):
+        '''Write a manifest recording where the sequence of each scaffold
+        lies in the FASTA output, for reuse by a later run.
+
+        Args:
+            manifest (str): path to write the manifest to
+            fasta (str): path to the FASTA output
+            fasta_writer (_WrappedFastaWriter): the writer that wrote the
+                FASTA output
+        '''
+        if self.source_fasta is None:
+            return
+        scaffolds = list()
+        for index, entry in enumerate(fasta_writer.fai_entries):
+            size = entry.length + (entry.length - 1) // fasta_writer.line_len if entry.length else 0
+            scaffolds.append([self._scaffold_signature(index), entry.offset, size])
+        contents = {'version': _MANIFEST_VERSION,
+                    'source_fasta': file_signature(self.source_fasta),
+                    'gap_size': self.gap_size,
+                    'line_len': fasta_writer.line_len,
+                    'fasta': file_signature(fasta),
+                    'scaffolds': scaffolds}
+        with open(manifest + '.tmp', 'w') as f:
+            json.dump(contents, f)
+        os.rename(manifest + '.tmp', manifest)
+
+    def _write_break_report(self, handle):
+        '''Write the break report to a handle. The summary at the top of
+        the report is computed in a first pass over assembly_map, so the
+        lines themselves can be written as they are generated.
+
+        Args:
+            handle (file): an open, writable text handle
+        '''
+        for line in self._break_report_header():
+            handle.write(line)
+        for record in self.iter_break_records():
+            handle.write(format_record(record))
+
+    def _break_report_header(self):
+        '''Summarize the breaks in assembly_map as the header lines of
+        the break report
+
+        Returns:
+            list[str]: the header lines
+        '''
+        break_count = 0
+        broken_orig_contigs = set()
+        for contig in self.assembly_map:
+            fragment_name = contig[0]
+            if ':::fragment' in fragment_name:
+                if ':::debris' in fragment_name:
+                    break_count += 1
+                broken_orig_contigs.add(fragment_name.split(':::fragment')[0])
+        return ['#{0} total breaks in {1} contigs\n'.format(break_count, len(broken_orig_contigs)),
+                '#orig_contig\tfragment\tbreak_start\tbreak_end\tfragment_len\n']
+
+    def _make_scaffold_name(self, index):
+        '''Look up the name of a scaffold in the scaffold table
+
+        Args:
+            index (int): the 0-based index of the scaffold in the
+                scaffold layout
 
         Returns:
-            list(str): a list of strings reflecting the input sequence
-                broken into chunks
+            str: the name of the scaffold
         '''
-        chunked_sequence = list()
-        len_added = 0
-        while len(sequence) - len_added > line_len:
-            chunked_sequence.append(sequence[len_added:len_added+line_len] + '\n')
-            len_added += line_len
-        if len(sequence) - len_added > 0:
-            chunked_sequence.append(sequence[len_added:] + '\n')
-        return chunked_sequence
+        return self.scaffold_table()[index].name
 
-    def _make_agp_line(self, scaffold_name, contig, offset_coord, part_number):
-        '''Make a line for an AGP file reflecting the positioning of a
-        single contig.
+    def _build_scaffold_table(self):
+        '''Construct the name, length, contig count and gap count of every
+        scaffold. Scaffolds are named "PGA_scaffold_X__Y_contigs__length_Z",
+        or "ChromosomeX" with simple_chr_names. If running in
+        contig_mode, or with simple_chr_names for a single-contig
+        scaffold, the name of the contig is used instead.
+
+        Returns:
+            list[ScaffoldInfo]: the scaffolds, in output order
+        '''
+        layout = self._layout()
+        table = list()
+        for index in range(len(layout)):
+            first = layout.scaffold_offsets[index]
+            contig_count = layout.contig_count(index)
+            if self.contig_mode or (self.simple_chr_names and contig_count == 1):
+                scaffold_name = '{0}'.format(layout.name(first)).replace(":::", "___")
+            elif self.simple_chr_names:
+                scaffold_name = 'Chromosome{0}'.format(index+1)
+            else:
+                scaffold_name = 'PGA_scaffold_{0}__{1}_contigs__length_{2}'.format(index+1,
+                                                                                   contig_count,
+                                                                                   layout.scaffold_lengths[index])
+            table.append(ScaffoldInfo(scaffold_name, layout.scaffold_lengths[index], contig_count,
+                                      contig_count - 1))
+        return table
+
+    def _total_length(self):
+        '''Return the total length of the scaffolds, including gaps'''
+        return sum(scaffold.length for scaffold in self.scaffold_table())
+
+    def _layout(self):
+        '''Return the scaffold layout, recomputing its coordinates first
+        if gap_size has changed since they were computed
+
+        Returns:
+            ScaffoldLayout: the scaffold layout
+        '''
+        if self.scaffolds.gap_size != self.gap_size:
+            self.scaffolds.compute_positions(self.gap_size)
+        return self.scaffolds
+
+    def _make_agp_record(self, scaffold_name, placement, offset_coord, part_number):
+        '''Make an AGP record reflecting the positioning of a single
+        contig.
 
         Args:
             scaffold_name (str): the name of the scaffold the contig is
                 placed on
-            contig ((str, str, str, bool)): tuple containing the name of
-                the contig and its length as strings. Matches the
-                representation of contigs in a scaffolds as
-                generated by JuiceboxConverter._read_assembly
+            placement (int): the index of the contig's placement in the
+                scaffold layout
             offset_coord (int): the offset of the contig in the scaffold
             part_number (int): the part number of the contig in the
                 scaffold
 
         Returns:
-            str: an AGP-format line reflecting the contig and other
+            AgpRecord: an AGP record reflecting the contig and other
                 inputs
         '''
-        scaff_start_coord = str(offset_coord)
-        scaff_end_coord = str(offset_coord + int(contig[1]) - 1)
-        elt_type = 'W'
-        contig_name = contig[0]
-        contig_start_coord = '1'
-        contig_end_coord = contig[1]
-        strand = contig[2]
-        line = '\t'.join([
-                            scaffold_name,
-                            scaff_start_coord,
-                            scaff_end_coord,
-                            str(part_number),
-                            elt_type,
-                            contig_name,
-                            contig_start_coord,
-                            contig_end_coord,
-                            strand
-                        ])
-        return line + '\n'
-
-    def _make_agp_gap_line(self, scaffold_name, offset_coord, part_number):
-        '''Make a line for an AGP file reflecting the positioning of a
-        gap in the scaffold.
+        layout = self.scaffolds
+        contig_len = layout.lengths[placement]
+        return AgpRecord(scaffold_name, offset_coord, offset_coord + contig_len - 1, part_number, 'W',
+                         layout.name(placement), 1, contig_len, layout.strand(placement))
+
+    def _make_agp_gap_record(self, scaffold_name, offset_coord, part_number):
+        '''Make an AGP record reflecting the positioning of a gap in the
+        scaffold.
 
         Args:
             scaffold_name (str): the name of the scaffold the gap is
@@ -715,64 +1435,35 @@ class ProcessedAssembly:
                 scaffold
 
         Returns:
-            str: an AGP-format line reflecting the gap and other
+            AgpGapRecord: an AGP record reflecting the gap and other
                 inputs
         '''
-        gap_start_coord = str(offset_coord)
-        gap_end_coord = str(offset_coord + self.gap_size - 1)
-        elt_type = 'U'
-        gap_size = str(self.gap_size)
-        gap_type = 'scaffold'
-        has_evidence = 'yes'
-        evidence_type = 'proximity_ligation'
-        line = '\t'.join([
-                        scaffold_name,
-                        gap_start_coord,
-                        gap_end_coord,
-                        str(part_number),
-                        elt_type,
-                        gap_size,
-                        gap_type,
-                        has_evidence,
-                        evidence_type
-                    ])
-        return line + '\n'
-
-    def _make_bed_line(self, scaffold_name, contig, offset_coord):
-        '''Make a line for a BED file reflecting the positioning of a
-        single contig.
+        return AgpGapRecord(scaffold_name, offset_coord, offset_coord + self.gap_size - 1, part_number, 'U',
+                            self.gap_size, 'scaffold', 'yes', 'proximity_ligation')
+
+    def _make_bed_record(self, scaffold_name, placement, offset_coord):
+        '''Make a BED record reflecting the positioning of a single
+        contig.
 
         Args:
             scaffold_name (str): the name of the scaffold the contig is
                 placed on
-            contig ((str, str, str, bool)): tuple containing the name of
-                the contig and its length as strings. Matches the
-                representation of contigs in a scaffolds as
-                generated by JuiceboxConverter._read_assembly
+            placement (int): the index of the contig's placement in the
+                scaffold layout
             offset_coord (int): the offset of the contig in the scaffold
 
         Returns:
-            str: a BED-format line reflecting the contig and other
+            BedRecord: a BED record reflecting the contig and other
                 inputs
         '''
-        start_coord = str(offset_coord)
-        end_coord = str(offset_coord + int(contig[1]))
-        contig_name = contig[0]
-        contig_len = contig[1]
-        strand = contig[2]
-        line = '\t'.join([
-                            scaffold_name,
-                            start_coord,
-                            end_coord,
-                            contig_name,
-                            contig_len,
-                            strand
-                        ])
-        return line + '\n'
-
-    def _make_bed_gap_line(self, scaffold_name, offset_coord, gap_number):
-        '''Make a line for a BED file reflecting the positioning of a
-        gap in the scaffold.
+        layout = self.scaffolds
+        contig_len = layout.lengths[placement]
+        return BedRecord(scaffold_name, offset_coord, offset_coord + contig_len, layout.name(placement), contig_len,
+                         layout.strand(placement))
+
+    def _make_bed_gap_record(self, scaffold_name, offset_coord, gap_number):
+        '''Make a BED record reflecting the positioning of a gap in the
+        scaffold.
 
         Args:
             scaffold_name (str): the name of the scaffold the gap is
@@ -781,19 +1472,26 @@ class ProcessedAssembly:
             gap_number (int): the index of the gap in the scaffold
 
         Returns:
-            str: a BED-format line reflecting the gap and other
+            BedGapRecord: a BED record reflecting the gap and other
                 inputs
         '''
-        start_coord = str(offset_coord)
-        end_coord = str(offset_coord + self.gap_size)
-        gap_name = 'pg_gap_{0}'.format(gap_number)
-        line = '\t'.join([
-                            scaffold_name,
-                            start_coord,
-                            end_coord,
-                            gap_name
-                        ])
-        return line + '\n'
+        return BedGapRecord(scaffold_name, offset_coord, offset_coord + self.gap_size,
+                            'pg_gap_{0}'.format(gap_number))
+
+    def _sequence(self, name):
+        '''Look up the sequence of a contig, resolving it if it is held
+        as a SequenceView
+
+        Args:
+            name (str): the name of the contig
+
+        Returns:
+            str: the sequence of the contig
+        '''
+        sequence = self.sequences[name]
+        if isinstance(sequence, SequenceView):
+            return sequence.resolve()
+        return sequence
 
     def _reverse_complement(self, sequence):
         '''Reverse complement a sequence
@@ -804,8 +1502,240 @@ class ProcessedAssembly:
         Returns:
             str: the reverse complement of the sequence
         '''
-        return ''.join(self.complements[x] for x in reversed(sequence))
+        return reverse_complement(sequence)
+
+
+
+class _WrappedFastaWriter(object):
+    '''Writes FASTA records to a handle, wrapping sequence into lines
+    of line_len characters. The current column is tracked between calls
+    to write(), so a record's sequence can be supplied in any number of
+    pieces (e.g. one per contig) and will still be wrapped as if it had
+    been written all at once. Matching ProcessedAssembly.fasta(), no
+    newline is written after the final line of the final record. The
+    .fai index entry of each record is recorded as it is written.
+
+    Attributes:
+        handle (file): the open, writable handle to write to
+        line_len (int): the length of sequence lines. Default: 80
+        fai_entries (list[FaiEntry]): index entries of the records
+            written so far; the current record's entry is added when the
+            next record starts or finish() is called
+    '''
+    def __init__(self, handle, line_len=_FASTA_LINE_LEN):
+        self.handle = handle
+        self.line_len = line_len
+        self.fai_entries = list()
+        self._column = 0
+        self._pending_newline = False
+        self._position = 0
+        self._record = None
+
+    def start_record(self, name):
+        '''Begin a new FASTA record, ending the previous record's last
+        line if needed.
+
+        Args:
+            name (str): the name to place on the header line
+        '''
+        self.finish()
+        text = ('\n' if self._pending_newline or self._column > 0 else '') + '>' + name
+        self.handle.write(text)
+        # names may hold characters encoded in more than one byte
+        self._position += len(_to_bytes(text))
+        self._record = [name, 0, self._position + 1]
+        self._pending_newline = True
+        self._column = 0
+
+    def write(self, sequence):
+        '''Append sequence to the current record.
 
+        Args:
+            sequence (str): the sequence to append
+        '''
+        if len(sequence) == 0:
+            return
+        line_len = self.line_len
+        pieces = ['\n'] if self._pending_newline else []
+        if self._pending_newline:
+            self._column = 0
+        first = line_len - self._column
+        pieces.append(sequence[:first])
+        for start in range(first, len(sequence), line_len):
+            pieces.append('\n')
+            pieces.append(sequence[start:start+line_len])
+            # write in batches of lines, so no wrapped copy of the whole
+            # sequence is built
+            if len(pieces) >= _WRITE_BATCH_PIECES:
+                self._write_text(''.join(pieces))
+                pieces = list()
+        if len(sequence) <= first:
+            self._column += len(sequence)
+        else:
+            self._column = (len(sequence) - first - 1) % line_len + 1
+        self._pending_newline = self._column == line_len
+        self._write_text(''.join(pieces))
+        self._record[1] += len(sequence)
+
+    def _write_text(self, text):
+        '''Write text to the handle, tracking the output position'''
+        self.handle.write(text)
+        self._position += len(text)
+
+    def write_record(self, record):
+        '''Append a complete record, as rendered by another
+        _WrappedFastaWriter with the same line_len.
+
+        Args:
+            record (str): the record, without a trailing newline
+        '''
+        self.finish()
+        text = ('\n' if self._pending_newline or self._column > 0 else '') + record
+        header_len = record.find('\n')
+        if header_len < 0:
+            header_len = len(record)
+        name = record[1:header_len].split()[0] if header_len > 1 else ''
+        # names may hold characters encoded in more than one byte
+        header_bytes = len(_to_bytes(record[:header_len]))
+        offset = self._position + len(text) - len(record) + header_bytes + 1
+        self.handle.write(text)
+        self._position += len(text) - header_len + header_bytes
+        self._record = [name, len(record) - header_len - record.count('\n'), offset]
+        self._pending_newline = True
+        self._column = 0
+
+    def finish(self):
+        '''Record the index entry of the current record, if any'''
+        if self._record is not None:
+            name, length, offset = self._record
+            linebases = min(length, self.line_len)
+            self.fai_entries.append(FaiEntry(name, length, offset, linebases, linebases + 1 if linebases else 0))
+            self._record = None
+
+
+def _close_store(store):
+    '''Close a sequence store that holds open files, such as an
+    IndexedFasta; a SequenceDict needs no closing'''
+    close = getattr(store, 'close', None)
+    if close is not None:
+        close()
+
+
+def _render_context(store):
+    '''Return the multiprocessing context to render FASTA records in, or
+    None if they must be rendered in this process. Workers are forked
+    wherever the platform supports it, so they inherit the sequences
+    instead of being sent a pickled copy. Where it does not, such as on
+    Windows, only an IndexedFasta store is worth sending, as it is
+    pickled by path; a SequenceDict holding the whole fasta is not.
+
+    Args:
+        store (SequenceDict or IndexedFasta): the sequence store of the
+            ProcessedAssembly being written, or None if not known
+    '''
+    if not hasattr(multiprocessing, 'get_context'):
+        # python 2 forks on every platform but Windows
+        if sys.platform != 'win32' or isinstance(store, IndexedFasta):
+            return multiprocessing
+        return None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    if isinstance(store, IndexedFasta):
+        return multiprocessing.get_context()
+    return None
+
+
+# the ProcessedAssembly whose FASTA records a worker process renders
+_RENDER_ASSEMBLY = None
+
+def _init_render_worker(assembly):
+    '''Initializer for worker processes used by
+    ProcessedAssembly._write_fasta_parallel'''
+    global _RENDER_ASSEMBLY
+    _RENDER_ASSEMBLY = assembly
+
+def _render_fasta_record(index):
+    '''Render the FASTA record of a scaffold in a worker process'''
+    return _RENDER_ASSEMBLY._render_fasta_record(index)
+
+# tasks submitted to a pool per worker process ahead of the results
+# being consumed
+_TASKS_PER_WORKER = 2
+
+def _imap_bounded(pool, function, items, threads):
+    '''Like pool.imap, yielding function(item) for each item in order,
+    but with at most _TASKS_PER_WORKER * threads tasks in flight, so
+    workers cannot run ahead of a slow consumer and fill memory with
+    results
+
+    Args:
+        pool (multiprocessing.Pool): the pool to run function in
+        function (callable): a picklable function of one argument
+        items (iterable): the arguments to call function with
+        threads (int): the number of worker processes in the pool
+
+    Yields:
+        the result of each call, in the order of items
+    '''
+    window = max(1, _TASKS_PER_WORKER * threads)
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(function, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+class _LineWriter(object):
+    '''Writes newline-terminated lines to a handle, holding back the
+    newline of the most recent line so that the output does not end with
+    a newline, matching the list-returning methods of ProcessedAssembly.
+
+    Attributes:
+        handle (file): the open, writable handle to write to
+    '''
+    def __init__(self, handle):
+        self.handle = handle
+        self._pending = ''
+
+    def write(self, line):
+        self.handle.write(self._pending + line[:-1])
+        self._pending = line[-1:]
+
+
+def _trim_last_newline(lines):
+    '''Drop the newline from the last of a list of lines, matching the
+    output of _LineWriter
+
+    Args:
+        lines (list[str]): newline-terminated lines
+
+    Returns:
+        list[str]: the same list
+    '''
+    if lines:
+        lines[-1] = lines[-1][:-1]
+    return lines
+
+
+class _ListWriter(object):
+    '''Minimal writable handle which collects everything written to it
+    in a list.'''
+    def __init__(self):
+        self.chunks = list()
+
+    def write(self, text):
+        self.chunks.append(text)
+
+    def lines(self):
+        '''Return everything written so far, split into lines which
+        keep their newline characters'''
+        lines = ''.join(self.chunks).split('\n')
+        ret = [line + '\n' for line in lines[:-1]]
+        if len(lines[-1]) > 0:
+            ret.append(lines[-1])
+        return ret
 
 
 class ZeroLengthContigError(ValueError):
@@ -823,9 +1753,9 @@ class MissingFragmentError(ValueError):
     of contigs at the start of the file'''
     pass
 
-class InvalidFastaError(ValueError):
-    '''An Error caused when an invalid .fasta file is attempted to be
-    read.'''
+class DuplicatePlacementError(ValueError):
+    '''An Error caused when a contig is placed in the scaffolds of a
+    .assembly file more than once.'''
     pass
 
 class BadContigNameError(ValueError):
@@ -847,6 +1777,31 @@ if __name__ == '__main__':
                         help='use simple chromosome names ("ChromosomeX") for scaffolds '\
                         'instead of detailed chromosome names ("PGA_scaffold_X__Y_contigs__length_Z"). '\
                         'Has no effect in contig_mode.')
+    parser.add_argument('-i', '--indexed', action='store_true', default=False,
+                        help='build (or reuse) a samtools-compatible .fai index next to the fasta '\
+                        'and read sequences on demand instead of loading the whole fasta into '\
+                        'memory. Default: %(default)s')
+    parser.add_argument('-z', '--bgzip', action='store_true', default=False,
+                        help='write the fasta bgzip compressed to PREFIX.fasta.gz, with .fai and '\
+                        '.gzi indices. Default: %(default)s')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='number of worker processes used to render FASTA scaffolds, and of '\
+                        'threads used for bgzip compression. Default: %(default)s')
+    parser.add_argument('--incremental', action='store_true', default=False,
+                        help='record the scaffold layout in PREFIX.manifest.json, and on later runs '\
+                        'copy unchanged scaffolds from the previous PREFIX.fasta instead of rendering '\
+                        'them again. Has no effect with --bgzip. Default: %(default)s')
+    parser.add_argument('--cache', nargs='?', const=True, default=None, metavar='CACHE_DIR',
+                        help='cache the parsed fasta on disk, so later runs against the same fasta '\
+                        'skip parsing it. Entries are invalidated when the fasta changes. Default '\
+                        'directory: $JUICEBOX_SCRIPTS_CACHE or ~/.cache/juicebox_scripts')
+    parser.add_argument('--cache_size', type=float, default=50,
+                        help='size cap of the fasta cache in GB, beyond which the least recently '\
+                        'used entries are evicted. Default: %(default)s')
+    parser.add_argument('--metrics', default=None, metavar='METRICS_FILE',
+                        help='write the wall time, CPU time, peak memory and bytes read and written of '\
+                        'each processing stage to this file, as JSON if it ends in .json and as TSV '\
+                        'otherwise')
     parser.add_argument('-v', '--verbose', action='store_false', help='print summary of '\
                         'processing steps to stdout, otherwise silent. Default: %(default)s',
                         default=True)
@@ -861,19 +1816,40 @@ if __name__ == '__main__':
     contig_mode = args.contig_mode
     simple_chr_names = args.simple_chr_names
     verbose = args.verbose
+    indexed = args.indexed
+    threads = args.threads
+    fasta_out = prefix + ('.fasta.gz' if args.bgzip else '.fasta')
+    cache = None
+    if args.cache is not None:
+        cache = FastaCache(cache_dir=None if args.cache is True else args.cache,
+                           max_bytes=int(args.cache_size * (1 << 30)))
+    metrics = Metrics() if args.metrics is not None else None
 
     print('Processing assembly file. Details:')
     print('Assembly:\t\t\t{0}'.format(assembly))
     print('Fasta:\t\t\t\t{0}'.format(fasta))
     print('Output prefix:\t\t\t{0}'.format(prefix))
     print('Contig mode:\t\t\t{0}'.format(contig_mode))
-    print('Simple Chromosome Names:\t{0}\n'.format(simple_chr_names))
-
-    processed_assembly = JuiceboxConverter().process(fasta, assembly,
-                                                     contig_mode=contig_mode,
-                                                     verbose=verbose,
-                                                     simple_chr_names=simple_chr_names)
-    processed_assembly.write_agp(prefix + '.agp', verbose=verbose)
-    processed_assembly.write_bed(prefix + '.bed', verbose=verbose)
-    processed_assembly.write_break_report(prefix + '.break_report.txt', verbose=verbose)
-    processed_assembly.write_fasta(prefix + '.fasta', verbose=verbose)
+    print('Simple Chromosome Names:\t{0}'.format(simple_chr_names))
+    print('Indexed fasta:\t\t\t{0}'.format(indexed))
+    print('Threads:\t\t\t{0}'.format(threads))
+    print('Fasta cache:\t\t\t{0}\n'.format(cache.cache_dir if cache is not None else None))
+
+    with JuiceboxConverter().process(fasta, assembly,
+                                     contig_mode=contig_mode,
+                                     verbose=verbose,
+                                     simple_chr_names=simple_chr_names,
+                                     indexed=indexed,
+                                     cache=cache,
+                                     metrics=metrics) as processed_assembly:
+        processed_assembly.write_outputs(fasta=fasta_out,
+                                         agp=prefix + '.agp',
+                                         bed=prefix + '.bed',
+                                         break_report=prefix + '.break_report.txt',
+                                         verbose=verbose,
+                                         threads=threads,
+                                         manifest=prefix + '.manifest.json' if args.incremental else None)
+    if verbose:
+        print_assembly_summary(processed_assembly.summary())
+    if metrics is not None:
+        metrics.write(args.metrics)
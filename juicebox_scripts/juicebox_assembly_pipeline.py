@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+juicebox_scripts/juicebox_assembly_pipeline.py
+
+This script runs degap_assembly.py, juicebox_assembly_purger.py and
+juicebox_assembly_converter.py as one pipeline. The .assembly file is
+read once and streamed through the degap and purge stages into the
+converter in memory, without intermediate files, and the fasta is read
+once by the converter.
+
+Copyright 2019, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+
+from __future__ import print_function
+import argparse
+import os
+
+try:
+    from juicebox_scripts.degap_assembly import degap_lines
+    from juicebox_scripts.fasta_cache import FastaCache
+    from juicebox_scripts.fasta_utils import open_input, open_output
+    from juicebox_scripts.juicebox_assembly_converter import JuiceboxConverter, print_assembly_summary
+    from juicebox_scripts.juicebox_assembly_purger import AssemblyPurger, get_exclude, print_summary
+    from juicebox_scripts.metrics import Metrics, measure_stage
+except ImportError:
+    from degap_assembly import degap_lines
+    from fasta_cache import FastaCache
+    from fasta_utils import open_input, open_output
+    from juicebox_assembly_converter import JuiceboxConverter, print_assembly_summary
+    from juicebox_assembly_purger import AssemblyPurger, get_exclude, print_summary
+    from metrics import Metrics, measure_stage
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Degap and purge a .assembly file and convert it to "
+                                                 "fasta, agp and bed files in a single pass")
+    parser.add_argument("-a", "--assembly", help="juicebox assembly file", required=True)
+    parser.add_argument("-f", "--fasta", help="the fasta file", required=True)
+    parser.add_argument("-p", "--prefix", default=None,
+                        help="the prefix to use for writing outputs. "
+                             "Default: the assembly file, minus the file extension")
+    parser.add_argument("--purged_assembly", default=None,
+                        help="also write the degapped and purged .assembly to this path")
+    parser.add_argument("--exclude_contigs", default=None, nargs="+",
+                        help="Names of contigs to exclude")
+    parser.add_argument("--exclude_file", default=None,
+                        help="Path to file or BED file of contigs to exclude (with contig names "
+                             "in first whitespace-delimited column, one per line)")
+    parser.add_argument("--exclude_regex", default=None, nargs="+",
+                        help="Exclude contigs whose names match any of these regular expressions")
+    parser.add_argument("--min_length", default=None, type=int,
+                        help="Exclude contigs shorter than this length")
+    parser.add_argument("--max_length", default=None, type=int,
+                        help="Exclude contigs longer than this length")
+    parser.add_argument("-c", "--contig_mode", action="store_true", default=False,
+                        help="ignore scaffold specification and just output contigs. Default: %(default)s")
+    parser.add_argument("-s", "--simple_chr_names", action="store_true", default=False,
+                        help='use simple chromosome names ("ChromosomeX") for scaffolds. '
+                             "Has no effect in contig_mode.")
+    parser.add_argument("-i", "--indexed", action="store_true", default=False,
+                        help="read sequences on demand through a .fai index instead of loading "
+                             "the whole fasta into memory. Default: %(default)s")
+    parser.add_argument("-z", "--bgzip", action="store_true", default=False,
+                        help="write the fasta bgzip compressed to PREFIX.fasta.gz, with .fai and "
+                             ".gzi indices. Default: %(default)s")
+    parser.add_argument("-t", "--threads", type=int, default=1,
+                        help="number of worker processes used to render FASTA scaffolds, and of "
+                             "threads used for bgzip compression. Default: %(default)s")
+    parser.add_argument("--incremental", action="store_true", default=False,
+                        help="reuse unchanged scaffolds of the previous PREFIX.fasta, as in "
+                             "juicebox_assembly_converter.py")
+    parser.add_argument("--cache", nargs="?", const=True, default=None, metavar="CACHE_DIR",
+                        help="cache the parsed fasta on disk, as in juicebox_assembly_converter.py")
+    parser.add_argument("--cache_size", type=float, default=50,
+                        help="size cap of the fasta cache in GB. Default: %(default)s")
+    parser.add_argument("--metrics", default=None, metavar="METRICS_FILE",
+                        help="write the time, memory and I/O of each stage to this file, as in "
+                             "juicebox_assembly_converter.py")
+    parser.add_argument("-q", "--quiet", action="store_true", default=False,
+                        help="do not print a summary of processing steps to stdout")
+    return parser.parse_args()
+
+def _tee(lines, handle):
+    '''Yield lines unchanged, writing each one to handle as it passes.'''
+    for line in lines:
+        handle.write(line)
+        yield line
+
+def run_pipeline(fasta, assembly, prefix=None, purged_assembly=None, exclude=None, exclude_regex=None,
+                 min_length=None, max_length=None, contig_mode=False, simple_chr_names=False,
+                 indexed=False, bgzip=False, threads=1, cache=None, incremental=False, verbose=False,
+                 metrics=None):
+    '''Degap, purge and convert a .assembly file, writing the fasta, agp,
+    bed and break report outputs of juicebox_assembly_converter.py.
+
+    The .assembly is read once; its lines pass through degap_lines and
+    an AssemblyPurger straight into JuiceboxConverter.process. The purge
+    stage is skipped when no purge criteria are given.
+
+    Args:
+        fasta (str): path to the fasta corresponding to the assembly
+        assembly (str): path to the .assembly file
+        prefix (str) [optional]: prefix of the output files. Default:
+            the assembly path, minus the file extension
+        purged_assembly (str) [optional]: path to also write the
+            degapped and purged .assembly to. Default: None
+        exclude (set) [optional]: names of contigs to purge
+        exclude_regex (list[str]) [optional]: purge contigs whose names
+            match any of these regular expressions
+        min_length (int) [optional]: purge contigs shorter than this
+        max_length (int) [optional]: purge contigs longer than this
+        contig_mode, simple_chr_names, indexed (bool) [optional]: as in
+            JuiceboxConverter.process. Default: False
+        bgzip (bool) [optional]: write the fasta bgzip compressed to
+            PREFIX.fasta.gz. Default: False
+        threads (int) [optional]: as in ProcessedAssembly.write_outputs.
+            Default: 1
+        cache (FastaCache) [optional]: as in JuiceboxConverter.process.
+            Default: None
+        incremental (bool) [optional]: keep a manifest at
+            PREFIX.manifest.json and reuse unchanged scaffolds of the
+            previous FASTA output, as in ProcessedAssembly.write_outputs.
+            Default: False
+        verbose (bool) [optional]: print output describing processing
+            steps to stdout. Otherwise silent. Default: False
+        metrics (Metrics) [optional]: record the time, memory and I/O of
+            each stage here, as in JuiceboxConverter.process. The degap
+            and purge stages run as the converter reads the .assembly,
+            so they are counted in its read_assembly stage. Default: None
+
+    Returns:
+        PurgeSummary: summary of the purge stage, or None if it was
+            skipped
+    '''
+    if prefix is None:
+        prefix = os.path.splitext(assembly)[0]
+    exclude = set() if exclude is None else exclude
+    purger = None
+    if exclude or exclude_regex or min_length is not None or max_length is not None:
+        purger = AssemblyPurger(exclude, exclude_regex=exclude_regex, min_length=min_length,
+                                max_length=max_length)
+    purged_handle = open_output(purged_assembly) if purged_assembly is not None else None
+    processed_assembly = None
+    try:
+        with open_input(assembly) as f:
+            lines = (line + "\n" for line in degap_lines(f, log=verbose))
+            if purger is not None:
+                lines = purger.purge(lines)
+            if purged_handle is not None:
+                lines = _tee(lines, purged_handle)
+            processed_assembly = JuiceboxConverter().process(fasta, assembly,
+                                                             contig_mode=contig_mode,
+                                                             verbose=verbose,
+                                                             simple_chr_names=simple_chr_names,
+                                                             indexed=indexed,
+                                                             assembly_lines=lines,
+                                                             cache=cache,
+                                                             metrics=metrics)
+            # contig_mode stops reading at the scaffolds, but the purge
+            # checks and the purged .assembly need every line
+            with measure_stage(metrics, 'drain_assembly'):
+                for _ in lines:
+                    pass
+        if verbose and purger is not None:
+            print_summary(purger.summary)
+        processed_assembly.write_outputs(fasta=prefix + (".fasta.gz" if bgzip else ".fasta"),
+                                         agp=prefix + ".agp",
+                                         bed=prefix + ".bed",
+                                         break_report=prefix + ".break_report.txt",
+                                         verbose=verbose,
+                                         threads=threads,
+                                         manifest=prefix + ".manifest.json" if incremental else None)
+    finally:
+        if purged_handle is not None:
+            purged_handle.close()
+        if processed_assembly is not None:
+            processed_assembly.close()
+    if verbose:
+        print_assembly_summary(processed_assembly.summary())
+    return purger.summary if purger is not None else None
+
+def main():
+    args = parse_args()
+    exclude = set()
+    if args.exclude_contigs is not None or args.exclude_file is not None:
+        exclude = get_exclude(args.exclude_contigs, args.exclude_file)
+    cache = None
+    if args.cache is not None:
+        cache = FastaCache(cache_dir=None if args.cache is True else args.cache,
+                           max_bytes=int(args.cache_size * (1 << 30)))
+    metrics = Metrics() if args.metrics is not None else None
+    run_pipeline(args.fasta, args.assembly,
+                 prefix=args.prefix,
+                 purged_assembly=args.purged_assembly,
+                 exclude=exclude,
+                 exclude_regex=args.exclude_regex,
+                 min_length=args.min_length,
+                 max_length=args.max_length,
+                 contig_mode=args.contig_mode,
+                 simple_chr_names=args.simple_chr_names,
+                 indexed=args.indexed,
+                 bgzip=args.bgzip,
+                 threads=args.threads,
+                 cache=cache,
+                 incremental=args.incremental,
+                 verbose=not args.quiet,
+                 metrics=metrics)
+    if metrics is not None:
+        metrics.write(args.metrics)
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,26 @@ along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.h
 
 from __future__ import print_function
 import argparse
+import re
+import time
+from array import array
+from collections import namedtuple, OrderedDict
+
+try:
+    from juicebox_scripts.fasta_utils import GAP_PREFIX, open_input, open_output
+except ImportError:
+    from fasta_utils import GAP_PREFIX, open_input, open_output
+
+# the criteria a contig may be purged by, in the order they are reported
+CRITERIA = ("name", "regex", "min_length", "max_length")
+
+# summary of a filter_assembly run
+# counts: OrderedDict of criterion -> number of contigs it selected; a
+#     contig selected by several criteria is counted under each of them
+# purged: number of contigs purged
+# kept: number of contigs kept
+# timings: OrderedDict of stage -> seconds spent in it
+PurgeSummary = namedtuple("PurgeSummary", ["counts", "purged", "kept", "timings"])
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -39,15 +59,30 @@ def parse_args():
     parser.add_argument("--exclude_file",
                         default=None,
                         help="Path to file of contigs to exclude (with contig names in "
-                             "first whitespace-delimited column, one per line)")
+                             "first whitespace-delimited column, one per line). A BED "
+                             "file may be given; its header lines are skipped")
+    parser.add_argument("--exclude_regex",
+                        default=None,
+                        nargs="+",
+                        help="Exclude contigs whose names match any of these regular expressions")
+    parser.add_argument("--min_length",
+                        default=None,
+                        type=int,
+                        help="Exclude contigs shorter than this length")
+    parser.add_argument("--max_length",
+                        default=None,
+                        type=int,
+                        help="Exclude contigs longer than this length")
     parser.add_argument("--logging",
                         choices=["verbose", "silent"],
                         default="verbose",
                         help="Set logging level (Default: %(default)s)")
     args = parser.parse_args()
 
-    if args.exclude_contigs is None and args.exclude_file is None:
-        raise ValueError("Error: exclude_contigs or exclude_file must be specified")
+    if args.exclude_contigs is None and args.exclude_file is None and args.exclude_regex is None \
+            and args.min_length is None and args.max_length is None:
+        raise ValueError("Error: exclude_contigs, exclude_file, exclude_regex, min_length "
+                         "or max_length must be specified")
 
     return vars(args)
 
@@ -62,76 +97,167 @@ def get_exclude(contigs, file):
     if file is not None:
         with open(file, 'r') as infile:
             for line in infile:
-                name = line.split()[0]
-                exclude.add(name)
+                fields = line.split()
+                if len(fields) == 0 or fields[0].startswith("#") or fields[0] in ("track", "browser"):
+                    continue
+                exclude.add(fields[0])
 
     return exclude
 
-def filter_assembly(exclude, input_assembly, output_assembly, **kwargs):
-    """Take an input assembly file and create an output assembly file
-    without the contigs specified in the exclude set.
+class AssemblyPurger(object):
+    """Removes contigs from the lines of an assembly file as they stream
+    past, selecting them by name, by regular expression on the name, and
+    by minimum or maximum length. Gap (hic_gap) entries are only purged
+    if named in the exclude set. Gaps left at the ends of a scaffold or
+    next to another gap by the purge are dropped from it, as are
+    scaffolds left with no contigs.
+
+    Contigs are selected and renumbered as the header is read, using an
+    array mapping each old index to its new one (0 if purged), so the
+    scaffolds are rewritten in the same pass.
+
+    Attributes:
+        summary (PurgeSummary): summary of the last call to purge, set
+            once all of its lines have been consumed
     """
-    with open(input_assembly, "r") as infile, \
-         open(output_assembly, "w") as outfile:
+    def __init__(self, exclude, exclude_regex=None, min_length=None, max_length=None):
+        self.exclude = exclude
+        self.regex = None
+        if exclude_regex:
+            self.regex = re.compile("|".join("(?:{})".format(pattern) for pattern in exclude_regex))
+        self.min_length = min_length
+        self.max_length = max_length
+        self.summary = None
+
+    def purge(self, lines):
+        """Yield the lines of an assembly file, each ending in a newline,
+        without the selected contigs. Raises ValueError once the input is
+        exhausted if a contig named in the exclude set was not found, or
+        a purged contig was in no scaffold.
+        """
+        exclude, regex = self.exclude, self.regex
+        min_length, max_length = self.min_length, self.max_length
+        counts = OrderedDict((criterion, 0) for criterion in CRITERIA)
+        timings = OrderedDict()
+        start = time.time()
         index = 1
         purged_names = set([])
-        purged_indices = set([])
-        purged_from_scaffolds = set([])
-        index_map = {}
-        for line in infile:
+        # index_map[old index] is the new index, or 0 if purged; in_scaffold
+        # marks purged contigs once they are found in a scaffold; is_gap
+        # marks the gap entries
+        index_map = array("l", [0])
+        in_scaffold = bytearray(1)
+        is_gap = bytearray(1)
+        purged_count = 0
+        purged_from_scaffolds = 0
+        in_header = True
+        for line in lines:
             if line.startswith(">"):
                 name, num, length = line.strip().split()
-                name = name.replace(">", "")
+                name = name[1:]
+                length = int(length)
+                if int(num) != len(index_map):
+                    raise ValueError("Error: expected index {} for contig {}, found {}".format(
+                        len(index_map), name, num))
+                purge = False
                 if name in exclude:
                     purged_names.add(name)
-                    purged_indices.add(num)
-                    index_map[num] = None
+                    counts["name"] += 1
+                    purge = True
+                gap = name.startswith(GAP_PREFIX)
+                if not gap:
+                    if regex is not None and regex.search(name):
+                        counts["regex"] += 1
+                        purge = True
+                    if min_length is not None and length < min_length:
+                        counts["min_length"] += 1
+                        purge = True
+                    if max_length is not None and length > max_length:
+                        counts["max_length"] += 1
+                        purge = True
+                in_scaffold.append(0)
+                is_gap.append(gap)
+                if purge:
+                    index_map.append(0)
+                    purged_count += 1
                     continue
                 else:
-                    outstring = ">{} {} {}\n".format(name, index, length)
-                    outfile.write(outstring)
-                    index_map[num] = str(index)
+                    yield ">{} {} {}\n".format(name, index, length)
+                    index_map.append(index)
                     index += 1
             else:
+                if in_header:
+                    in_header = False
+                    timings["header"] = time.time() - start
+                    start = time.time()
                 outlist = []
-                contigs = line.strip().split()
-                for orient_num in contigs:
-                    orientation = "-" if orient_num.startswith("-") else ""
-                    num = orient_num.replace("-", "")
-                    if num in purged_indices:
-                        purged_from_scaffolds.add(num)
+                # a gap is only written once a contig follows it, so gaps
+                # at either end are dropped and runs of gaps collapse
+                pending_gap = None
+                for orient_num in line.split():
+                    num = abs(int(orient_num))
+                    if num < 1 or num >= len(index_map):
+                        raise ValueError("Error: scaffold contains index {} which is not in the header".format(num))
+                    new_index = index_map[num]
+                    if new_index == 0:
+                        if not in_scaffold[num]:
+                            in_scaffold[num] = 1
+                            purged_from_scaffolds += 1
                         continue
-                    else:
-                        outlist.append(orientation + index_map[num])
+                    token = str(new_index) if orient_num[0] != "-" else "-" + str(new_index)
+                    if is_gap[num]:
+                        if pending_gap is None and len(outlist) > 0:
+                            pending_gap = token
+                        continue
+                    if pending_gap is not None:
+                        outlist.append(pending_gap)
+                        pending_gap = None
+                    outlist.append(token)
                 if len(outlist) > 0:
-                    outstring = " ".join(outlist) + "\n"
-                    outfile.write(outstring)
-
-    all_exclude_contigs_found = exclude.issubset(purged_names) and purged_names.issubset(exclude)
-    header_scaffold_match = len(purged_indices) == len(purged_from_scaffolds)
+                    yield " ".join(outlist) + "\n"
+        if in_header:
+            timings["header"] = time.time() - start
+        else:
+            timings["scaffolds"] = time.time() - start
 
-    if not all_exclude_contigs_found:
-        not_found = exclude.difference(purged_names)
-        mistaken_purge = purged_names.difference(exclude)
-        if len(not_found) > 0:
+        if purged_names != exclude:
+            not_found = exclude.difference(purged_names)
             raise ValueError("Error: contigs specified for exclusion "
                              "were not found: {}".format(" ".join(not_found)))
-        elif len(mistaken_purge) > 0:
-            raise ValueError("Error: contigs not specified for exclusion "
-                             "were mistakenly purged: {}".format(" ".join(mistaken_purge)))
-    elif not header_scaffold_match:
-        missing_from_scaffold = purged_from_scaffolds.difference(purged_indices)
-        missing_from_header = purged_indices.difference(purged_from_scaffolds)
-        if len(missing_from_scaffold) > 0:
-            raise ValueError("Error: contigs found in header were missing from scaffolds: {}".format(" ".join(missing_from_scaffold)))
-        elif len(missing_from_header) > 0:
-            # This shouldn't happen, but it's included it for completeness
-            raise ValueError("Error: contigs found in scaffolds were missing from header: {}".format(" ".join(missing_from_header)))
+        elif purged_from_scaffolds != purged_count:
+            missing_from_scaffold = [str(num) for num in range(1, len(index_map))
+                                     if index_map[num] == 0 and not in_scaffold[num]]
+            raise ValueError("Error: contigs found in header were missing from scaffolds: {}".format(
+                " ".join(missing_from_scaffold)))
+        self.summary = PurgeSummary(counts, purged_count, index - 1, timings)
+
+def print_summary(summary):
+    """Print a PurgeSummary to stdout."""
+    print("Purged {} contigs from header and scaffolds, kept {}.".format(summary.purged, summary.kept))
+    for criterion, count in summary.counts.items():
+        print("  selected by {}: {}".format(criterion, count))
+    for stage, seconds in summary.timings.items():
+        print("  {} pass: {:.3f}s".format(stage, seconds))
+
+def filter_assembly(exclude, input_assembly, output_assembly, exclude_regex=None,
+                    min_length=None, max_length=None, **kwargs):
+    """Take an input assembly file and create an output assembly file
+    without the contigs specified in the exclude set, those whose names
+    match any of the exclude_regex patterns, and those shorter than
+    min_length or longer than max_length, using an AssemblyPurger.
+    Returns a PurgeSummary.
+    """
+    purger = AssemblyPurger(exclude, exclude_regex=exclude_regex, min_length=min_length, max_length=max_length)
+    with open_input(input_assembly) as infile, \
+         open_output(output_assembly) as outfile:
+        for line in purger.purge(infile):
+            outfile.write(line)
 
     if "logging" in kwargs and kwargs["logging"] == "verbose":
         print("SUCCESS")
-        print("Purged {} contigs from header and scaffolds.".format(len(purged_names), len(purged_from_scaffolds)))
+        print_summary(purger.summary)
         print("Finished writing output assembly to {}.".format(output_assembly))
+    return purger.summary
 
 def main():
     args = parse_args()
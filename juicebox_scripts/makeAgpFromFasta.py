@@ -1,64 +1,65 @@
 #!/usr/bin/env python
-#requires exactly 2 inputs
-#a fasta file to print contig lengths
-#writes results to stdout
+#requires at least 2 inputs
+#one or more fasta files (optionally gzip compressed) whose contig lengths to write
+#the agp file to write them to
 
 from __future__ import print_function
+
+import argparse
+import os
 import sys
 
-def printUsage():
-    print("\nmakeAgpFromFasta.py usage:", end='')
-    print("\tmakeAgpFromFasta.py <fasta_file> <agp_out_file>")
-    return
+try:
+    from juicebox_scripts.fasta_utils import FASTA_BLOCK_SIZE, FastaIndexError, build_fai, is_gzipped, \
+        iter_fasta_blocks, open_input, open_output, read_fai, write_fai
+except ImportError:
+    from fasta_utils import FASTA_BLOCK_SIZE, FastaIndexError, build_fai, is_gzipped, iter_fasta_blocks, \
+        open_input, open_output, read_fai, write_fai
 
-#this funtion returns true if line is a contig+bin line
-def isContigBinLine(line):
-    ret = 0
-    if len(line) > 1:
-        ret = (line[0:1] == ">")
-    return ret
+def parse_args():
+    parser = argparse.ArgumentParser(description="Make an AGP file describing the contigs in one or more FASTA files")
+    parser.add_argument("fasta_files", nargs="+", help="FASTA file(s), optionally gzip compressed")
+    parser.add_argument("agp_out_file", help="path to write the AGP file to")
+    parser.add_argument("--write_fai",
+                        action="store_true",
+                        default=False,
+                        help="write a samtools-compatible .fai index next to each uncompressed FASTA "
+                             "without one, for reuse by later runs of this script or "
+                             "juicebox_assembly_converter.py --indexed")
+    return parser.parse_args()
 
-#this function returns the contig+bin portion of a contig+bin line
-def getContigBinFromLine(line):
-    ret = ""
-    if isContigBinLine(line):
-        #trim the >, split the line, and grab the first token, in case there is a long description on the line
-        ret = line[1:].split()[0].strip()
-    return ret
+#this function returns the (name, length) of each contig in a fasta file,
+#using an up to date .fai index if there is one
+def getContigLengths(fname, write_index=False):
+    fai = fname + ".fai"
+    if os.path.exists(fai) and os.path.getmtime(fai) >= os.path.getmtime(fname):
+        return [(entry.name, entry.length) for entry in read_fai(fai)]
+    gzipped = is_gzipped(fname)
+    if write_index and gzipped:
+        print("Cannot index compressed fasta {0}, not writing {1}".format(fname, fai), file=sys.stderr)
+    elif write_index:
+        try:
+            entries = build_fai(fname)
+        except FastaIndexError as e:
+            print("Not writing {0}: {1}".format(fai, e), file=sys.stderr)
+        else:
+            write_fai(entries, fai)
+            return [(entry.name, entry.length) for entry in entries]
+    with open_input(fname, binary=True) as file:
+        return list(countContigLengths(file))
 
+#this function yields the (name, length) of each contig in an open binary fasta
+#handle, reading it in large blocks and counting bases in bulk rather than line by line
+def countContigLengths(file, block_size=FASTA_BLOCK_SIZE):
+    return iter_fasta_blocks(file, block_size=block_size, count_only=True)
 
 def main():
-    if len(sys.argv) != 3:
-        printUsage()
-        sys.exit()
-
-    fname = sys.argv[1]
-    outfile = sys.argv[2]
-    contig = ""
-
-    counting = 0
-    count = 0
-    total = 0
+    args = parse_args()
+    with open_output(args.agp_out_file) as outf:
+        outf.write("##agp-version 2.1\n")
+        for fname in args.fasta_files:
+            for contig, count in getContigLengths(fname, write_index=args.write_fai):
+                outf.write("{0}\t0\t{1}\t1\tW\t{0}\t1\t{1}\t+\n".format(contig, count))
 
-    with open(fname) as file:
-        with open(outfile, 'w') as outf:
-            outf.write("##agp-version 2.1\n")
-            for line in file:
-                line = line.strip()
-                if isContigBinLine(line):
-                    if counting:
-                        outf.write("{0}\t0\t{1}\t1\tW\t{0}\t1\t{1}\t+\n".format(contig, count))
-                    else:
-                        counting = 1
-                    contig = getContigBinFromLine(line)
-                    count = 0
-                elif counting:
-                    count += len(line)
-                    total += len(line)
-                else:
-                    continue
-    
-            outf.write("{0}\t0\t{1}\t1\tW\t{0}\t1\t{1}\t+\n".format(contig, count))
-            
 if __name__ == "__main__":
     main()
@@ -0,0 +1,221 @@
+#!usr/bin/env python
+'''
+Phase Genomics
+
+juicebox_scripts/metrics.py
+
+This file contains Metrics, which records the wall time, CPU time, peak
+resident memory and bytes read and written of each stage of a
+conversion, and writes them out as JSON or TSV. Stages are measured only
+when a Metrics object is passed in, so conversions without one pay
+nothing for the instrumentation.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# per-process I/O counters on Linux; rchar and wchar count the bytes
+# passed to read and write calls, so data read through a memory map is
+# not included
+_PROC_IO = '/proc/self/io'
+# writing 5 here resets the high-water mark of the process's resident
+# memory, reported as VmHWM in the status file, on Linux 4.0 and later
+_PROC_CLEAR_REFS = '/proc/self/clear_refs'
+_PROC_STATUS = '/proc/self/status'
+
+_wall_clock = getattr(time, 'perf_counter', time.time)
+
+# measurements of one stage. peak_rss_bytes is the most resident memory
+# the process used during the stage, not counting worker processes; it
+# and the byte counts are None where the platform does not report them
+StageMetrics = namedtuple('StageMetrics', ['stage', 'wall_seconds', 'cpu_seconds', 'peak_rss_bytes',
+                                           'read_bytes', 'write_bytes'])
+
+
+class Metrics(object):
+    '''Measurements of the stages of a conversion, in the order they ran.
+
+    A stage started inside another stage is counted as part of the
+    enclosing stage only. CPU time includes worker processes that
+    finished during the stage.
+
+    The peak memory of a stage is measured by resetting the process's
+    resident memory high-water mark when the stage starts, where Linux
+    allows it. Elsewhere it is only known for stages which raise the
+    high-water mark of the whole process, and is None for the others.
+
+    Attributes:
+        stages (list[StageMetrics]): the stages measured so far
+    '''
+    def __init__(self):
+        self.stages = list()
+        self._depth = 0
+
+    @contextmanager
+    def stage(self, name):
+        '''Measure the code run inside the with block as a stage
+
+        Args:
+            name (str): the name of the stage
+        '''
+        if self._depth > 0:
+            yield
+            return
+        self._depth += 1
+        reset = _reset_peak_rss()
+        peak = None if reset else _max_rss()
+        wall = _wall_clock()
+        cpu = _cpu_time()
+        io = _io_counters(after_own_read=True)
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            end_io = _io_counters()
+            self.stages.append(StageMetrics(name, _wall_clock() - wall, _cpu_time() - cpu, _peak_rss(reset, peak),
+                                            end_io[0] - io[0] if io is not None else None,
+                                            end_io[1] - io[1] if io is not None else None))
+
+    def to_dicts(self):
+        '''Return the stages as a list of dicts, one per stage'''
+        return [stage._asdict() for stage in self.stages]
+
+    def write(self, path):
+        '''Write the stages to a file, as JSON if the path ends in .json
+        and as TSV with a header line otherwise
+
+        Args:
+            path (str): path to the file to write
+        '''
+        with open(path, 'w') as f:
+            if path.endswith('.json'):
+                json.dump({'stages': self.to_dicts()}, f, indent=2)
+                f.write('\n')
+            else:
+                f.write('\t'.join(StageMetrics._fields) + '\n')
+                for stage in self.stages:
+                    f.write('\t'.join('' if value is None else str(value) for value in stage) + '\n')
+
+
+@contextmanager
+def _null_stage():
+    yield
+
+
+def measure_stage(metrics, name):
+    '''Return a context manager measuring a stage into metrics, or doing
+    nothing if metrics is None
+
+    Args:
+        metrics (Metrics): where to record the stage, or None
+        name (str): the name of the stage
+    '''
+    if metrics is None:
+        return _null_stage()
+    return metrics.stage(name)
+
+
+def _cpu_time():
+    '''Return the user and system CPU time of this process and its
+    finished children'''
+    if resource is None:
+        times = os.times()
+        return times[0] + times[1] + times[2] + times[3]
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _reset_peak_rss():
+    '''Reset the high-water mark of this process's resident memory to
+    its current size, returning whether that is supported'''
+    try:
+        with open(_PROC_CLEAR_REFS, 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        return False
+    return _status_peak_rss() is not None
+
+
+def _status_peak_rss():
+    '''Return the high-water mark of this process's resident memory in
+    bytes since it was last reset, or None if it is not available'''
+    try:
+        with open(_PROC_STATUS) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+def _max_rss():
+    '''Return the high-water mark of this process's resident memory in
+    bytes over its lifetime, or None if it is not available'''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _peak_rss(reset, start_peak):
+    '''Return the peak resident memory of this process during a stage
+    in bytes, or None if it is not known
+
+    Args:
+        reset (bool): whether the high-water mark was reset when the
+            stage started
+        start_peak (int): the lifetime high-water mark when the stage
+            started, if it was not reset
+    '''
+    if reset:
+        return _status_peak_rss()
+    peak = _max_rss()
+    # a lifetime high-water mark is only the stage's own if the stage
+    # raised it
+    if peak is None or start_peak is None or peak <= start_peak:
+        return None
+    return peak
+
+
+def _io_counters(after_own_read=False):
+    '''Return the bytes read and written by this process so far, or None
+    if they are not available
+
+    Args:
+        after_own_read (bool) [optional]: count the read of the counters
+            themselves as already done, so it is not charged to the
+            stage measured from here. Default: False
+    '''
+    try:
+        with open(_PROC_IO) as f:
+            text = f.read()
+        counters = dict(line.split(':') for line in text.splitlines() if ':' in line)
+        return int(counters['rchar']) + (len(text) if after_own_read else 0), int(counters['wchar'])
+    except (IOError, OSError, KeyError, ValueError):
+        return None
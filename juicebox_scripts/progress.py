@@ -0,0 +1,133 @@
+#!usr/bin/env python
+'''
+Phase Genomics
+
+juicebox_scripts/progress.py
+
+This file contains Progress, a rate-limited progress line written to
+stderr. It reports the amount of work done, the throughput and, when the
+total is known, the percentage done and the time remaining, redrawing
+the line at most once per interval. start_progress returns None when
+progress is not wanted, so callers skip it entirely with a single check.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+import sys
+import time
+
+_clock = getattr(time, 'monotonic', time.time)
+
+# unit of amounts counted in bytes, which are shown scaled to KB, MB, ...
+BYTES = 'B'
+_BYTE_PREFIXES = ('', 'K', 'M', 'G', 'T', 'P')
+
+
+class Progress(object):
+    '''A progress line for one long-running step.
+
+    Attributes:
+        label (str): what is being done, shown at the start of the line
+        total (int): the amount of work in the step, or None if unknown
+        unit (str): the unit of work, BYTES or a noun such as 'contigs'
+        done (int): the amount of work done so far
+        stream (file): where the line is written
+        interval (float): the least time between redraws, in seconds
+    '''
+    def __init__(self, label, total=None, unit=BYTES, stream=None, interval=1.0):
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.stream = sys.stderr if stream is None else stream
+        self.interval = interval
+        self._start = _clock()
+        self._next_report = self._start + interval
+        self._width = 0
+
+    def update(self, amount=1):
+        '''Record more work as done, redrawing the line if interval has
+        passed since it was last drawn
+
+        Args:
+            amount (int) [optional]: the amount of work done. Default: 1
+        '''
+        self.done += amount
+        now = _clock()
+        if now >= self._next_report:
+            self._draw(now)
+            self._next_report = now + self.interval
+
+    def finish(self):
+        '''Draw the final state of the line and end it'''
+        self._draw(_clock())
+        self.stream.write('\n')
+        self.stream.flush()
+
+    def _draw(self, now):
+        '''Overwrite the line with the current progress'''
+        elapsed = now - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0
+        text = '{0}: {1}'.format(self.label, _format_amount(self.done, self.unit))
+        if self.total:
+            text += ' of {0} ({1:.0f}%)'.format(_format_amount(self.total, self.unit),
+                                                100.0 * self.done / self.total)
+        text += ', {0}/s'.format(_format_amount(rate, self.unit))
+        if self.total and rate > 0 and self.done < self.total:
+            text += ', ETA {0}'.format(_format_seconds((self.total - self.done) / rate))
+        elif self.total is None or self.done >= self.total:
+            text += ', {0} elapsed'.format(_format_seconds(elapsed))
+        # pad over any longer line drawn before
+        self.stream.write('\r' + text.ljust(self._width))
+        self.stream.flush()
+        self._width = len(text)
+
+
+def start_progress(label, verbose, total=None, unit=BYTES, stream=None, interval=1.0):
+    '''Start a progress line, unless verbose is off or the stream is not
+    a terminal, such as a log file of a batch job.
+
+    Args:
+        label (str): what is being done
+        verbose (bool): whether progress is wanted at all
+        total, unit, stream, interval [optional]: as for Progress
+
+    Returns:
+        Progress: the progress line, or None if it is disabled
+    '''
+    if not verbose:
+        return None
+    stream = sys.stderr if stream is None else stream
+    isatty = getattr(stream, 'isatty', None)
+    if isatty is None or not isatty():
+        return None
+    return Progress(label, total=total, unit=unit, stream=stream, interval=interval)
+
+
+def _format_amount(amount, unit):
+    '''Format an amount of work, scaling bytes to the largest prefix'''
+    if unit == BYTES:
+        amount = float(amount)
+        for prefix in _BYTE_PREFIXES:
+            if amount < 1000 or prefix == _BYTE_PREFIXES[-1]:
+                return '{0:.1f} {1}B'.format(amount, prefix) if prefix else '{0:.0f} B'.format(amount)
+            amount /= 1000
+    return '{0:,.0f} {1}'.format(amount, unit)
+
+
+def _format_seconds(seconds):
+    '''Format a duration as H:MM:SS'''
+    seconds = int(seconds)
+    return '{0}:{1:02d}:{2:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
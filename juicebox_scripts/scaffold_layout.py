@@ -0,0 +1,214 @@
+#!usr/bin/env python
+'''
+Phase Genomics
+
+juicebox_scripts/scaffold_layout.py
+
+This file contains ScaffoldLayout, a compact columnar representation of
+the scaffolds described by a .assembly file. Rather than a tuple per
+placed contig, placements are held in parallel columns of contig
+names, integer lengths and strand flags, with each scaffold's placements
+found through an offset array. Coordinates of every placement within its
+scaffold are computed once.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+from array import array
+
+# typecode of the 64-bit integer arrays holding lengths and coordinates;
+# 'q' is unavailable on python 2, where 'l' is 64 bits on LP64 platforms
+try:
+    array('q')
+    _INT64 = 'q'
+except ValueError:
+    _INT64 = 'l'
+
+
+class ScaffoldLayout(object):
+    '''The contigs placed on each scaffold of an assembly, stored as
+    columns.
+
+    Indexing or iterating a ScaffoldLayout yields each scaffold in the
+    list of (name, length, strand, contig_mode) tuples that
+    JuiceboxConverter has always used, built on demand, so existing
+    callers keep working; the column accessors avoid building them.
+
+    Attributes:
+        contig_mode (bool): whether each contig was placed on a scaffold
+            of its own by contig_mode, rather than as in the .assembly
+        names (list[str]): for each placement, the contig name. A
+            contig is placed at most once, so names are not interned;
+            the list refers to the name strings of the assembly map
+            rather than copying them
+        lengths (array): for each placement, the contig length
+        reverse (bytearray): for each placement, 1 if the contig is on
+            the - strand, else 0
+        scaffold_offsets (array): the placements of scaffold i are
+            scaffold_offsets[i] to scaffold_offsets[i+1]
+        positions (array): for each placement, its 0-based start within
+            its scaffold, set by compute_positions
+        scaffold_lengths (array): for each scaffold, its length including
+            gaps, set by compute_positions
+        gap_size (int): the gap size positions were computed with, or
+            None before compute_positions is called
+    '''
+    def __init__(self, contig_mode=False):
+        self.contig_mode = contig_mode
+        self.names = list()
+        self.lengths = array(_INT64)
+        self.reverse = bytearray()
+        self.scaffold_offsets = array(_INT64, [0])
+        self.positions = None
+        self.scaffold_lengths = None
+        self.gap_size = None
+
+    @classmethod
+    def from_scaffolds(cls, scaffolds):
+        '''Build a ScaffoldLayout from scaffolds in the list of tuples
+        representation
+
+        Args:
+            scaffolds (list[list[(str, str, str, bool)]]): the scaffolds,
+                as JuiceboxConverter._read_assembly used to return them
+
+        Returns:
+            ScaffoldLayout: the same scaffolds as columns
+        '''
+        if isinstance(scaffolds, cls):
+            return scaffolds
+        layout = cls(contig_mode=bool(scaffolds) and scaffolds[0][0][3])
+        for scaffold in scaffolds:
+            for contig in scaffold:
+                layout.add(contig[0], int(contig[1]), contig[2])
+            layout.end_scaffold()
+        return layout
+
+    def __len__(self):
+        return len(self.scaffold_offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('scaffold index out of range')
+        return [(self.names[i], str(self.lengths[i]), '-' if self.reverse[i] else '+',
+                 self.contig_mode) for i in self.placements(index)]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def add(self, name, length, strand):
+        '''Place a contig at the end of the scaffold being built
+
+        Args:
+            name (str): the contig name
+            length (int): the contig length
+            strand (str): the contig strand (+ or -)
+        '''
+        self.names.append(name)
+        self.lengths.append(length)
+        self.reverse.append(strand == '-')
+
+    def end_scaffold(self):
+        '''Finish the scaffold being built, if any contigs were placed on
+        it'''
+        if len(self.names) > self.scaffold_offsets[-1]:
+            self.scaffold_offsets.append(len(self.names))
+
+    def placements(self, index):
+        '''Return the placement indices of a scaffold
+
+        Args:
+            index (int): the 0-based index of the scaffold
+
+        Returns:
+            range: indices into the placement columns
+        '''
+        return range(self.scaffold_offsets[index], self.scaffold_offsets[index + 1])
+
+    def contig_count(self, index):
+        '''Return the number of contigs placed on a scaffold
+
+        Args:
+            index (int): the 0-based index of the scaffold
+
+        Returns:
+            int: the number of contigs
+        '''
+        return self.scaffold_offsets[index + 1] - self.scaffold_offsets[index]
+
+    def name(self, placement):
+        '''Return the name of the contig at a placement'''
+        return self.names[placement]
+
+    def strand(self, placement):
+        '''Return the strand (+ or -) of the contig at a placement'''
+        return '-' if self.reverse[placement] else '+'
+
+    def rename(self, new_names):
+        '''Rename contigs in a single pass over the placements
+
+        Args:
+            new_names (dict[str:str]): maps current names to new ones
+        '''
+        if len(new_names) == 0:
+            return
+        names = self.names
+        for position, name in enumerate(names):
+            if name in new_names:
+                names[position] = new_names[name]
+
+    def sort_by_name(self):
+        '''Reorder the scaffolds by the name of their first contig, as
+        contig_mode orders its single-contig scaffolds'''
+        order = sorted(range(len(self)), key=lambda index: (self.name(self.scaffold_offsets[index]),
+                                                            str(self.lengths[self.scaffold_offsets[index]])))
+        names, lengths, reverse = self.names, self.lengths, self.reverse
+        self.names = list()
+        self.lengths = array(_INT64)
+        self.reverse = bytearray()
+        offsets = self.scaffold_offsets
+        self.scaffold_offsets = array(_INT64, [0])
+        for index in order:
+            for i in range(offsets[index], offsets[index + 1]):
+                self.names.append(names[i])
+                self.lengths.append(lengths[i])
+                self.reverse.append(reverse[i])
+            self.scaffold_offsets.append(len(self.names))
+        self.positions = self.scaffold_lengths = self.gap_size = None
+
+    def compute_positions(self, gap_size):
+        '''Compute the start of every placement within its scaffold, and
+        the length of every scaffold, with gap_size bases between
+        neighbouring contigs
+
+        Args:
+            gap_size (int): the length of the gaps between contigs
+        '''
+        lengths = self.lengths
+        offsets = self.scaffold_offsets
+        positions = array(_INT64)
+        scaffold_lengths = array(_INT64)
+        for index in range(len(self)):
+            position = 0
+            for i in range(offsets[index], offsets[index + 1]):
+                positions.append(position)
+                position += lengths[i] + gap_size
+            scaffold_lengths.append(position - gap_size if position else 0)
+        self.positions = positions
+        self.scaffold_lengths = scaffold_lengths
+        self.gap_size = gap_size
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+tests/test_agp2assembly.py
+
+This file contains unit tests for functions of the agp2assembly.py script.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from juicebox_scripts.agp2assembly import InvalidAgpError, convert_agp, iter_agp, read_from_agp, write_assembly
+from juicebox_scripts.juicebox_assembly_converter import JuiceboxConverter
+
+class Agp2AssemblyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_file_dir = os.path.dirname(__file__) + '/collateral/test_inputs/'
+        self.expected_file_dir = os.path.dirname(__file__) + '/collateral/expected_test_outputs/'
+        self.tmp_dir = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.tmp_dir, 'out.assembly')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_agp(self, lines):
+        path = os.path.join(self.tmp_dir, 'test.agp')
+        with open(path, 'w') as f:
+            f.write('##agp-version 2.1\n')
+            for line in lines:
+                f.write('\t'.join(str(field) for field in line) + '\n')
+        return path
+
+    def test_convert_agp_round_trip(self):
+        convert_agp(self.expected_file_dir + 'expected_result_scaffolds.agp', self.out_file)
+        with open(self.test_file_dir + 'test_scaffolds.assembly') as f:
+            expected = f.read()
+        with open(self.out_file) as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_read_from_agp_matches_convert_agp(self):
+        agp = self.expected_file_dir + 'expected_result_breaks.agp'
+        lines, clusters, order = read_from_agp(agp)
+        write_assembly(lines, clusters, order, self.out_file)
+        with open(self.out_file) as f:
+            expected = f.read()
+        convert_agp(agp, self.out_file)
+        with open(self.out_file) as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_scaffold_order_is_first_appearance(self):
+        agp = self.write_agp([('b', 1, 10, 1, 'W', 'c1', 1, 10, '+'),
+                              ('a', 1, 5, 1, 'W', 'c2', 1, 5, '-'),
+                              ('b', 11, 20, 2, 'W', 'c3', 1, 10, '+')])
+        convert_agp(agp, self.out_file)
+        with open(self.out_file) as f:
+            self.assertEqual(f.read(), '>c1 1 10\n>c2 2 5\n>c3 3 10\n1 3\n-2\n')
+
+    def test_convert_agp_gaps(self):
+        agp = self.write_agp([('a', 1, 10, 1, 'W', 'c1', 1, 10, '+'),
+                              ('a', 11, 110, 2, 'U', 100, 'scaffold', 'yes', 'proximity_ligation'),
+                              ('a', 111, 120, 3, 'W', 'c2', 1, 10, '-'),
+                              ('a', 121, 170, 4, 'N', 50, 'scaffold', 'yes', 'proximity_ligation'),
+                              ('a', 171, 180, 5, 'W', 'c3', 1, 10, '+'),
+                              ('b', 1, 100, 1, 'U', 100, 'scaffold', 'yes', 'proximity_ligation'),
+                              ('c', 1, 5, 1, 'W', 'c4', 1, 5, '+')])
+        convert_agp(agp, self.out_file, gaps=True)
+        with open(self.out_file) as f:
+            self.assertEqual(f.read(), '>c1 1 10\n>c2 2 10\n>c3 3 10\n>c4 4 5\n>hic_gap_1 5 100\n>hic_gap_2 6 50\n'
+                                       '1 5 -2 6 3\n5\n4\n')
+
+    def test_convert_agp_gaps_skip_other_components(self):
+        agp = self.write_agp([('a', 1, 10, 1, 'W', 'c1', 1, 10, '+'),
+                              ('a', 11, 110, 2, 'N', 100, 'scaffold', 'yes', 'proximity_ligation'),
+                              ('a', 111, 210, 3, 'F', 'c2', 1, 100, '+')])
+        convert_agp(agp, self.out_file, gaps=True)
+        with open(self.out_file) as f:
+            self.assertEqual(f.read(), '>c1 1 10\n>hic_gap_1 2 100\n1 2\n')
+
+    def test_convert_agp_gaps_round_trip(self):
+        convert_agp(self.expected_file_dir + 'expected_result_breaks.agp', self.out_file, gaps=True)
+        breaks = JuiceboxConverter().process(self.test_file_dir + 'test.fasta', self.out_file)
+        with open(self.expected_file_dir + 'expected_result_breaks.agp') as f:
+            self.assertEqual(''.join(breaks.agp()), f.read())
+
+    def test_make_agp_from_fasta_zero_start(self):
+        agp = self.write_agp([('c1', 0, 10, 1, 'W', 'c1', 1, 10, '+')])
+        self.assertEqual([part.length for part in iter_agp(agp)], [10])
+
+    def test_invalid_agp(self):
+        bad_agps = [[('a', 1, 10, 1, 'W', 'c1', 1, 10)],
+                    [('a', 1, 10, 2, 'W', 'c1', 1, 10, '+')],
+                    [('a', 1, 10, 1, 'W', 'c1', 1, 10, '+'), ('a', 12, 20, 2, 'W', 'c2', 1, 9, '+')],
+                    [('a', 1, 10, 1, 'W', 'c1', 1, 9, '+')],
+                    [('a', 1, 10, 1, 'W', 'c1', 1, 10, '*')],
+                    [('a', 1, 10, 1, 'W', 'c1', 1, 10, '+'), ('a', 11, 20, 2, 'U', 100, 'scaffold', 'yes')],
+                    [('a', 'one', 10, 1, 'W', 'c1', 1, 10, '+')]]
+        for lines in bad_agps:
+            with self.assertRaises(InvalidAgpError):
+                list(iter_agp(self.write_agp(lines)))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+tests/test_fasta_cache.py
+
+This file contains unit tests for the on-disk fasta cache in
+fasta_cache.py.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from juicebox_scripts.fasta_cache import FastaCache
+from juicebox_scripts.juicebox_assembly_converter import JuiceboxConverter
+
+class FastaCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_file_dir = os.path.dirname(__file__) + '/collateral/test_inputs/'
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.test_fasta = os.path.join(self.tmp_dir, 'test.fasta')
+        shutil.copy(self.test_file_dir + 'test.fasta', self.test_fasta)
+        self.sequences = JuiceboxConverter()._read_fasta(self.test_fasta)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_fasta(self, name, sequence):
+        path = os.path.join(self.tmp_dir, name + '.fasta')
+        with open(path, 'w') as f:
+            f.write('>{0}\n{1}\n'.format(name, sequence))
+        return path
+
+    def assertCached(self, cache, fasta):
+        cached = cache.get(fasta)
+        self.assertIsNotNone(cached)
+        cached.close()
+
+    def test_put_and_get(self):
+        cache = FastaCache(self.cache_dir)
+        self.assertIsNone(cache.get(self.test_fasta))
+        cache.put(self.test_fasta, self.sequences).close()
+        cached = cache.get(self.test_fasta)
+        self.assertEqual(list(cached.keys()), list(self.sequences.keys()))
+        for name in self.sequences.keys():
+            self.assertEqual(cached.fetch(name), self.sequences[name])
+            self.assertEqual(cached.fetch(name, 3, 11), self.sequences[name][3:11])
+        cached.close()
+
+    def test_invalidated_when_fasta_changes(self):
+        cache = FastaCache(self.cache_dir)
+        cache.put(self.test_fasta, self.sequences).close()
+        with open(self.test_fasta, 'a') as f:
+            f.write('\n>extra\nACGT\n')
+        self.assertIsNone(cache.get(self.test_fasta))
+        cache.put(self.test_fasta, JuiceboxConverter()._read_fasta(self.test_fasta)).close()
+        self.assertEqual(len([name for name in os.listdir(self.cache_dir) if name.endswith('.json')]), 1)
+        with cache.get(self.test_fasta) as cached:
+            self.assertEqual(cached.fetch('extra'), 'ACGT')
+        self.assertEqual(cache.invalidate(self.test_fasta), 1)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_lru_eviction(self):
+        fastas = [self.write_fasta('seq{0}'.format(i), 'ACGT' * 250) for i in range(3)]
+        cache = FastaCache(self.cache_dir, max_bytes=2500)
+        for i, fasta in enumerate(fastas[:2]):
+            cache.put(fasta, JuiceboxConverter()._read_fasta(fasta)).close()
+            manifest = cache._paths(cache.key(fasta))[2]
+            os.utime(manifest, (1000 + i, 1000 + i))
+        # using the first entry makes the second the least recently used
+        self.assertCached(cache, fastas[0])
+        cache.put(fastas[2], JuiceboxConverter()._read_fasta(fastas[2])).close()
+        self.assertCached(cache, fastas[0])
+        self.assertIsNone(cache.get(fastas[1]))
+        self.assertCached(cache, fastas[2])
+
+    def test_process_with_cache(self):
+        cache = FastaCache(self.cache_dir)
+        assembly = self.test_file_dir + 'test_breaks.assembly'
+        expected = JuiceboxConverter().process(self.test_fasta, assembly)
+        for _ in range(2):
+            with JuiceboxConverter().process(self.test_fasta, assembly, cache=cache) as processed:
+                self.assertEqual(processed.fasta(), expected.fasta())
+                self.assertEqual(processed.agp(), expected.agp())
+        self.assertCached(cache, self.test_fasta)
+
+if __name__ == '__main__':
+    unittest.main()
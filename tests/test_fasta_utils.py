@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+tests/test_fasta_utils.py
+
+This file contains unit tests for functions of the fasta_utils.py script.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+
+import gzip
+import io
+import os
+import pickle
+import random
+import struct
+import zlib
+import shutil
+import tempfile
+import unittest
+
+from juicebox_scripts.juicebox_assembly_converter import JuiceboxConverter
+from juicebox_scripts.fasta_utils import IndexedFasta, FastaIndexError, build_fai, read_fai, \
+    reverse_complement, iter_reverse_complement, BgzfWriter, open_input, iter_fasta_blocks, InvalidFastaError, \
+    SequenceDict, SequenceView, iter_sequence_chunks, FaiEntry
+
+
+class FastaUtilsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_file_dir = os.path.dirname(__file__) + '/collateral/test_inputs/'
+        self.tmp_dir = tempfile.mkdtemp()
+        self.test_fasta = os.path.join(self.tmp_dir, 'test.fasta')
+        shutil.copy(self.test_file_dir + 'test.fasta', self.test_fasta)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_tmp(self, name, contents):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_indexed_fasta_matches_in_memory(self):
+        sequences = JuiceboxConverter()._read_fasta(self.test_fasta)
+        with IndexedFasta(self.test_fasta) as indexed:
+            self.assertEqual(list(indexed.keys()), list(sequences.keys()))
+            for name in sequences:
+                self.assertEqual(indexed.length(name), len(sequences[name]))
+                self.assertEqual(indexed[name], sequences[name])
+                for start, end in ((0, 1), (3, 17), (15, 33), (16, 48), (5, 1000)):
+                    self.assertEqual(indexed.fetch(name, start, end), sequences.fetch(name, start, end))
+        self.assertTrue(os.path.exists(self.test_fasta + '.fai'))
+
+    def test_fai_is_reused(self):
+        IndexedFasta(self.test_fasta).close()
+        entries = read_fai(self.test_fasta + '.fai')
+        self.assertEqual(entries, build_fai(self.test_fasta))
+        self.assertEqual(entries[-1].linebases, 16)
+        self.assertEqual(entries[-1].linewidth, 17)
+        self.assertEqual(entries[-1].length, 64)
+
+    def test_pickle_reopens(self):
+        with IndexedFasta(self.test_fasta) as indexed:
+            copy = pickle.loads(pickle.dumps(indexed))
+            self.assertEqual(copy.fasta, indexed.fasta)
+            self.assertEqual(copy.fetch('contig_9_len_64', 10, 40), indexed.fetch('contig_9_len_64', 10, 40))
+            copy.close()
+
+    def test_unwritable_fai_kept_in_memory(self):
+        fai = os.path.join(self.tmp_dir, 'missing_dir', 'test.fasta.fai')
+        with IndexedFasta(self.test_fasta, fai=fai) as indexed:
+            self.assertIsNone(indexed.fai)
+            self.assertEqual(indexed.length('contig_9_len_64'), 64)
+            copy = pickle.loads(pickle.dumps(indexed))
+            self.assertEqual(copy.fetch('contig_9_len_64', 10, 40), indexed.fetch('contig_9_len_64', 10, 40))
+            copy.close()
+        self.assertFalse(os.path.exists(fai))
+
+    def test_crlf_fasta(self):
+        path = self.write_tmp('crlf.fasta', '>a desc\r\nACGT\r\nAC\r\n>b\r\nTTTT\r\n')
+        with IndexedFasta(path) as indexed:
+            self.assertEqual(indexed['a'], 'ACGTAC')
+            self.assertEqual(indexed.fetch('a', 2, 5), 'GTA')
+            self.assertEqual(indexed['b'], 'TTTT')
+
+    def test_irregular_fasta(self):
+        path = self.write_tmp('irregular.fasta', '>a\nACG\nACGT\n')
+        with self.assertRaises(FastaIndexError):
+            build_fai(path)
+        path = self.write_tmp('duplicate.fasta', '>a\nACG\n>a\nACG\n')
+        with self.assertRaises(FastaIndexError):
+            build_fai(path)
+
+    def test_iter_fasta_blocks(self):
+        contents = b'>a desc\nACGT\nAC\n\n>b\r\nGG TT\r\nC\r\n>c\n>d\nNNNN'
+        expected = [('a', b'ACGTAC'), ('b', b'GGTTC'), ('c', b''), ('d', b'NNNN')]
+        # every block size, so that headers, newlines and the '\n>' of
+        # each record boundary are split across blocks somewhere
+        for block_size in range(1, len(contents) + 1):
+            self.assertEqual(list(iter_fasta_blocks(io.BytesIO(contents), block_size=block_size)), expected)
+        self.assertEqual(list(iter_fasta_blocks(io.BytesIO(b'>a'))), [('a', b'')])
+        self.assertEqual(list(iter_fasta_blocks(io.BytesIO(b'\n\n>a\nA\n'))), [('a', b'A')])
+        with self.assertRaises(InvalidFastaError):
+            list(iter_fasta_blocks(io.BytesIO(b'ACGT\n>a\nA\n')))
+
+    def test_iter_fasta_blocks_count_only(self):
+        contents = b'>a desc\nACGT\nAC\n\n>b\r\nGG TT\r\nC\r\n>c\n>d\nNNNN'
+        for block_size in range(1, len(contents) + 1):
+            self.assertEqual(list(iter_fasta_blocks(io.BytesIO(contents), block_size=block_size, count_only=True)),
+                             [('a', 6), ('b', 5), ('c', 0), ('d', 4)])
+
+    def test_iter_fasta_blocks_index(self):
+        contents = b'\n>a desc\nACGT\nACGT\nAC\n\n>b\r\nGGT\r\nTTC\r\nC\r\n>c\n>d\nNNNN'
+        expected = [FaiEntry('a', 10, 9, 4, 5), FaiEntry('b', 7, 27, 3, 5), FaiEntry('c', 0, 43, 0, 0),
+                    FaiEntry('d', 4, 46, 4, 4)]
+        for block_size in range(1, len(contents) + 1):
+            self.assertEqual(list(iter_fasta_blocks(io.BytesIO(contents), block_size=block_size, index=True)),
+                             [(entry.name, entry) for entry in expected])
+        for contents in (b'>a\nACGT\nAC\nACGT\n', b'>a\nACGT\nACGTA\n', b'>a\nACGT\n\nACGT\n', b'>a\nACGT\r\nACGT\n',
+                         b'>a\nACGT\nACG\r\n', b'>a\nACGT\nAC\nGT\nACGT\n', b'>a\nA\n>a\nA\n', b'>\nA\n', b'A\n>a\nA\n'):
+            for block_size in (1, 3, 8, 1 << 10):
+                with self.assertRaises(FastaIndexError):
+                    list(iter_fasta_blocks(io.BytesIO(contents), block_size=block_size, index=True))
+
+    def test_iter_fasta_blocks_skips_unwanted(self):
+        contents = b'>a desc\nACGT\nAC\n>b\nGGTT\nC\n>c\nNN\n>d'
+        for block_size in range(1, len(contents) + 1):
+            skipped = dict()
+            records = list(iter_fasta_blocks(io.BytesIO(contents), block_size=block_size, names=set(['b', 'x']),
+                                             skipped=skipped))
+            self.assertEqual(records, [('b', b'GGTTC')])
+            self.assertEqual(skipped, {'a': 16, 'c': 6, 'd': 2})
+
+    def test_sequence_dict_bytes(self):
+        sequences = SequenceDict()
+        sequences['a'] = b'ACGTACGT'
+        sequences['b'] = 'ACGT'
+        self.assertEqual(sequences['a'], 'ACGTACGT')
+        self.assertEqual(sequences.fetch('a', 2, 5), 'GTA')
+        self.assertEqual(sequences.fetch('b', 1), 'CGT')
+        self.assertEqual(sequences.length('a'), 8)
+
+    def test_reverse_complement(self):
+        self.assertEqual(reverse_complement('AACGTNacgtn'), 'nacgtNACGTT')
+        self.assertEqual(reverse_complement('RYKMSWBDHVU'), 'ABDHVWSKMRY')
+        self.assertEqual(reverse_complement('rykmswbdhvu'), 'abdhvwskmry')
+        self.assertEqual(reverse_complement(b'AACGRn'), b'nYCGTT')
+        self.assertEqual(reverse_complement(''), '')
+
+    def test_iter_reverse_complement(self):
+        sequence = 'ACGTRYKMNacgtrykmn' * 11
+        for chunk_size in (1, 7, 18, 1000):
+            chunks = list(iter_reverse_complement(sequence, chunk_size=chunk_size))
+            self.assertEqual(''.join(chunks), reverse_complement(sequence))
+
+    def test_iter_sequence_chunks(self):
+        sequences = JuiceboxConverter()._read_fasta(self.test_fasta)
+        view = SequenceView(sequences, 'contig_9_len_64', 5, 60)
+        expected = sequences['contig_9_len_64'][5:60]
+        for chunk_size in (1, 7, 55, 1000):
+            chunks = list(iter_sequence_chunks(view, chunk_size=chunk_size))
+            self.assertTrue(all(len(chunk) <= chunk_size for chunk in chunks))
+            self.assertEqual(''.join(chunks), expected)
+            self.assertEqual(''.join(iter_sequence_chunks(view, reverse=True, chunk_size=chunk_size)),
+                             reverse_complement(expected))
+            self.assertEqual(''.join(iter_sequence_chunks(expected, reverse=True, chunk_size=chunk_size)),
+                             reverse_complement(expected))
+
+    def test_bgzf_writer(self):
+        rng = random.Random(0)
+        data = ''.join(rng.choice('ACGTN\n') for _ in range(300000))
+        for threads in (1, 3):
+            path = os.path.join(self.tmp_dir, 'out{0}.gz'.format(threads))
+            with BgzfWriter(path, threads=threads) as writer:
+                for start in range(0, len(data), 7777):
+                    writer.write(data[start:start + 7777])
+            writer.write_gzi(path + '.gzi')
+            with gzip.open(path, 'rb') as f:
+                self.assertEqual(f.read().decode('ascii'), data)
+            with open(path, 'rb') as f:
+                compressed = f.read()
+            with open(path + '.gzi', 'rb') as f:
+                gzi = f.read()
+            self.assertEqual(struct.unpack('<Q', gzi[:8])[0], len(writer.gzi_entries))
+            self.assertEqual(len(writer.gzi_entries), 4)
+            for compressed_offset, uncompressed_offset in writer.gzi_entries:
+                block = zlib.decompressobj(31).decompress(compressed[compressed_offset:])
+                self.assertEqual(block.decode('ascii'), data[uncompressed_offset:uncompressed_offset + len(block)])
+
+    def test_open_input_gzip(self):
+        path = os.path.join(self.tmp_dir, 'test.fasta.gz')
+        with open(self.test_fasta, 'rb') as f, gzip.open(path, 'wb') as out:
+            out.write(f.read())
+        with open_input(path) as f, open(self.test_fasta) as expected:
+            self.assertEqual(f.read(), expected.read())
+        with self.assertRaises(FastaIndexError):
+            IndexedFasta(path)
+
+if __name__ == '__main__':
+    unittest.main()
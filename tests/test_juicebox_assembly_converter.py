@@ -25,7 +25,11 @@ along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.h
 '''
 
 import filecmp
+import gzip
 import os
+import shutil
+import sys
+import tempfile
 import unittest
 #uncomment the below lines if you need to have the ability to run this
 #file directly either from the the root directory, but you can avoid
@@ -34,11 +38,35 @@ import unittest
 #import sys
 # sys.path.append('src/')
 # sys.path.append('../src/')
-from juicebox_scripts.juicebox_assembly_converter import JuiceboxConverter, ProcessedAssembly
+from juicebox_scripts.juicebox_assembly_converter import JuiceboxConverter, ProcessedAssembly, \
+    _WrappedFastaWriter, _ListWriter, _imap_bounded, _render_context
 
+import functools
+import multiprocessing
+import random
+
+from juicebox_scripts.fasta_utils import IndexedFasta, SequenceDict, SequenceView, build_fai, read_fai
+from juicebox_scripts.juicebox_assembly_converter import sort_assembly_map, cmp_assembly_map_entries
+from juicebox_scripts.juicebox_assembly_converter import AgpRecord, AgpGapRecord, BedRecord, BedGapRecord, \
+    BreakRecord, format_record, ScaffoldInfo, AssemblySummary, n_stat
 from juicebox_scripts.juicebox_assembly_converter import InvalidFastaError, MissingFragmentError, \
-    UnscaffoldedContigError, ZeroLengthContigError, BadContigNameError
-            
+    UnscaffoldedContigError, ZeroLengthContigError, BadContigNameError, DuplicatePlacementError
+
+
+class _Output(object):
+    '''Collects what is printed to it, as native str on Python 2 and 3'''
+    def __init__(self):
+        self.written = list()
+
+    def write(self, text):
+        self.written.append(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return ''.join(self.written)
+
 
 class JuiceboxConverterTestCase(unittest.TestCase):
     def setUp(self):
@@ -62,6 +90,8 @@ class JuiceboxConverterTestCase(unittest.TestCase):
         self.test_contigs_assembly = self.test_file_dir + 'test_contigs.assembly'
         self.test_scaffolds_bad_assembly = self.test_file_dir + 'test_scaffolds_bad.assembly'
         self.test_scaffolds_assembly = self.test_file_dir + 'test_scaffolds.assembly'
+        self.test_scaffolds_duplicate_assembly = self.test_file_dir + 'test_scaffolds_duplicate.assembly'
+        self.test_scaffolds_missing_index_assembly = self.test_file_dir + 'test_scaffolds_missing_index.assembly'
         self.test_fasta = self.test_file_dir + 'test.fasta'
 
         self.expected_outputs_dir = self.collateral_dir + 'expected_test_outputs/'
@@ -190,6 +220,46 @@ class JuiceboxConverterTestCase(unittest.TestCase):
         contigs.write_fasta(self.test_output_fasta)
         self.assertTrue(filecmp.cmp(self.expected_result_contigs_fasta, self.test_output_fasta))
 
+    def test_write_fasta_scaffolds(self):
+        scaffolds = self.converter.process(self.test_fasta, self.test_scaffolds_assembly)
+        scaffolds.write_fasta(self.test_output_fasta)
+        self.assertTrue(filecmp.cmp(self.expected_result_scaffolds_fasta, self.test_output_fasta))
+
+    def test_wrapped_fasta_writer_across_pieces(self):
+        sequence = 'ACGTN' * 97
+        whole = _ListWriter()
+        writer = _WrappedFastaWriter(whole, line_len=7)
+        writer.start_record('a')
+        writer.write(sequence)
+        writer.start_record('b')
+        writer.write(sequence)
+        pieces = _ListWriter()
+        writer = _WrappedFastaWriter(pieces, line_len=7)
+        for name in ('a', 'b'):
+            writer.start_record(name)
+            offset = 0
+            for size in (1, 6, 7, 8, 0, 13, 14, 100):
+                writer.write(sequence[offset:offset+size])
+                offset += size
+            writer.write(sequence[offset:])
+        self.assertEqual(''.join(pieces.chunks), ''.join(whole.chunks))
+        lines = ''.join(whole.chunks).split('\n')
+        self.assertEqual(lines[0], '>a')
+        self.assertEqual(lines[1], sequence[:7])
+        self.assertFalse(''.join(whole.chunks).endswith('\n'))
+
+    def test_wrapped_fasta_writer_writes_in_batches(self):
+        sequence = ''.join(random.Random(0).choice('ACGT') for _ in range(100000))
+        out = _ListWriter()
+        writer = _WrappedFastaWriter(out, line_len=3)
+        writer.start_record('a')
+        writer.write(sequence)
+        writer.finish()
+        self.assertGreater(len(out.chunks), 2)
+        self.assertLessEqual(max(len(chunk) for chunk in out.chunks), 2 * 16384 + 1)
+        self.assertEqual(''.join(out.chunks).split('\n', 1)[1].replace('\n', ''), sequence)
+        self.assertEqual(writer.fai_entries[0].length, len(sequence))
+
     def test_write_agp(self):
         contigs = self.converter.process(self.test_fasta, self.test_contigs_assembly)
         contigs.write_agp(self.test_output_agp)
@@ -205,6 +275,290 @@ class JuiceboxConverterTestCase(unittest.TestCase):
         contigs.write_break_report(self.test_output_break_report)
         self.assertTrue(filecmp.cmp(self.expected_result_breaks_broken_contigs_txt, self.test_output_break_report))
 
+    def test_sort_assembly_map_matches_cmp(self):
+        assembly_map = [('ctg_{0}:::fragment_{1}{2}'.format(contig, fragment, ':::debris' if fragment % 2 else ''),
+                         str(contig * fragment)) for contig in range(20) for fragment in range(1, 12)]
+        assembly_map += [('unbroken_{0}'.format(contig), '10') for contig in range(20)]
+        random.Random(0).shuffle(assembly_map)
+        expected = sorted(assembly_map, key=functools.cmp_to_key(cmp_assembly_map_entries))
+        sort_assembly_map(assembly_map)
+        self.assertEqual(assembly_map, expected)
+
+    def test_sort_assembly_map_repeats(self):
+        with self.assertRaises(BadContigNameError):
+            sort_assembly_map([('a:::fragment_1', '1'), ('b', '1'), ('a:::fragment_1:::debris', '1')])
+        with self.assertRaises(BadContigNameError):
+            sort_assembly_map([('a:::fragment_1', '1'), ('a', '1')])
+
+    def test_many_trashed_debris_renamed(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fasta = os.path.join(tmp_dir, 'debris.fasta')
+            assembly = os.path.join(tmp_dir, 'debris.assembly')
+            num_contigs = 5000
+            with open(fasta, 'w') as f:
+                for index in range(num_contigs):
+                    f.write('>ctg_{0}\nACGT\n'.format(index))
+            with open(assembly, 'w') as f:
+                for index in range(num_contigs):
+                    f.write('>ctg_{0}:::debris {1} 4\n'.format(index, index + 1))
+                f.write(' '.join(str(-(index + 1)) for index in range(num_contigs)) + '\n')
+            # each trashed contig prints a warning, which is checked
+            # rather than flooding the test output
+            stdout = sys.stdout
+            sys.stdout = _Output()
+            try:
+                scaffolds = self.converter.process(fasta, assembly)
+            finally:
+                output, sys.stdout = sys.stdout, stdout
+            self.assertEqual(output.getvalue().count('WARNING: trying to map debris fragment'), num_contigs)
+            self.assertEqual([contig[0] for contig in scaffolds.scaffolds[0]],
+                             ['ctg_{0}'.format(index) for index in range(num_contigs)])
+            self.assertEqual(set(contig[2] for contig in scaffolds.scaffolds[0]), set(['-']))
+            self.assertEqual(scaffolds.bed()[2].split('\t')[3], 'ctg_0')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_only_assembly_contigs_read(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fasta = os.path.join(tmp_dir, 'extra.fasta')
+            with open(self.test_fasta) as f:
+                contents = f.read()
+            with open(fasta, 'w') as f:
+                f.write('>organelle\nACGTACGT\n' + contents.rstrip('\n') + '\n>haplotype_2\nNNNN\n')
+            for assembly in (self.test_breaks_assembly, self.test_reordered_breaks_debris_assembly):
+                expected = self.converter.process(self.test_fasta, assembly)
+                processed = self.converter.process(fasta, assembly)
+                self.assertEqual(processed.fasta(), expected.fasta())
+            assembly_map, _ = self.converter._read_assembly(self.test_breaks_assembly)
+            sequences = self.converter._read_fasta(fasta, names=self.converter._fasta_names(assembly_map))
+            self.assertNotIn('organelle', sequences)
+            self.assertNotIn('haplotype_2', sequences)
+            self.assertIn('contig_1_len_29', sequences)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_breaks_are_views(self):
+        sequences = self.converter._read_fasta(self.test_fasta)
+        assembly_map, scaffolds = self.converter._read_assembly(self.test_breaks_assembly)
+        fragments = self.converter._add_breaks(sequences, assembly_map)
+        for name, fragment in fragments.items():
+            self.assertIsInstance(fragment, SequenceView)
+        view = fragments['contig_1_len_29:::fragment_3']
+        self.assertEqual((view.name, view.start, view.end), ('contig_1_len_29', 15, 29))
+        self.assertEqual(len(view), 14)
+        self.assertEqual(view.resolve(), sequences['contig_1_len_29'][15:])
+
+    def test_processed_assembly_accepts_strings(self):
+        breaks = self.converter.process(self.test_fasta, self.test_breaks_assembly)
+        resolved = dict((name, breaks._sequence(name)) for name in breaks.sequences)
+        from_strings = ProcessedAssembly(resolved, breaks.assembly_map, breaks.scaffolds)
+        self.assertEqual(from_strings.fasta(), self.read_file_lines(self.expected_result_breaks_fasta))
+
+    def test_indexed_matches_in_memory(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fasta = os.path.join(tmp_dir, 'test.fasta')
+            shutil.copy(self.test_fasta, fasta)
+            for assembly in (self.test_contigs_assembly, self.test_scaffolds_assembly,
+                             self.test_breaks_assembly, self.test_reordered_breaks_debris_assembly):
+                expected = self.converter.process(self.test_fasta, assembly)
+                with self.converter.process(fasta, assembly, indexed=True) as indexed:
+                    self.assertEqual(indexed.fasta(), expected.fasta())
+                    self.assertEqual(indexed.agp(), expected.agp())
+                self.assertIsNone(indexed.store)
+            self.assertTrue(os.path.exists(fasta + '.fai'))
+            bad_fasta = os.path.join(tmp_dir, 'bad.fasta')
+            shutil.copy(self.test_bad_fasta_1, bad_fasta)
+            with self.assertRaises(InvalidFastaError):
+                self.converter.process(bad_fasta, self.test_contigs_assembly, indexed=True)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_write_outputs(self):
+        breaks = self.converter.process(self.test_fasta, self.test_breaks_assembly)
+        breaks.write_outputs(fasta=self.test_output_fasta, agp=self.test_output_agp, bed=self.test_output_bed,
+                             break_report=self.test_output_break_report)
+        self.assertTrue(filecmp.cmp(self.expected_result_breaks_fasta, self.test_output_fasta))
+        self.assertTrue(filecmp.cmp(self.expected_result_breaks_agp, self.test_output_agp))
+        self.assertTrue(filecmp.cmp(self.expected_result_breaks_bed, self.test_output_bed))
+        self.assertTrue(filecmp.cmp(self.expected_result_breaks_broken_contigs_txt, self.test_output_break_report))
+
+    def test_write_fasta_threads(self):
+        for assembly, expected in ((self.test_breaks_assembly, self.expected_result_breaks_fasta),
+                                   (self.test_scaffolds_assembly, self.expected_result_scaffolds_fasta)):
+            processed = self.converter.process(self.test_fasta, assembly)
+            processed.write_outputs(fasta=self.test_output_fasta, agp=self.test_output_agp, threads=2)
+            self.assertTrue(filecmp.cmp(expected, self.test_output_fasta))
+        self.assertTrue(filecmp.cmp(self.expected_result_scaffolds_agp, self.test_output_agp))
+
+    def test_render_context_never_pickles_sequence_dict(self):
+        self.assertIsNotNone(_render_context(SequenceDict()))
+        if not hasattr(multiprocessing, 'get_all_start_methods'):
+            return
+        get_all_start_methods = multiprocessing.get_all_start_methods
+        multiprocessing.get_all_start_methods = lambda: ['spawn']
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            self.assertIsNone(_render_context(SequenceDict()))
+            with IndexedFasta(self.test_fasta, fai=os.path.join(tmp_dir, 'test.fasta.fai')) as indexed:
+                self.assertIsNotNone(_render_context(indexed))
+            # without a pool the FASTA is written in this process
+            processed = self.converter.process(self.test_fasta, self.test_breaks_assembly)
+            processed.write_outputs(fasta=self.test_output_fasta, threads=2)
+            self.assertTrue(filecmp.cmp(self.expected_result_breaks_fasta, self.test_output_fasta))
+        finally:
+            multiprocessing.get_all_start_methods = get_all_start_methods
+            shutil.rmtree(tmp_dir)
+
+    def test_imap_bounded(self):
+        class Result(object):
+            def __init__(self, pool, value):
+                self.pool, self.value = pool, value
+
+            def get(self):
+                self.pool.in_flight -= 1
+                return self.value
+
+        class Pool(object):
+            in_flight = max_in_flight = 0
+
+            def apply_async(self, function, args):
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                return Result(self, function(*args))
+
+        pool = Pool()
+        self.assertEqual(list(_imap_bounded(pool, lambda x: x * 2, range(100), 3)), list(range(0, 200, 2)))
+        self.assertEqual(pool.max_in_flight, 6)
+
+    def test_iter_records(self):
+        breaks = self.converter.process(self.test_fasta, self.test_breaks_assembly)
+        agp_records = list(breaks.iter_agp_records())
+        self.assertEqual(agp_records[0], AgpRecord('PGA_scaffold_1__3_contigs__length_212', 1, 10, 1, 'W',
+                                                   'contig_1_len_29:::fragment_1', 1, 10, '+'))
+        self.assertEqual(agp_records[1], AgpGapRecord('PGA_scaffold_1__3_contigs__length_212', 11, 110, 2, 'U',
+                                                      100, 'scaffold', 'yes', 'proximity_ligation'))
+        self.assertEqual(''.join(format_record(record) for record in agp_records),
+                         ''.join(breaks.agp()[2:]) + '\n')
+        bed_records = list(breaks.iter_bed_records())
+        self.assertIsInstance(bed_records[0], BedRecord)
+        self.assertIsInstance(bed_records[1], BedGapRecord)
+        self.assertEqual(''.join(format_record(record) for record in bed_records),
+                         ''.join(breaks.bed()[2:]) + '\n')
+        self.assertEqual(list(breaks.iter_break_records())[0],
+                         BreakRecord('contig_1_len_29', 'contig_1_len_29:::fragment_1', 0, 10, 10))
+        with open(self.expected_result_breaks_fasta) as f:
+            expected = dict((record.split('\n', 1)[0], record.split('\n', 1)[1].replace('\n', ''))
+                            for record in f.read()[1:].split('\n>'))
+        sequences = list(breaks.iter_scaffold_sequences())
+        self.assertEqual(len(sequences), len(expected))
+        for record in sequences:
+            self.assertEqual(record.sequence, expected[record.name])
+
+    def test_scaffold_table_and_summary(self):
+        scaffolds = self.converter.process(self.test_fasta, self.test_scaffolds_assembly)
+        table = scaffolds.scaffold_table()
+        self.assertEqual(table[0], ScaffoldInfo('PGA_scaffold_1__3_contigs__length_231', 231, 3, 2))
+        self.assertEqual([scaffold.length for scaffold in table], [231, 271, 25, 180])
+        self.assertEqual(scaffolds.summary(), AssemblySummary(4, 9, 5, 707, 271, 231, 2, 180, 3, 26, 3))
+        scaffolds.simple_chr_names = True
+        self.assertEqual([scaffold.name for scaffold in scaffolds.scaffold_table()],
+                         ['Chromosome1', 'Chromosome2', 'contig_7_len_25', 'Chromosome4'])
+        self.assertEqual(n_stat([]), (0, 0))
+        self.assertEqual(n_stat([2, 8, 3, 7], 0.5), (7, 2))
+
+    def test_write_outputs_incremental(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fasta = os.path.join(tmp_dir, 'test.fasta')
+            shutil.copy(self.test_fasta, fasta)
+            output = os.path.join(tmp_dir, 'out.fasta')
+            manifest = os.path.join(tmp_dir, 'out.manifest.json')
+            edited_assembly = os.path.join(tmp_dir, 'edited.assembly')
+            with open(self.test_breaks_assembly) as f, open(edited_assembly, 'w') as out:
+                out.write(f.read().replace('\n-15\n', '\n15\n'))
+
+            def count_renders(processed):
+                rendered = []
+                render = processed._render_fasta_record
+                processed._render_fasta_record = lambda index: rendered.append(index) or render(index)
+                return rendered
+
+            breaks = self.converter.process(fasta, self.test_breaks_assembly)
+            rendered = count_renders(breaks)
+            breaks.write_outputs(fasta=output, manifest=manifest)
+            self.assertTrue(filecmp.cmp(self.expected_result_breaks_fasta, output))
+            for threads in (1, 2):
+                edited = self.converter.process(fasta, edited_assembly)
+                expected = ''.join(edited.fasta())
+                rendered = count_renders(edited)
+                edited.write_outputs(fasta=output, agp=self.test_output_agp, manifest=manifest, threads=threads)
+                with open(output) as f:
+                    self.assertEqual(f.read(), expected)
+                if threads == 1:
+                    # the scaffold just changed, then nothing on the second run
+                    self.assertEqual(rendered, [5])
+                    self.converter.process(fasta, self.test_breaks_assembly).write_outputs(fasta=output,
+                                                                                          manifest=manifest)
+                    self.assertTrue(filecmp.cmp(self.expected_result_breaks_fasta, output))
+
+            # a changed source fasta invalidates the manifest
+            os.utime(fasta, (1, 1))
+            breaks = self.converter.process(fasta, self.test_breaks_assembly)
+            self.assertIsNone(breaks._read_manifest(manifest, output))
+            breaks.write_outputs(fasta=output, manifest=manifest)
+            self.assertTrue(filecmp.cmp(self.expected_result_breaks_fasta, output))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_gzip_input_bgzip_output(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fasta = os.path.join(tmp_dir, 'test.fasta.gz')
+            with open(self.test_fasta, 'rb') as f, gzip.open(fasta, 'wb') as out:
+                out.write(f.read())
+            for threads in (1, 2):
+                output = os.path.join(tmp_dir, 'out.fasta.gz')
+                with self.converter.process(fasta, self.test_breaks_assembly, indexed=True) as breaks:
+                    breaks.write_outputs(fasta=output, agp=self.test_output_agp, threads=threads)
+                with gzip.open(output, 'rb') as f, open(self.expected_result_breaks_fasta, 'rb') as expected:
+                    self.assertEqual(f.read(), expected.read())
+                self.assertEqual([entry[:4] for entry in read_fai(output + '.fai')],
+                                 [entry[:4] for entry in build_fai(self.expected_result_breaks_fasta)])
+                self.assertTrue(os.path.exists(output + '.gzi'))
+                self.assertTrue(filecmp.cmp(self.expected_result_breaks_agp, self.test_output_agp))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_non_ascii_names(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fasta = os.path.join(tmp_dir, 'names.fasta')
+            assembly = os.path.join(tmp_dir, 'names.assembly')
+            # a UTF-8 name and a name which is not valid UTF-8
+            with open(fasta, 'wb') as f:
+                f.write(b'>contig_\xc3\xa9 desc\nACGTACGTAC\n>contig_\xff\nGGGG\n')
+            with open(assembly, 'wb') as f:
+                f.write(b'>contig_\xc3\xa9 1 10\n>contig_\xff 2 4\n1\n2\n')
+            for indexed in (False, True):
+                output = os.path.join(tmp_dir, 'out.fasta.gz')
+                uncompressed = os.path.join(tmp_dir, 'out.fasta')
+                agp = os.path.join(tmp_dir, 'out.agp')
+                with self.converter.process(fasta, assembly, contig_mode=True, indexed=indexed) as processed:
+                    processed.write_outputs(fasta=output, agp=agp)
+                with gzip.open(output, 'rb') as f, open(uncompressed, 'wb') as out:
+                    contents = f.read()
+                    out.write(contents)
+                self.assertEqual(contents, b'>contig_\xc3\xa9\nACGTACGTAC\n>contig_\xff\nGGGG')
+                self.assertEqual([entry[:4] for entry in read_fai(output + '.fai')],
+                                 [entry[:4] for entry in build_fai(uncompressed)])
+                with open(agp, 'rb') as f:
+                    self.assertIn(b'\tcontig_\xff\t', f.read())
+        finally:
+            shutil.rmtree(tmp_dir)
+
     def test_bad_contigs(self):
         with self.assertRaises(ZeroLengthContigError):
             self.converter.process(self.test_fasta, self.test_contigs_bad_assembly)
@@ -213,6 +567,14 @@ class JuiceboxConverterTestCase(unittest.TestCase):
         with self.assertRaises(UnscaffoldedContigError):
             self.converter.process(self.test_fasta, self.test_scaffolds_bad_assembly)
 
+    def test_duplicate_scaffold_placement(self):
+        with self.assertRaises(DuplicatePlacementError):
+            self.converter.process(self.test_fasta, self.test_scaffolds_duplicate_assembly)
+
+    def test_scaffold_index_missing(self):
+        with self.assertRaises(MissingFragmentError):
+            self.converter.process(self.test_fasta, self.test_scaffolds_missing_index_assembly)
+
     def test_bad_breaks(self):
         with self.assertRaises(MissingFragmentError):
             self.converter.process(self.test_fasta, self.test_breaks_bad_assembly)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+tests/test_juicebox_assembly_pipeline.py
+
+This file contains unit tests for the juicebox_assembly_pipeline.py
+script.
+
+Copyright 2019, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+
+import filecmp
+import os
+import shutil
+import tempfile
+import unittest
+
+from juicebox_scripts.agp2assembly import convert_agp
+from juicebox_scripts.juicebox_assembly_converter import JuiceboxConverter
+from juicebox_scripts.juicebox_assembly_pipeline import run_pipeline
+
+class JuiceboxPipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collateral = os.path.dirname(__file__) + '/collateral/'
+        self.test_fasta = self.collateral + 'test_inputs/test.fasta'
+        self.tmp_dir = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.tmp_dir, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_file(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_pipeline_purge(self):
+        purged_assembly = os.path.join(self.tmp_dir, 'purged.assembly')
+        expected_assembly = self.collateral + 'expected_test_outputs/test_filter_assembly_minus_three.assembly'
+        summary = run_pipeline(self.test_fasta, self.collateral + 'test_inputs/test_scaffolds.assembly',
+                               prefix=self.prefix, purged_assembly=purged_assembly,
+                               exclude=set(['contig_1_len_29', 'contig_8_len_16']), exclude_regex=['^contig_5_'])
+        self.assertEqual(summary.purged, 3)
+        self.assertTrue(filecmp.cmp(purged_assembly, expected_assembly))
+        expected = JuiceboxConverter().process(self.test_fasta, expected_assembly)
+        self.assertEqual(self.read_file(self.prefix + '.fasta'), ''.join(expected.fasta()))
+        self.assertEqual(self.read_file(self.prefix + '.agp'), ''.join(expected.agp()))
+        self.assertEqual(self.read_file(self.prefix + '.bed'), ''.join(expected.bed()))
+
+    def test_pipeline_purge_contig_mode(self):
+        purged_assembly = os.path.join(self.tmp_dir, 'purged.assembly')
+        run_pipeline(self.test_fasta, self.collateral + 'test_inputs/test_scaffolds.assembly',
+                     prefix=self.prefix, purged_assembly=purged_assembly,
+                     exclude=set(['contig_1_len_29']), contig_mode=True)
+        self.assertTrue(filecmp.cmp(purged_assembly,
+                                    self.collateral + 'expected_test_outputs/test_filter_assembly_minus_one.assembly'))
+        with self.assertRaises(ValueError):
+            run_pipeline(self.test_fasta, self.collateral + 'test_inputs/test_scaffolds.assembly',
+                         prefix=self.prefix, exclude=set(['missing']), contig_mode=True)
+
+    def test_pipeline_degap(self):
+        gapped_assembly = os.path.join(self.tmp_dir, 'gapped.assembly')
+        convert_agp(self.collateral + 'expected_test_outputs/expected_result_breaks.agp', gapped_assembly, gaps=True)
+        self.assertIsNone(run_pipeline(self.test_fasta, gapped_assembly, prefix=self.prefix))
+        expected_dir = self.collateral + 'expected_test_outputs/'
+        for extension in ('.fasta', '.agp', '.bed'):
+            self.assertEqual(self.read_file(self.prefix + extension),
+                             self.read_file(expected_dir + 'expected_result_breaks' + extension))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -51,7 +51,11 @@ class JuiceboxPurgerTestCase(unittest.TestCase):
         outfiles = ["test_filter_assembly_null.assembly",
                     "test_filter_assembly_minus_one.assembly",
                     "test_filter_assembly_minus_three.assembly",
-                    "test_filter_assembly_missing_contig.assembly"]
+                    "test_filter_assembly_missing_contig.assembly",
+                    "test_filter_assembly_criteria.assembly",
+                    "test_gaps.assembly",
+                    "test_filter_assembly_gaps.assembly",
+                    "test_exclude.bed"]
         for outfile in outfiles:
             outfile = self.output_dir + outfile
             if os.path.exists(outfile):
@@ -83,6 +87,48 @@ class JuiceboxPurgerTestCase(unittest.TestCase):
         with self.assertRaises(ValueError):
             filter_assembly(exclude, self.input_assembly, outfile, logging="silent")
 
+    def test_filter_assembly_by_regex_and_length(self):
+        outfile = self.output_dir + "test_filter_assembly_criteria.assembly"
+        # contigs 1 and 5 by regex; contigs 2, 3 and 8 (lengths 1, 1, 16) by min_length
+        summary = filter_assembly(set([]), self.input_assembly, outfile, exclude_regex=["_1_len", "^contig_5_"],
+                                  min_length=17, logging="silent")
+        self.assertEqual(summary.counts["regex"], 2)
+        self.assertEqual(summary.counts["min_length"], 3)
+        self.assertEqual(summary.purged, 5)
+        self.assertEqual(summary.kept, 4)
+
+        summary = filter_assembly(set(["contig_8_len_16"]), self.input_assembly, outfile,
+                                  exclude_regex=["_1_len"], max_length=26, min_length=25, logging="silent")
+        self.assertEqual(summary.counts, {"name": 1, "regex": 1, "min_length": 4, "max_length": 2})
+        self.assertEqual(summary.purged, 6)
+
+    def test_filter_assembly_by_length_matches_names(self):
+        outfile = self.output_dir + "test_filter_assembly_criteria.assembly"
+        expected_output = self.expected_output_dir + "test_filter_assembly_minus_three.assembly"
+        filter_assembly(set(["contig_5_len_25"]), self.input_assembly, outfile, exclude_regex=["^contig_1_"],
+                        min_length=16, max_length=16, logging="silent")
+        with open(outfile) as f:
+            self.assertEqual(f.read(), ">contig_8_len_16 1 16\n1\n")
+        filter_assembly(set(["contig_5_len_25", "contig_8_len_16"]), self.input_assembly, outfile,
+                        exclude_regex=["^contig_1_"], logging="silent")
+        self.assertTrue(filecmp.cmp(outfile, expected_output))
+
+    def test_filter_assembly_cleans_up_gaps(self):
+        assembly = self.output_dir + "test_gaps.assembly"
+        with open(assembly, "w") as f:
+            f.write(">a 1 10\n>b 2 10\n>c 3 10\n>d 4 10\n>hic_gap_1 5 100\n"
+                    "1 5 2 5 3\n2 5 5 -3\n5 4 5\n5\n")
+        outfile = self.output_dir + "test_filter_assembly_gaps.assembly"
+        filter_assembly(set(["b", "d"]), assembly, outfile, logging="silent")
+        with open(outfile) as f:
+            self.assertEqual(f.read(), ">a 1 10\n>c 2 10\n>hic_gap_1 3 100\n1 3 2\n-2\n")
+
+    def test_get_exclude_from_bed(self):
+        bed = self.output_dir + "test_exclude.bed"
+        with open(bed, "w") as f:
+            f.write("track name=contaminants\n# comment\ncontig_1_len_29\t0\t29\n\ncontig_5_len_25\t0\t25\n")
+        self.assertEqual(get_exclude(None, bed), set(["contig_1_len_29", "contig_5_len_25"]))
+
     def test_get_exclude_from_list(self):
         exclude_list = ["1", "2", "3"]
         expected_exclude = set(["1", "2", "3"])
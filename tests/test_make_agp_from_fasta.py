@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+tests/test_make_agp_from_fasta.py
+
+This file contains unit tests for functions of the makeAgpFromFasta.py script.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+
+import gzip
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from juicebox_scripts.makeAgpFromFasta import countContigLengths, getContigLengths, main
+from juicebox_scripts.fasta_utils import read_fai
+
+class MakeAgpFromFastaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_file_dir = os.path.dirname(__file__) + '/collateral/test_inputs/'
+        self.tmp_dir = tempfile.mkdtemp()
+        self.test_fasta = os.path.join(self.tmp_dir, 'test.fasta')
+        shutil.copy(self.test_file_dir + 'test.fasta', self.test_fasta)
+        self.expected_lengths = [('contig_1_len_29', 29), ('contig_2_len_1', 1), ('contig_3_len_1', 1),
+                                 ('contig_4_len_20', 20), ('contig_5_len_25', 25), ('contig_6_len_26', 26),
+                                 ('contig_7_len_25', 25), ('contig_8_len_16', 16), ('contig_9_len_64', 64)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_count_contig_lengths_block_sizes(self):
+        with open(self.test_fasta, 'rb') as f:
+            contents = f.read()
+        for block_size in (1, 2, 3, 7, 16, 17, 1 << 20):
+            lengths = list(countContigLengths(io.BytesIO(contents), block_size=block_size))
+            self.assertEqual(lengths, self.expected_lengths)
+
+    def test_count_contig_lengths_crlf_and_descriptions(self):
+        contents = b'>a some description\r\nACGT\r\nAC\r\n>b\r\n>c\nNN\n'
+        for block_size in (1, 5, 100):
+            lengths = list(countContigLengths(io.BytesIO(contents), block_size=block_size))
+            self.assertEqual(lengths, [('a', 6), ('b', 0), ('c', 2)])
+
+    def test_write_and_reuse_fai(self):
+        self.assertEqual(getContigLengths(self.test_fasta, write_index=True), self.expected_lengths)
+        self.assertEqual([(entry.name, entry.length) for entry in read_fai(self.test_fasta + '.fai')],
+                         self.expected_lengths)
+        self.assertEqual(getContigLengths(self.test_fasta), self.expected_lengths)
+
+    def test_main_multiple_gzip_fastas(self):
+        gzipped = os.path.join(self.tmp_dir, 'test2.fasta.gz')
+        with open(self.test_fasta, 'rb') as f, gzip.open(gzipped, 'wb') as out:
+            out.write(f.read().replace(b'>contig', b'>other'))
+        agp = os.path.join(self.tmp_dir, 'out.agp')
+        argv = sys.argv
+        sys.argv = ['makeAgpFromFasta.py', self.test_fasta, gzipped, agp]
+        try:
+            main()
+        finally:
+            sys.argv = argv
+        with open(agp) as f:
+            lines = f.readlines()
+        self.assertEqual(lines[0], '##agp-version 2.1\n')
+        self.assertEqual(len(lines), 1 + 2 * len(self.expected_lengths))
+        self.assertEqual(lines[1], 'contig_1_len_29\t0\t29\t1\tW\tcontig_1_len_29\t1\t29\t+\n')
+        self.assertEqual(lines[-1], 'other_9_len_64\t0\t64\t1\tW\tother_9_len_64\t1\t64\t+\n')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+tests/test_metrics.py
+
+This file contains unit tests for the stage instrumentation in
+metrics.py.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from juicebox_scripts.juicebox_assembly_converter import JuiceboxConverter
+from juicebox_scripts import metrics as metrics_module
+from juicebox_scripts.metrics import Metrics, StageMetrics, measure_stage
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_file_dir = os.path.dirname(__file__) + '/collateral/test_inputs/'
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_nested_stages_count_once(self):
+        metrics = Metrics()
+        with metrics.stage('outer'):
+            with measure_stage(metrics, 'inner'):
+                pass
+        self.assertEqual([stage.stage for stage in metrics.stages], ['outer'])
+        self.assertGreaterEqual(metrics.stages[0].wall_seconds, 0)
+        with measure_stage(None, 'unmeasured'):
+            pass
+
+    def test_process_and_write_stages(self):
+        metrics = Metrics()
+        processed = JuiceboxConverter().process(self.test_file_dir + 'test.fasta',
+                                                self.test_file_dir + 'test_breaks.assembly', metrics=metrics)
+        processed.write_fasta(os.path.join(self.tmp_dir, 'out.fasta'))
+        processed.write_bed(os.path.join(self.tmp_dir, 'out.bed'))
+        processed.write_outputs(agp=os.path.join(self.tmp_dir, 'out.agp'))
+        self.assertEqual([stage.stage for stage in metrics.stages],
+                         ['read_assembly', 'read_fasta', 'add_breaks', 'build_scaffold_table', 'write_fasta',
+                          'write_bed', 'write_outputs'])
+
+    def test_peak_rss_is_per_stage(self):
+        if not metrics_module._reset_peak_rss():
+            self.skipTest('resetting the peak resident memory is not supported')
+        metrics = Metrics()
+        with metrics.stage('allocate'):
+            buffer = bytearray(64 << 20)
+        del buffer
+        with metrics.stage('idle'):
+            pass
+        allocate, idle = metrics.stages
+        self.assertGreaterEqual(allocate.peak_rss_bytes - idle.peak_rss_bytes, 32 << 20)
+
+    def test_peak_rss_without_reset(self):
+        clear_refs = metrics_module._PROC_CLEAR_REFS
+        metrics_module._PROC_CLEAR_REFS = os.path.join(self.tmp_dir, 'missing_dir', 'clear_refs')
+        try:
+            metrics = Metrics()
+            buffer = bytearray(64 << 20)
+            del buffer
+            with metrics.stage('idle'):
+                pass
+        finally:
+            metrics_module._PROC_CLEAR_REFS = clear_refs
+        # the stage did not raise the process's high-water mark, so its
+        # own peak is unknown
+        self.assertIsNone(metrics.stages[0].peak_rss_bytes)
+
+    def test_write(self):
+        metrics = Metrics()
+        metrics.stages.append(StageMetrics('read_fasta', 1.5, 1.0, 1024, 10, None))
+        path = os.path.join(self.tmp_dir, 'metrics.json')
+        metrics.write(path)
+        with open(path) as f:
+            self.assertEqual(json.load(f)['stages'][0]['peak_rss_bytes'], 1024)
+        path = os.path.join(self.tmp_dir, 'metrics.tsv')
+        metrics.write(path)
+        with open(path) as f:
+            self.assertEqual(f.read(), 'stage\twall_seconds\tcpu_seconds\tpeak_rss_bytes\tread_bytes\twrite_bytes\n'
+                                       'read_fasta\t1.5\t1.0\t1024\t10\t\n')
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+tests/test_progress.py
+
+This file contains unit tests for the progress reporting in progress.py.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+
+import unittest
+
+from juicebox_scripts.progress import Progress, start_progress, _format_amount, _format_seconds
+
+class _Stream(object):
+    '''Collects what is written to it, as native str on Python 2 and 3'''
+    def __init__(self, tty=True):
+        self.written = list()
+        self.tty = tty
+
+    def write(self, text):
+        self.written.append(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self.tty
+
+    def getvalue(self):
+        return ''.join(self.written)
+
+class ProgressTestCase(unittest.TestCase):
+    def test_disabled(self):
+        self.assertIsNone(start_progress('Reading', False, stream=_Stream()))
+        self.assertIsNone(start_progress('Reading', True, stream=_Stream(tty=False)))
+        self.assertIsInstance(start_progress('Reading', True, stream=_Stream()), Progress)
+
+    def test_rate_limited(self):
+        stream = _Stream()
+        progress = Progress('Reading', total=4000, stream=stream, interval=3600)
+        for _ in range(3):
+            progress.update(1000)
+        self.assertEqual(stream.getvalue(), '')
+        progress.update(1000)
+        progress.finish()
+        self.assertTrue(stream.getvalue().startswith('\rReading: 4.0 KB of 4.0 KB (100%), '))
+        self.assertTrue(stream.getvalue().endswith(' elapsed\n'))
+
+    def test_redraws(self):
+        stream = _Stream()
+        progress = Progress('Checking', total=10, unit='contigs', stream=stream, interval=0)
+        progress.update(5)
+        self.assertIn('Checking: 5 contigs of 10 contigs (50%)', stream.getvalue())
+        self.assertIn('ETA', stream.getvalue())
+
+    def test_format(self):
+        self.assertEqual(_format_amount(999, 'B'), '999 B')
+        self.assertEqual(_format_amount(1500000, 'B'), '1.5 MB')
+        self.assertEqual(_format_amount(12345, 'contigs'), '12,345 contigs')
+        self.assertEqual(_format_seconds(3725), '1:02:05')
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+'''
+Phase Genomics
+
+tests/test_scaffold_layout.py
+
+This file contains unit tests for the columnar scaffold layout in
+scaffold_layout.py.
+
+Copyright 2018, Phase Genomics Inc. All rights reserved.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see https://www.gnu.org/licenses/agpl-3.0.en.html
+'''
+
+import os
+import unittest
+
+from juicebox_scripts.juicebox_assembly_converter import JuiceboxConverter
+from juicebox_scripts.scaffold_layout import ScaffoldLayout
+
+class ScaffoldLayoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_file_dir = os.path.dirname(__file__) + '/collateral/test_inputs/'
+        self.scaffolds = [[('a', '10', '+', False), ('b', '5', '-', False)],
+                          [('c', '7', '+', False)]]
+
+    def test_round_trip(self):
+        layout = ScaffoldLayout.from_scaffolds(self.scaffolds)
+        self.assertEqual(len(layout), 2)
+        self.assertEqual(list(layout), self.scaffolds)
+        self.assertEqual(layout[-1], self.scaffolds[-1])
+        self.assertIs(ScaffoldLayout.from_scaffolds(layout), layout)
+
+    def test_columns(self):
+        layout = ScaffoldLayout.from_scaffolds(self.scaffolds)
+        self.assertEqual(list(layout.lengths), [10, 5, 7])
+        self.assertEqual(list(layout.reverse), [0, 1, 0])
+        self.assertEqual(list(layout.scaffold_offsets), [0, 2, 3])
+        self.assertEqual(layout.contig_count(0), 2)
+        self.assertEqual([layout.name(placement) for placement in layout.placements(0)], ['a', 'b'])
+
+    def test_compute_positions(self):
+        layout = ScaffoldLayout.from_scaffolds(self.scaffolds)
+        layout.compute_positions(100)
+        self.assertEqual(list(layout.positions), [0, 110, 0])
+        self.assertEqual(list(layout.scaffold_lengths), [115, 7])
+
+    def test_rename_and_sort(self):
+        layout = ScaffoldLayout.from_scaffolds([[('b', '5', '+', True)], [('a', '10', '+', True)]])
+        layout.rename({'b': 'z'})
+        self.assertEqual([scaffold[0][0] for scaffold in layout], ['z', 'a'])
+        layout.sort_by_name()
+        self.assertEqual(list(layout), [[('a', '10', '+', True)], [('z', '5', '+', True)]])
+
+    def test_read_assembly(self):
+        _, layout = JuiceboxConverter()._read_assembly(self.test_file_dir + 'test_scaffolds.assembly')
+        self.assertIsInstance(layout, ScaffoldLayout)
+        self.assertEqual(len(layout.names), len(layout.lengths))
+        self.assertEqual(layout.scaffold_offsets[-1], len(layout.lengths))